@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+数据库层规模基准测试
+
+用 synthetic_data 生成的合成房源（含爬虫记录、失败记录）把数据库逐级扩大到各个规模，
+每个规模下通过 PropertyGuruPipeline 的方法计时（与正式运行的代码路径相同，含打开连接）：
+- get_incomplete_records / get_expired_records / get_failed_records(due_only=True)
+- check_record_exists（一半命中一半不命中，按次计）
+- insert_record（新房源，按条计）、insert_listings（20 条一页，新房源 / 已有房源 force_update，按页计）
+- export_csv（全表导出 CSV + 统计 JSON，导出文件随后删除；--no-export 跳过）
+
+输出每个规模的耗时表，以及每项耗时随房源数增长的斜率（对数坐标：0 表示与规模无关，1 表示线性增长）。
+--output 保存结果（JSON），--baseline 与之前保存的结果对比，任一项超过基线 (1 + tolerance) 倍时返回 1，
+可以在改动数据库层之后、上线之前发现性能回退。
+
+生成经过兼容视图的触发器（字典编码、全文索引）写入，约每秒 2 千条：100 万条约 8 分钟、1000 万条约 1.5 小时，
+1000 万条时导出需要数 GB 内存。--db-dir 指定目录时保留数据库，再次运行会在已有数据上继续扩大，不再重新生成。
+
+示例：
+    python bench_db_scale.py                                    # 1 万 / 10 万 / 100 万
+    python bench_db_scale.py --scales 1000000,3000000,10000000 --no-export --db-dir /tmp/scale
+    python bench_db_scale.py --output baseline.json
+    python bench_db_scale.py --baseline baseline.json --tolerance 0.3
+"""
+
+import argparse
+import glob
+import json
+import math
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+from models import AgentInfo, Listing
+from propertyguru_pipeline import PropertyGuruPipeline
+from synthetic_data import SyntheticListings, populate
+
+# 计时用的新房源从这个序号开始生成，不与规模内的房源重复
+PROBE_START = 10 ** 9
+
+
+def best_time(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+class ScaleBench:
+    """在一个数据库上逐级扩大规模并计时"""
+
+    def __init__(self, workdir, seed, repeat, sample, export):
+        self.pipeline = PropertyGuruPipeline(config={
+            'data_dir': workdir,
+            'logs_dir': os.path.join(workdir, 'logs'),
+            'log_console_level': 'WARNING',
+            'response_cache': False,
+        })
+        self.generator = SyntheticListings(seed=seed)
+        self.repeat = repeat
+        self.sample = sample
+        self.export = export
+        self.rng = random.Random(seed)
+        # 保留的数据库上再次运行时，跳过之前计时写入过的序号
+        self.probe = PROBE_START + self._count("CAST(ID AS INTEGER) >= ?", 20000000 + PROBE_START)
+
+    def _count(self, where='1', *params):
+        conn = sqlite3.connect(self.pipeline.db_path)
+        try:
+            return conn.execute(f"SELECT COUNT(*) FROM listings WHERE {where}", params).fetchone()[0]
+        finally:
+            conn.close()
+
+    def listing_count(self):
+        return self._count()
+
+    def grow(self, scale):
+        """扩大到 scale 条（已有的合成房源序号为 0 .. 已有数 - 1，计时写入的房源不计入），返回生成耗时"""
+        start = self._count("CAST(ID AS INTEGER) < ?", 20000000 + PROBE_START)
+        conn = sqlite3.connect(self.pipeline.db_path)
+        try:
+            began = time.perf_counter()
+            if scale > start:
+                populate(conn, start, scale - start, self.generator)
+            return time.perf_counter() - began
+        finally:
+            conn.close()
+
+    def _probe_rows(self, count):
+        rows = [self.generator.listing_row(index)[0] for index in range(self.probe, self.probe + count)]
+        self.probe += count
+        return rows
+
+    def run(self, scale):
+        """返回 [(名称, 毫秒), ...]"""
+        pipeline = self.pipeline
+        generator = self.generator
+        hits = [generator.url_path(self.rng.randrange(scale)) for _ in range(self.sample // 2)]
+        misses = [generator.url_path(index) for index in range(self.probe, self.probe + self.sample - len(hits))]
+        lookups = hits + misses
+        self.probe += len(misses)
+        existing = [generator.listing_row(self.rng.randrange(scale))[0] for _ in range(self.sample)]
+        pages = max(1, self.sample // 20)
+
+        results = [
+            ('get_incomplete_records', best_time(pipeline.get_incomplete_records, self.repeat)),
+            ('get_expired_records', best_time(pipeline.get_expired_records, self.repeat)),
+            ('get_failed_records(due_only)', best_time(lambda: pipeline.get_failed_records(due_only=True),
+                                                       self.repeat)),
+            ('check_record_exists / 次', best_time(
+                lambda: [pipeline.check_record_exists(url_path) for url_path in lookups], self.repeat) / len(lookups)),
+        ]
+
+        # 写入只执行一次（重复执行时记录已存在，测的是另一条路径）
+        new_rows = self._probe_rows(self.sample)
+        results.append(('insert_record 新房源 / 条', best_time(
+            lambda: [pipeline.insert_record(Listing(*row)) for row in new_rows], 1) / len(new_rows)))
+        agents = [AgentInfo(f'CEA R{i:06d}B', '+65 8000 0000', '4.8', row[Listing.FIELDS.index('url_path')])
+                  for i, row in enumerate(existing)]
+        results.append(('insert_record 代理信息 / 条', best_time(
+            lambda: [pipeline.insert_record(agent, update_agent_only=True) for agent in agents], 1) / len(agents)))
+        new_rows = self._probe_rows(pages * 20)
+        results.append(('insert_listings 新房源 / 页', best_time(
+            lambda: [pipeline.insert_listings(new_rows[i:i + 20]) for i in range(0, len(new_rows), 20)], 1) / pages))
+        results.append(('insert_listings force_update / 页', best_time(
+            lambda: [pipeline.insert_listings(existing[i:i + 20], force_update=True)
+                     for i in range(0, pages * 20, 20)], 1) / pages))
+
+        if self.export:
+            def export():
+                pipeline.export_csv()
+                for path in glob.glob(os.path.join(pipeline.export_dir, 'propertyguru_*')):
+                    os.remove(path)
+            results.append(('export_csv', best_time(export, 1)))
+        return [(name, seconds * 1000) for name, seconds in results]
+
+
+def scaling_slopes(report):
+    """每项耗时对房源数的对数斜率（最小规模与最大规模之间）"""
+    scales = sorted(report, key=int)
+    if len(scales) < 2:
+        return {}
+    low, high = report[scales[0]], report[scales[-1]]
+    ratio = math.log(high['listings'] / low['listings'])
+    return {name: math.log(high['ms'][name] / low['ms'][name]) / ratio
+            for name in high['ms'] if low['ms'].get(name, 0) > 0 and high['ms'][name] > 0}
+
+
+def compare(report, baseline, tolerance):
+    """返回超过基线的项 [(规模, 名称, 基线毫秒, 本次毫秒), ...]"""
+    regressions = []
+    for scale, result in report.items():
+        old = baseline.get('scales', {}).get(scale)
+        if not old:
+            continue
+        for name, ms in result['ms'].items():
+            base = old['ms'].get(name)
+            if base and ms > base * (1 + tolerance):
+                regressions.append((scale, name, base, ms))
+    return regressions
+
+
+def print_report(report):
+    scales = sorted(report, key=int)
+    names = list(report[scales[-1]]['ms'])
+    print(f"\n耗时（毫秒）")
+    print(f"  {'':<36}" + ''.join(f"{int(scale):>12,}" for scale in scales))
+    for name in names:
+        print(f"  {name:<36}" + ''.join(f"{report[scale]['ms'].get(name, float('nan')):12.2f}" for scale in scales))
+    print(f"  {'数据库大小 (MB)':<36}" + ''.join(f"{report[scale]['db_mb']:12.1f}" for scale in scales))
+    print(f"  {'生成耗时 (s)':<36}" + ''.join(f"{report[scale]['populate_s']:12.1f}" for scale in scales))
+
+    slopes = scaling_slopes(report)
+    if slopes:
+        print(f"\n随房源数增长的斜率（{int(scales[0]):,} → {int(scales[-1]):,}，0 = 与规模无关，1 = 线性）")
+        for name, slope in slopes.items():
+            print(f"  {name:<36} {slope:6.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="数据库层规模基准测试")
+    parser.add_argument('--scales', default='10000,100000,1000000', help="房源数，逗号分隔，从小到大逐级扩大")
+    parser.add_argument('--seed', type=int, default=0, help="合成数据的随机种子")
+    parser.add_argument('--repeat', type=int, default=3, help="只读查询的重复次数（取最小值）")
+    parser.add_argument('--sample', type=int, default=200, help="查找 / 写入测试的记录数")
+    parser.add_argument('--no-export', action='store_true', help="跳过 export_csv")
+    parser.add_argument('--db-dir', help="数据库所在目录（保留数据库，再次运行时继续使用）；默认使用临时目录")
+    parser.add_argument('--output', help="结果保存为 JSON")
+    parser.add_argument('--baseline', help="与之前 --output 保存的结果对比")
+    parser.add_argument('--tolerance', type=float, default=0.5, help="超过基线 (1 + tolerance) 倍视为回退")
+    args = parser.parse_args()
+
+    scales = sorted(int(scale) for scale in args.scales.split(','))
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    report = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        workdir = args.db_dir or tmpdir
+        os.makedirs(workdir, exist_ok=True)
+        bench = ScaleBench(workdir, args.seed, args.repeat, args.sample, not args.no_export)
+        for scale in scales:
+            populate_seconds = bench.grow(scale)
+            print(f"{scale:,} 条：生成 {populate_seconds:.1f}s，开始计时……")
+            report[str(scale)] = {
+                'listings': bench.listing_count(),
+                'db_mb': os.path.getsize(bench.pipeline.db_path) / 1024 / 1024,
+                'populate_s': populate_seconds,
+                'ms': dict(bench.run(scale)),
+            }
+
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'seed': args.seed, 'sample': args.sample, 'scales': report}, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存: {args.output}")
+
+    if baseline is not None:
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print(f"\n性能回退（超过基线 {1 + args.tolerance:.2f} 倍）")
+            for scale, name, base, ms in regressions:
+                print(f"  {int(scale):>12,}  {name:<36} {base:10.2f} → {ms:10.2f} ms")
+            return 1
+        print(f"\n与基线 {args.baseline} 相比没有超过 {1 + args.tolerance:.2f} 倍的项")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+房源表字典编码的大小 / 查询耗时报告
+
+在数据库的副本上对比两种存储方式（不修改原数据库）：
+- plain:   原来的 propertyguru 普通表（所有列直接保存字符串）
+- encoded: 字典编码（listing_schema：text_values + listings + 兼容视图 propertyguru）
+
+两个副本都只包含房源数据并经过 VACUUM。报告文件大小、各表 / 索引占用的空间（SQLite 编译了 dbstat 时），
+以及 Step 1 / Step 2 / 导出用到的查询和写入在两种存储上的耗时（热缓存，取多次中的最小值；写入在事务中执行后回滚，
+不含提交时的 fsync）。
+
+示例：
+    python bench_db_size.py                                   # data/propertyguru_integrated.db
+    python bench_db_size.py --db backup/propertyguru.db --repeat 5
+"""
+
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import listing_schema
+from models import AgentInfo, Listing, update_params
+
+_TIMESTAMP_COLUMNS = ('created_at', 'updated_at', 'last_seen_at')
+
+# 原来的 propertyguru 表（字典编码之前）
+PLAIN_TABLE_SQL = "CREATE TABLE propertyguru ({})".format(', '.join(
+    'url_path TEXT PRIMARY KEY' if column == 'url_path'
+    else f'{column} TIMESTAMP' if column in _TIMESTAMP_COLUMNS
+    else 'missed_passes INTEGER DEFAULT 0' if column == 'missed_passes'
+    else f'{column} TEXT'
+    for column in listing_schema.COLUMNS
+))
+
+# 与 PropertyGuruPipeline 中对应方法的 SQL 相同
+INCOMPLETE_SQL = '''
+    SELECT url_path FROM propertyguru
+    WHERE COALESCE(CEA, '') IN ('', '无CEA')
+       OR COALESCE(mobile, '') IN ('', '无手机')
+       OR COALESCE(rating, '') IN ('', '无评分')
+'''
+EXPIRED_SQL = '''
+    SELECT url_path, updated_at FROM propertyguru
+    WHERE updated_at < ?
+      AND COALESCE(CEA, '') NOT IN ('', '无CEA')
+      AND COALESCE(mobile, '') NOT IN ('', '无手机')
+      AND COALESCE(rating, '') NOT IN ('', '无评分')
+'''
+LOOKUP_SQL = "SELECT url_path FROM propertyguru WHERE url_path = ?"
+EXPORT_SQL = "SELECT * FROM propertyguru"
+GROUP_SQL = "SELECT buy_rent, property_type, COUNT(*) FROM propertyguru GROUP BY buy_rent, property_type"
+STATS_SQL = "SELECT url_path, buy_rent, property_type, tenure, nearbyText, price_pretty, price_psf FROM propertyguru " \
+            "WHERE url_path IN ({})"
+
+
+def build_copies(source, workdir):
+    """生成 plain / encoded 两个副本，返回 {名称: 路径}"""
+    plain = os.path.join(workdir, 'plain.db')
+    conn = sqlite3.connect(plain)
+    conn.execute(PLAIN_TABLE_SQL)
+    conn.execute("ATTACH DATABASE ? AS source", (source,))
+    columns = ', '.join(listing_schema.COLUMNS)
+    conn.execute(f"INSERT INTO propertyguru ({columns}) SELECT {columns} FROM source.propertyguru")
+    conn.commit()
+    conn.execute("DETACH DATABASE source")
+    conn.execute("VACUUM")
+    conn.close()
+
+    encoded = os.path.join(workdir, 'encoded.db')
+    shutil.copy(plain, encoded)
+    conn = sqlite3.connect(encoded)
+    cursor = conn.cursor()
+    listing_schema.migrate(cursor)
+    for sql in listing_schema.VIEW_SQL:
+        cursor.execute(sql)
+    conn.commit()
+    conn.execute("VACUUM")
+    conn.close()
+    return {'plain': plain, 'encoded': encoded}
+
+
+def object_sizes(path):
+    """{表 / 索引名: 字节数}；SQLite 未编译 dbstat 时返回 None"""
+    conn = sqlite3.connect(path)
+    try:
+        return dict(conn.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name ORDER BY 2 DESC"))
+    except sqlite3.OperationalError:
+        return None
+    finally:
+        conn.close()
+
+
+def best_time(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def build_workload(path, sample_size):
+    """从 plain 副本中抽样：查找用的 url_path、写入用的新房源和代理信息"""
+    conn = sqlite3.connect(path)
+    fields = ', '.join(Listing.FIELDS)
+    rows = conn.execute(f"SELECT {fields} FROM propertyguru ORDER BY random() LIMIT ?", (sample_size,)).fetchall()
+    conn.close()
+    url_index = Listing.FIELDS.index('url_path')
+    return {
+        'url_paths': [row[url_index] for row in rows],
+        'new_rows': [row[:url_index] + (f'{row[url_index]}-bench',) + row[url_index + 1:] for row in rows],
+        'updated_rows': rows,
+        'agents': [AgentInfo(f'CEA R{i:06d}B', '+65 8000 0000', '4.8') for i in range(len(rows))],
+    }
+
+
+def run_queries(path, workload, repeat, cache_kb):
+    """返回 [(名称, 秒), ...]"""
+    conn = sqlite3.connect(path)
+    conn.execute(f"PRAGMA cache_size = -{cache_kb}")
+    cursor = conn.cursor()
+    now = datetime.now()
+    url_paths = workload['url_paths']
+
+    def lookups():
+        for url_path in url_paths:
+            cursor.execute(LOOKUP_SQL, (url_path,)).fetchone()
+
+    def stats_lookup():
+        for i in range(0, len(url_paths), 500):
+            chunk = url_paths[i:i + 500]
+            cursor.execute(STATS_SQL.format(','.join('?' * len(chunk))), chunk).fetchall()
+
+    def rollback_after(func):
+        def run():
+            func()
+            conn.rollback()
+        return run
+
+    cases = [
+        ('Step 2 待处理记录（get_incomplete_records）', lambda: cursor.execute(INCOMPLETE_SQL).fetchall()),
+        ('过期记录（get_expired_records）',
+         lambda: cursor.execute(EXPIRED_SQL, (now - timedelta(days=1),)).fetchall()),
+        (f'按 url_path 查找 ×{len(url_paths)}（check_record_exists）', lookups),
+        (f'读取市场统计旧值 ×{len(url_paths)}（insert_listings）', stats_lookup),
+        ('按租/售、房型计数（GROUP BY）', lambda: cursor.execute(GROUP_SQL).fetchall()),
+        ('全表读取（export_csv 的 SELECT *）', lambda: cursor.execute(EXPORT_SQL).fetchall()),
+        (f'插入新房源 ×{len(url_paths)}（insert_listings）', rollback_after(
+            lambda: cursor.executemany(Listing.INSERT_OR_IGNORE_SQL, workload['new_rows']))),
+        (f'更新已有房源 ×{len(url_paths)}（force_update）', rollback_after(
+            lambda: cursor.executemany(Listing.UPDATE_SQL, [update_params(row, now)
+                                                            for row in workload['updated_rows']]))),
+        (f'更新代理信息 ×{len(url_paths)}（save_agent_results）', rollback_after(
+            lambda: cursor.executemany(AgentInfo.UPDATE_SQL, [agent.update_params(now, url_path) for agent, url_path
+                                                              in zip(workload['agents'], url_paths)]))),
+    ]
+    results = [(name, best_time(func, repeat)) for name, func in cases]
+    conn.close()
+    return results
+
+
+def report(source, copies, workload, repeat, cache_kb):
+    conn = sqlite3.connect(copies['encoded'])
+    count = conn.execute("SELECT COUNT(*) FROM listings").fetchone()[0]
+    distinct = conn.execute("SELECT COUNT(*) FROM text_values").fetchone()[0]
+    conn.close()
+    print(f"数据库: {source}（{os.path.getsize(source) / 1024 / 1024:.1f} MB）")
+    print(f"房源 {count} 条，字典编码 {len(listing_schema.ENCODED_COLUMNS)} 列，共 {distinct} 个不同的值")
+
+    print("\n文件大小（VACUUM 之后，只含房源数据）")
+    sizes = {name: os.path.getsize(path) for name, path in copies.items()}
+    for name, size in sizes.items():
+        print(f"  {name:<8} {size / 1024 / 1024:9.2f} MB  ({size / max(count, 1):.0f} 字节/条)")
+    print(f"  encoded / plain = {sizes['encoded'] / sizes['plain']:.2f}")
+
+    for name, path in copies.items():
+        objects = object_sizes(path)
+        if objects is None:
+            print("\n（SQLite 未编译 dbstat，跳过各表 / 索引的大小）")
+            break
+        print(f"\n{name} 各表 / 索引")
+        for obj, size in objects.items():
+            print(f"  {obj:<32} {size / 1024 / 1024:9.2f} MB")
+
+    print(f"\n查询 / 写入耗时（毫秒，{repeat} 次取最小值，页缓存 {cache_kb / 1024:.0f} MB）")
+    print(f"  {'':<44} {'plain':>10} {'encoded':>10} {'比值':>7}")
+    timings = {name: run_queries(path, workload, repeat, cache_kb) for name, path in copies.items()}
+    for (label, plain), (_, encoded) in zip(timings['plain'], timings['encoded']):
+        print(f"  {label:<44} {plain * 1000:10.1f} {encoded * 1000:10.1f} {encoded / plain:7.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="房源表字典编码的大小 / 查询耗时报告")
+    parser.add_argument('--db', default=os.path.join('data', 'propertyguru_integrated.db'), help="数据库文件")
+    parser.add_argument('--repeat', type=int, default=3, help="每项重复次数")
+    parser.add_argument('--sample', type=int, default=1000, help="查找 / 写入测试使用的记录数")
+    parser.add_argument('--cache-mb', type=int, default=64, help="页缓存大小（与 db_cache_size_kb 对应）")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"{args.db} 不存在")
+        return 1
+    conn = sqlite3.connect(f'file:{args.db}?mode=ro', uri=True)
+    try:
+        count = conn.execute("SELECT COUNT(*) FROM propertyguru").fetchone()[0]
+    except sqlite3.OperationalError as e:
+        print(f"{args.db} 中没有 propertyguru: {e}")
+        return 1
+    finally:
+        conn.close()
+    if not count:
+        print(f"{args.db} 中没有房源数据")
+        return 1
+
+    with tempfile.TemporaryDirectory() as workdir:
+        copies = build_copies(os.path.abspath(args.db), workdir)
+        workload = build_workload(copies['plain'], args.sample)
+        report(args.db, copies, workload, args.repeat, args.cache_mb * 1024)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+列表页 / 详情页解析基准测试
+
+对比两种解析方式在已保存页面（data/html）上的耗时和峰值内存：
+- full:    正则取出 __NEXT_DATA__ 后整体 json.loads，再逐层取子树，每条房源构建 dict
+- subtree: next_data 只解码 listingsData / agentInfoProps 子树，整页房源按列提取为 executemany 的参数行
+
+示例：
+    python bench_parse.py                       # 使用 data/html 下已保存的页面
+    python bench_parse.py --dir data/html --repeat 5
+    python bench_parse.py --synthetic 20        # 没有已保存页面时，生成 20 个模拟列表页
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+import time
+import tracemalloc
+
+import next_data
+from models import Listing, extract_listing_columns, listing_rows
+
+_NEXT_DATA_RE = re.compile('<script id="__NEXT_DATA__" type="application/json".*?>(.*?)</script>', re.S)
+
+
+def parse_list_full(text):
+    data_json = json.loads(_NEXT_DATA_RE.findall(text)[0])
+    listings = data_json.get('props', {}).get('pageProps', {}).get('pageData', {}).get('data', {}).get(
+        'listingsData', [])
+    return [Listing.from_listing_data(item.get('listingData', {}), 'bench').to_dict() for item in listings]
+
+
+def parse_list_subtree(text):
+    parsed = next_data.parse_list_page(text)
+    return listing_rows(extract_listing_columns(parsed['listings'], 'bench'))
+
+
+def parse_detail_full(text):
+    data_json = json.loads(_NEXT_DATA_RE.findall(text)[0])
+    return data_json.get('props', {}).get('pageProps', {}).get('pageData', {}).get('data', {}).get(
+        'contactAgentData', {}).get('contactAgentCard', {}).get("agentInfoProps", {})
+
+
+def parse_detail_subtree(text):
+    return next_data.parse_agent_info_props(text)[0]
+
+
+def synthetic_list_page(index, listings=20, filler=200):
+    """模拟列表页：除 listingsData 外带有大量无关数据（与真实页面类似）"""
+    items = []
+    for i in range(listings):
+        items.append({'listingData': {
+            'id': index * 1000 + i,
+            'url': f'https://www.propertyguru.com.sg/listing/bench-{index}-{i}',
+            'localizedTitle': f'Listing {index}-{i}', 'fullAddress': f'{i} Bench Road',
+            'price': {'pretty': 'S$ 3,500 /mo'}, 'bedrooms': 2, 'bathrooms': 1, 'floorArea': 800,
+            'pricePerArea': {'localeStringValue': '4.38'},
+            'mrt': {'nearbyText': '5 min (400 m) from EW1 Pasir Ris MRT'},
+            'badges': [{'name': 'unit_type', 'text': 'Condo'}, {'name': 'tenure', 'text': '99-year'}],
+            'recency': {'text': '2 hours ago'},
+            'agent': {'id': i, 'name': 'Agent', 'description': 'desc', 'profileUrl': '/agent/a'},
+            'media': [{'url': f'https://cdn.example/{index}/{i}/{k}.jpg', 'w': 800, 'h': 600} for k in range(10)],
+        }})
+    data = {
+        'props': {'pageProps': {
+            'pageData': {'data': {'listingsData': items, 'paginationData': {'totalPages': 100}}},
+            'layout': {'menu': [{'id': k, 'label': f'Menu {k}', 'children': list(range(20))} for k in range(filler)]},
+            'i18n': {f'key_{k}': f'Translated text {k}' for k in range(filler * 10)},
+        }},
+        'buildId': 'bench',
+    }
+    return '<html><body>' + 'x' * 50000 + '<script id="__NEXT_DATA__" type="application/json">' \
+        + json.dumps(data) + '</script></body></html>'
+
+
+def measure(func, texts, repeat):
+    # 耗时
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in texts:
+            func(text)
+    elapsed = (time.perf_counter() - start) / (repeat * len(texts))
+
+    # 单页峰值内存
+    peaks = []
+    for text in texts:
+        tracemalloc.start()
+        result = func(text)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        del result
+    return elapsed, max(peaks), sum(peaks) / len(peaks)
+
+
+def report(name, texts, full_func, subtree_func, repeat):
+    if not texts:
+        print(f"{name}: 没有可用页面")
+        return
+
+    size = sum(len(text) for text in texts) / len(texts)
+    print(f"\n{name}: {len(texts)} 个页面，平均 {size / 1024:.1f} KB")
+    results = {}
+    for label, func in (('full', full_func), ('subtree', subtree_func)):
+        results[label] = measure(func, texts, repeat)
+        elapsed, peak, mean_peak = results[label]
+        print(f"  {label:<8} {elapsed * 1000:8.2f} ms/页 | 峰值内存 {peak / 1024 / 1024:7.2f} MB "
+              f"(平均 {mean_peak / 1024 / 1024:.2f} MB)")
+
+    full, subtree = results['full'], results['subtree']
+    print(f"  耗时 x{full[0] / subtree[0]:.2f}，平均峰值内存 x{full[2] / subtree[2]:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="__NEXT_DATA__ 解析基准测试")
+    parser.add_argument('--dir', default=os.path.join('data', 'html'), help="已保存页面目录")
+    parser.add_argument('--repeat', type=int, default=3, help="耗时测试重复次数")
+    parser.add_argument('--limit', type=int, default=50, help="每类最多使用的页面数")
+    parser.add_argument('--synthetic', type=int, default=0, help="生成的模拟列表页数量")
+    args = parser.parse_args()
+
+    def load(pattern):
+        texts = []
+        for path in sorted(glob.glob(os.path.join(args.dir, pattern)))[:args.limit]:
+            with open(path, encoding='utf-8') as f:
+                text = f.read()
+            if next_data.locate(text):
+                texts.append(text)
+        return texts
+
+    list_pages = load('*_page_*.html')
+    detail_pages = load('detail_*.html')
+    if args.synthetic:
+        list_pages += [synthetic_list_page(i) for i in range(args.synthetic)]
+
+    if not list_pages and not detail_pages:
+        print(f"{args.dir} 中没有已保存的页面，可使用 --synthetic 生成模拟页面")
+        return 1
+
+    report("列表页", list_pages, parse_list_full, parse_list_subtree, args.repeat)
+    report("详情页", detail_pages, parse_detail_full, parse_detail_subtree, args.repeat)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+启动耗时基准测试
+
+每一项都在新的 Python 进程中运行（与 cron 启动短任务的情况一致），取多次运行的中位数：
+- import:       import propertyguru_pipeline
+- init (首次):  新数据库上创建 PropertyGuruPipeline（执行建表）
+- init (再次):  已有数据库上创建 PropertyGuruPipeline（PRAGMA user_version 命中，跳过建表）
+- cli --help:   python cli.py --help
+- eager deps:   import pandas + requests（对照：模块顶层导入这些依赖时的额外开销）
+
+示例：
+    python bench_startup.py
+    python bench_startup.py --runs 10
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def run_timed(code, cwd, runs):
+    timings = []
+    env = dict(os.environ, PYTHONPATH=REPO_DIR + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], cwd=cwd, env=env, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="启动耗时基准测试")
+    parser.add_argument('--runs', type=int, default=5, help="每项运行次数")
+    args = parser.parse_args()
+
+    init_code = "from propertyguru_pipeline import PropertyGuruPipeline; PropertyGuruPipeline()"
+    cli_code = f"import sys; sys.argv = ['cli.py', '--help']; sys.path.insert(0, {REPO_DIR!r}); " \
+               f"import runpy\ntry:\n    runpy.run_path({os.path.join(REPO_DIR, 'cli.py')!r}, run_name='__main__')\n" \
+               f"except SystemExit:\n    pass"
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        results.append(('python 空进程', run_timed("pass", workdir, args.runs)))
+        results.append(('import', run_timed("import propertyguru_pipeline", workdir, args.runs)))
+
+        # 每次在新目录中创建，保证都会执行建表
+        cold = []
+        for i in range(args.runs):
+            cold_dir = os.path.join(workdir, f'cold_{i}')
+            os.makedirs(cold_dir)
+            cold.append(run_timed(init_code, cold_dir, 1))
+        results.append(('init (首次，建表)', statistics.median(cold)))
+
+        warm_dir = os.path.join(workdir, 'warm')
+        os.makedirs(warm_dir)
+        run_timed(init_code, warm_dir, 1)
+        results.append(('init (再次，跳过建表)', run_timed(init_code, warm_dir, args.runs)))
+
+        results.append(('cli --help', run_timed(cli_code, workdir, args.runs)))
+        results.append(('eager deps (pandas+requests)', run_timed("import pandas, requests", workdir, args.runs)))
+
+    print(f"\n启动耗时（{args.runs} 次中位数）")
+    for name, seconds in results:
+        print(f"  {name:<30} {seconds * 1000:8.1f} ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+统一命令行入口
+
+示例：
+    python cli.py run                                 # 完整流程（Step 1 + Step 2 + 导出）
+    python cli.py run --overlap                       # Step 1 与 Step 2 同时运行
+    python cli.py step1 --mode smart_incremental
+    python cli.py step2 --mode incremental --max-requests 500
+    python cli.py step2 --mode expired --processes 4 --light
+    python cli.py step2 --hedge                       # 慢请求通过另一个端点再发一次（对冲）
+    python cli.py retry
+    python cli.py retry --all --requeue-dead            # 死信记录放回失败列表，忽略重试时间全部重试
+    python cli.py export
+    python cli.py daemon                              # 常驻服务模式（见 daemon.py）
+    python cli.py search orchard condo --limit 10     # 全文搜索标题 / 地址 / 地铁信息
+    python cli.py search --rebuild                    # 重建全文索引
+    python cli.py stats --by mrt --property-type Condominium   # 市场统计（读汇总表，不扫描全表）
+    python cli.py --config prod.ini --set request_delay=0.2 --set http_pool_size=20 step2
+    python cli.py --refresh step1                     # 不读响应缓存，所有页面重新请求
+
+配置来源见 config.load_config：Config 默认值 < INI < 环境变量 PROPERTYGURU_* < 命令行。
+只在执行子命令时才导入 Pipeline；requests / pandas 分别在发请求和导出时才导入，
+重试、导出等短任务启动更快。
+"""
+
+import argparse
+import sys
+import time
+
+
+def build_overrides(args):
+    """命令行中的配置项（--set 及各选项）"""
+    from config import parse_set_options
+
+    overrides = parse_set_options(args.set)
+    overrides.update({
+        'max_workers': args.workers,
+        'apikey': args.apikey,
+        'proxy': args.proxy,
+        'log_level': args.log_level,
+        'response_cache': False if args.no_cache else None,
+        'response_cache_bypass': True if args.refresh else None,
+        'daemon_status_port': getattr(args, 'status_port', None),
+    })
+    return overrides
+
+
+def build_pipeline(args):
+    from config import load_config
+    from propertyguru_pipeline import PropertyGuruPipeline
+
+    config = load_config(ini_path=args.config, overrides=build_overrides(args))
+    return PropertyGuruPipeline(config=config)
+
+
+def cmd_run(pipeline, args):
+    pipeline.run_pipeline(
+        step1_mode=args.step1_mode,
+        step2_mode=args.step2_mode,
+        step2_expiry_days=args.expiry_days,
+        skip_step1=args.skip_step1,
+        skip_step2=args.skip_step2,
+        step2_processes=args.processes,
+        overlap=True if args.overlap else None,
+    )
+
+
+def cmd_step1(pipeline, args):
+    pipeline.step1_crawl_listings(mode=args.mode)
+
+
+def cmd_step2(pipeline, args):
+    if args.light:
+        pipeline.DETAIL_FETCH_MODE = 'light'
+    if args.max_requests is not None:
+        pipeline.STEP2_MAX_REQUESTS = args.max_requests
+    if args.hedge:
+        pipeline.HEDGE_REQUESTS = True
+    pipeline.step2_crawl_agent_info(mode=args.mode, expiry_days=args.expiry_days, processes=args.processes)
+
+
+def cmd_retry(pipeline, args):
+    if args.requeue_dead:
+        pipeline.requeue_dead_letters()
+    pipeline.retry_failed_records(include_pending=args.all)
+
+
+def cmd_export(pipeline, args):
+    return 0 if pipeline.export_csv() else 1
+
+
+def cmd_search(pipeline, args):
+    if args.rebuild:
+        return 0 if pipeline.rebuild_search_index() is not None else 1
+    if not args.terms:
+        print("❌ 请输入搜索关键词")
+        return 2
+    rows = pipeline.search_listings(' '.join(args.terms), limit=args.limit, buy_rent=args.category,
+                                    prefix=args.prefix, raw=args.raw)
+    for row in rows:
+        print(f"{row['url_path']}\t{row['localizedTitle']}\t{row['fullAddress']}\t{row['price_pretty']}")
+    print(f"共 {len(rows)} 条")
+    return 0
+
+
+def cmd_stats(pipeline, args):
+    if args.rebuild:
+        return 0 if pipeline.rebuild_market_stats() is not None else 1
+    filters = {'property_type': args.property_type, 'tenure': args.tenure, 'mrt': args.mrt}
+    filters = {name: value for name, value in filters.items() if value}
+    if args.by:
+        rows = pipeline.list_market_stats(args.category, by=args.by, limit=args.limit, **filters)
+    else:
+        stats = pipeline.get_market_stats(args.category, **filters)
+        rows = [stats] if stats else []
+    print("\t".join(['property_type', 'tenure', 'mrt', 'count', 'median_price', 'median_psf', 'mean_psf']))
+    for row in rows:
+        print("\t".join(str(value) for value in (
+            row['property_type'], row['tenure'], row['mrt'], row['listing_count'],
+            row['price_median'], row['psf_median'], row['psf_mean'])))
+    print(f"共 {len(rows)} 组")
+    return 0
+
+
+def cmd_compact(pipeline, args):
+    return 0 if pipeline.compact_database() else 1
+
+
+def cmd_daemon(pipeline, args):
+    from daemon import PipelineDaemon
+
+    daemon = PipelineDaemon(pipeline, ini_path=args.config, overrides=build_overrides(args))
+    daemon.install_signal_handlers()
+    daemon.run()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="PropertyGuru Pipeline")
+    parser.add_argument('--config', default='config.ini', help="INI 配置文件（不存在时忽略）")
+    parser.add_argument('--set', action='append', metavar='KEY=VALUE',
+                        help="覆盖任意配置项，可重复，如 --set request_delay=0.2 --set http_pool_size=20")
+    parser.add_argument('--workers', type=int, default=None, help="线程数")
+    parser.add_argument('--apikey', default=None, help="CloudBypass API密钥")
+    parser.add_argument('--proxy', default=None, help="代理地址")
+    parser.add_argument('--log-level', default=None, help="日志文件级别")
+    parser.add_argument('--no-cache', action='store_true', help="不使用响应缓存")
+    parser.add_argument('--refresh', action='store_true', help="不读响应缓存（仍写入），所有页面重新请求")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run = subparsers.add_parser('run', help="完整流程")
+    run.add_argument('--step1-mode', choices=['smart_incremental', 'full'], default='smart_incremental')
+    run.add_argument('--step2-mode', choices=['incremental', 'expired'], default='incremental')
+    run.add_argument('--expiry-days', type=int, default=None, help="过期天数（仅 expired 模式）")
+    run.add_argument('--processes', type=int, default=None, help="Step 2 工作进程数")
+    run.add_argument('--skip-step1', action='store_true')
+    run.add_argument('--skip-step2', action='store_true')
+    run.add_argument('--overlap', action='store_true', help="流水线模式：Step 1 与 Step 2 同时运行")
+    run.set_defaults(func=cmd_run)
+
+    step1 = subparsers.add_parser('step1', help="只爬取列表页")
+    step1.add_argument('--mode', choices=['smart_incremental', 'full'], default='smart_incremental')
+    step1.set_defaults(func=cmd_step1)
+
+    step2 = subparsers.add_parser('step2', help="只爬取代理信息")
+    step2.add_argument('--mode', choices=['incremental', 'expired'], default='incremental')
+    step2.add_argument('--expiry-days', type=int, default=None, help="过期天数（仅 expired 模式）")
+    step2.add_argument('--processes', type=int, default=None, help="工作进程数")
+    step2.add_argument('--max-requests', type=int, default=None, help="本次最多请求的详情页数")
+    step2.add_argument('--light', action='store_true', help="使用轻量详情请求（DETAIL_FETCH_MODE='light'）")
+    step2.add_argument('--hedge', action='store_true', help="对冲请求：慢请求通过另一个端点再发一次")
+    step2.set_defaults(func=cmd_step2)
+
+    retry = subparsers.add_parser('retry', help="重试失败记录")
+    retry.add_argument('--all', action='store_true', help="忽略下次重试时间，重试全部失败记录")
+    retry.add_argument('--requeue-dead', action='store_true', help="先把死信记录放回失败列表")
+    retry.set_defaults(func=cmd_retry)
+
+    export = subparsers.add_parser('export', help="导出 CSV")
+    export.set_defaults(func=cmd_export)
+
+    search = subparsers.add_parser('search', help="全文搜索房源标题 / 地址 / 地铁信息")
+    search.add_argument('terms', nargs='*', help="关键词（全部匹配）")
+    search.add_argument('--limit', type=int, default=20)
+    search.add_argument('--category', choices=['property-for-rent', 'property-for-sale'], default=None)
+    search.add_argument('--prefix', action='store_true', help="最后一个词按前缀匹配")
+    search.add_argument('--raw', action='store_true', help="关键词直接作为 FTS5 查询语法（如 orchard OR novena）")
+    search.add_argument('--rebuild', action='store_true', help="重建全文索引")
+    search.set_defaults(func=cmd_search)
+
+    stats = subparsers.add_parser('stats', help="市场统计：按房型 / 产权 / 地铁站的房源数、价格和尺价中位数")
+    stats.add_argument('--category', choices=['property-for-rent', 'property-for-sale'], default='property-for-sale')
+    stats.add_argument('--by', choices=['property_type', 'tenure', 'mrt'], default=None,
+                       help="按该维度列出各取值（不指定时只输出一组）")
+    stats.add_argument('--property-type', default=None)
+    stats.add_argument('--tenure', default=None)
+    stats.add_argument('--mrt', default=None, help="车站名，如 'Pasir Ris MRT'")
+    stats.add_argument('--limit', type=int, default=None)
+    stats.add_argument('--rebuild', action='store_true', help="根据全表重新计算汇总表")
+    stats.set_defaults(func=cmd_stats)
+
+    compact = subparsers.add_parser('compact', help="清理字典表中不再使用的值并 VACUUM，回收磁盘空间")
+    compact.set_defaults(func=cmd_compact)
+
+    daemon = subparsers.add_parser('daemon', help="常驻服务模式：按间隔持续刷新列表页、详情页和失败记录")
+    daemon.add_argument('--status-port', type=int, default=None, help="状态接口端口，0 表示不启动")
+    daemon.set_defaults(func=cmd_daemon)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    from config import ConfigError
+    try:
+        pipeline = build_pipeline(args)
+    except ConfigError as e:
+        print(f"❌ {e}")
+        return 2
+
+    from flow_control import PipelineAbortError
+    from loguru import logger
+
+    start_time = time.time()
+    try:
+        code = args.func(pipeline, args)
+    except PipelineAbortError as e:
+        logger.error(f"{args.command} 因致命错误中止: {str(e)}")
+        return 2
+    logger.success(f"{args.command} 完成，耗时 {time.time() - start_time:.2f} 秒")
+    return code or 0
+
+
+if __name__ == '__main__':
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        print("\n❌ 用户中断")
+        sys.exit(1)
@@ -5,8 +5,22 @@ PropertyGuru Pipeline 配置文件为什么
 1. 复制此文件为 config.py
 2. 填入你的实际配置
 3. 在代码中使用：from config import Config
+
+配置来源（后者覆盖前者）：
+    Config 类中的默认值 < config.ini < 环境变量 PROPERTYGURU_<KEY> < 命令行 / 代码传入的 overrides
+load_config() 合并、转换类型并校验，结果直接传给 PropertyGuruPipeline(config=...)
 """
 
+import configparser
+import os
+import re
+
+from loguru import logger
+
+
+class ConfigError(ValueError):
+    """配置项类型或取值不合法"""
+
 
 class Config:
     """配置类 - 统一管理所有配置参数"""
@@ -17,36 +31,47 @@ class Config:
 
     # ==================== 数据存储配置 ====================
     DATA_DIR = 'data'
-    DB_NAME = 'propertyguru.db'
-    HTML_DIR = 'data/html'
-    JSON_DIR = 'data/json'
-    EXPORT_DIR = 'data/export'
+    DB_NAME = 'propertyguru_integrated.db'
+    # 以下目录为 None 时使用 DATA_DIR 下的 html / json / export
+    HTML_DIR = None
+    JSON_DIR = None
+    EXPORT_DIR = None
     LOGS_DIR = 'logs'
 
     # ==================== 多线程配置 ====================
     MAX_WORKERS = 5  # Stage2详情页爬取的线程数（建议3-10）
     REQUEST_TIMEOUT = 60  # 请求超时时间（秒）
-    REQUEST_DELAY = 0.5  # 请求间隔（秒），避免请求过快
+    REQUEST_DELAY = 0  # 所有线程之间的最小请求间隔（秒），0 表示不限速
 
     # ==================== Stage1配置（列表页爬取） ====================
     PAGES_WITHOUT_NEW_THRESHOLD = 5  # 连续N页无新记录后停止
     TIME_WINDOW_DAYS = 3  # 时间窗口（天），超过此时间自动全量爬取
-    REVIEW_PAGES = 10  # 断点续爬时回溯检查的页数
-
-    # 页数范围
-    RENT_START_PAGE = 1
-    RENT_END_PAGE = 1484
-    SALE_START_PAGE = 1
-    SALE_END_PAGE = 2663
 
     # ==================== Stage2配置（详情页爬取） ====================
     AGENT_INFO_EXPIRY_DAYS = 90  # 代理信息过期天数（超过此时间需要更新）
     MAX_RETRIES = 3  # 失败记录最大重试次数
 
+    # ==================== 性能配置 ====================
+    HTTP_POOL_SIZE = 10  # 每个进程复用的 HTTP 连接数上限（不小于线程数）
+    DB_TIMEOUT = 30  # 数据库锁等待时间（秒）
+    DB_CACHE_SIZE_KB = 0  # SQLite 页缓存大小（KB），0 使用 SQLite 默认值
+
+    # ==================== 响应缓存配置 ====================
+    RESPONSE_CACHE = True  # 短时间内重复请求同一页面时使用缓存，不再调用 API
+    RESPONSE_CACHE_TTL_LIST = 1800  # 列表页缓存有效期（秒），0 表示不缓存
+    RESPONSE_CACHE_TTL_DETAIL = 21600  # 详情页缓存有效期（秒），0 表示不缓存
+    RESPONSE_CACHE_MAX_MB = 500  # 缓存总大小上限（MB），超过后按最近访问时间淘汰
+
     # ==================== 日志配置 ====================
     LOG_LEVEL = 'INFO'  # 日志级别：DEBUG, INFO, WARNING, ERROR
     LOG_ROTATION = '500 MB'  # 日志文件大小限制
     LOG_RETENTION = '30 days'  # 日志保留时间
+    LOG_COMPRESSION = 'gz'  # 轮转后的旧日志压缩格式，空表示不压缩
+    LOG_CONSOLE_LEVEL = 'INFO'  # 控制台日志级别
+    LOG_ENQUEUE = True  # 日志由后台线程批量写出，工作线程不等待磁盘 / 终端 IO
+    LOG_FLUSH_INTERVAL = 1.0  # 后台写日志的间隔（秒）
+    LOG_SAMPLE_EVERY = 100  # 逐条记录的日志每 N 条输出 1 条（失败不采样），1 表示全部输出
+    LOG_SUMMARY_INTERVAL = 30  # 汇总进度日志的输出间隔（秒）
 
     # ==================== 导出配置 ====================
     EXPORT_ENCODING = 'utf-8-sig'  # CSV导出编码（utf-8-sig支持Excel）
@@ -75,13 +100,34 @@ class Config:
             'proxy': cls.PROXY,
             'data_dir': cls.DATA_DIR,
             'db_name': cls.DB_NAME,
+            'html_dir': cls.HTML_DIR,
+            'json_dir': cls.JSON_DIR,
+            'export_dir': cls.EXPORT_DIR,
+            'logs_dir': cls.LOGS_DIR,
             'max_workers': cls.MAX_WORKERS,
+            'request_timeout': cls.REQUEST_TIMEOUT,
             'request_delay': cls.REQUEST_DELAY,
             'pages_without_new_threshold': cls.PAGES_WITHOUT_NEW_THRESHOLD,
             'time_window_days': cls.TIME_WINDOW_DAYS,
-            'review_pages': cls.REVIEW_PAGES,
             'agent_info_expiry_days': cls.AGENT_INFO_EXPIRY_DAYS,
             'max_retries': cls.MAX_RETRIES,
+            'http_pool_size': cls.HTTP_POOL_SIZE,
+            'db_timeout': cls.DB_TIMEOUT,
+            'db_cache_size_kb': cls.DB_CACHE_SIZE_KB,
+            'response_cache': cls.RESPONSE_CACHE,
+            'response_cache_ttl_list': cls.RESPONSE_CACHE_TTL_LIST,
+            'response_cache_ttl_detail': cls.RESPONSE_CACHE_TTL_DETAIL,
+            'response_cache_max_mb': cls.RESPONSE_CACHE_MAX_MB,
+            'log_level': cls.LOG_LEVEL,
+            'log_rotation': cls.LOG_ROTATION,
+            'log_retention': cls.LOG_RETENTION,
+            'log_compression': cls.LOG_COMPRESSION,
+            'log_console_level': cls.LOG_CONSOLE_LEVEL,
+            'log_enqueue': cls.LOG_ENQUEUE,
+            'log_flush_interval': cls.LOG_FLUSH_INTERVAL,
+            'log_sample_every': cls.LOG_SAMPLE_EVERY,
+            'log_summary_interval': cls.LOG_SUMMARY_INTERVAL,
+            'export_encoding': cls.EXPORT_ENCODING,
         }
 
     @classmethod
@@ -100,6 +146,311 @@ class Config:
         print("=" * 60)
 
 
+# ==================== 配置项定义 ====================
+
+def _optional(convert):
+    def _convert(value):
+        if value is None or (isinstance(value, str) and value.strip().lower() in ('', 'none', 'null')):
+            return None
+        return convert(value)
+    return _convert
+
+
+def _bool(value):
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in ('1', 'true', 'yes', 'on'):
+        return True
+    if text in ('0', 'false', 'no', 'off'):
+        return False
+    raise ValueError(f"无法解析为布尔值: {value!r}")
+
+
+def _size(value):
+    """'500 MB' 形式的文件大小（原样返回字符串，只校验格式）"""
+    if not re.fullmatch(r'\s*\d+(\.\d+)?\s*(B|KB|MB|GB)\s*', str(value), re.I):
+        raise ValueError(f"应为文件大小（如 500 MB）: {value!r}")
+    return str(value).strip()
+
+
+def _retention(value):
+    """'30 days' 形式的保留时间，或保留的文件个数"""
+    text = str(value).strip()
+    if text.isdigit():
+        return int(text)
+    if not re.fullmatch(r'\d+(\.\d+)?\s*(hour|day|week)s?', text, re.I):
+        raise ValueError(f"应为保留时间（如 30 days）或文件个数: {value!r}")
+    return text
+
+
+def _endpoints(value):
+    """
+    请求端点列表：每行（或以逗号分隔）一个 apikey|proxy|并发上限|权重，后两项可省略，
+    apikey / proxy 留空时使用 apikey / proxy 配置项；也接受代码传入的 dict 列表
+    """
+    if isinstance(value, (list, tuple)):
+        return [dict(item) for item in value]
+    endpoints = []
+    for line in re.split(r'[\n,]', str(value)):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        parts = [part.strip() for part in line.split('|')]
+        if len(parts) < 2 or len(parts) > 4:
+            raise ValueError(f"端点格式应为 apikey|proxy|并发上限|权重: {line!r}")
+        parts += [''] * (4 - len(parts))
+        max_concurrency = int(parts[2]) if parts[2] else None
+        weight = float(parts[3]) if parts[3] else 1.0
+        if (max_concurrency is not None and max_concurrency < 1) or weight <= 0:
+            raise ValueError(f"端点并发上限和权重必须为正数: {line!r}")
+        endpoints.append({'apikey': parts[0], 'proxy': parts[1], 'max_concurrency': max_concurrency,
+                          'weight': weight})
+    return endpoints
+
+
+def _positive(value):
+    return value is None or value > 0
+
+
+def _non_negative(value):
+    return value is None or value >= 0
+
+
+def _one_of(*choices):
+    return lambda value: value is None or value in choices
+
+
+_LOG_LEVELS = ('TRACE', 'DEBUG', 'INFO', 'SUCCESS', 'WARNING', 'ERROR', 'CRITICAL')
+
+# 配置项: 名称 -> (类型转换, 取值校验, 说明)
+CONFIG_SCHEMA = {
+    # API
+    'apikey': (str, None, "CloudBypass API密钥"),
+    'proxy': (str, None, "代理地址"),
+
+    # 路径
+    'data_dir': (str, None, "数据目录"),
+    'db_name': (str, None, "数据库文件名（位于 data_dir 下，db_path 优先）"),
+    'db_path': (_optional(str), None, "数据库文件路径"),
+    'html_dir': (_optional(str), None, "HTML 保存目录"),
+    'json_dir': (_optional(str), None, "JSON 保存目录"),
+    'export_dir': (_optional(str), None, "CSV 导出目录"),
+    'logs_dir': (str, None, "日志目录"),
+
+    # 并发
+    'max_workers': (int, _positive, "Step 2 线程数"),
+    'step1_workers': (_optional(int), _positive, "Step 1 并发窗口上限（为空时按待爬取页数自动确定）"),
+    'step1_pages_per_worker': (int, _positive, "Step 1 每多少页待爬取的列表页增加一个并发"),
+    'step1_shard_workers': (int, _positive, "同时爬取的分片数"),
+    'step2_processes': (int, _positive, "Step 2 工作进程数"),
+    'pipeline_overlap': (_bool, None, "流水线模式：Step 1 新写入的房源直接交给 Step 2，两个阶段同时运行"),
+
+    # 请求端点池
+    'endpoints': (_endpoints, None, "多个 apikey|proxy|并发上限|权重 端点，为空时只使用 apikey / proxy"),
+    'endpoint_max_concurrency': (_optional(int), _positive, "未单独设置并发上限的端点的默认并发上限，空表示不限制"),
+    'endpoint_quarantine_failures': (int, _positive, "端点连续失败多少次后隔离"),
+    'endpoint_quarantine_seconds': (float, _positive, "端点首次隔离时长（秒），之后每次加倍"),
+    'endpoint_max_quarantine_seconds': (float, _positive, "端点隔离时长上限（秒）"),
+    'endpoint_min_success_rate': (float, lambda value: 0 <= value <= 1, "端点成功率低于该值时隔离"),
+
+    # 请求：限速、超时、重试
+    'request_delay': (float, _non_negative, "所有线程之间的最小请求间隔（秒），0 不限速"),
+    'rate_limit_burst': (int, _positive, "限速时允许的突发请求数"),
+    'request_timeout': (float, _positive, "单次请求超时（秒）"),
+    'http_pool_size': (int, _positive, "HTTP 连接池大小"),
+    'retry_backoff_base': (float, _non_negative, "指数退避基数（秒）"),
+    'retry_backoff_max': (float, _non_negative, "单次退避上限（秒）"),
+    'breaker_failure_threshold': (int, _positive, "连续临时错误多少次后熔断"),
+    'breaker_cooldown_seconds': (float, _positive, "首次熔断冷却时间（秒）"),
+    'breaker_max_cooldown_seconds': (float, _positive, "熔断冷却时间上限（秒）"),
+    'breaker_max_trips': (int, _positive, "连续熔断次数上限"),
+    'hedge_requests': (_bool, None, "详情页请求超过 hedge_percentile 分位耗时仍未返回时，通过另一个端点再发一次"),
+    'hedge_percentile': (float, lambda value: 0 < value < 100, "触发对冲的耗时分位数"),
+    'hedge_min_delay': (float, _non_negative, "对冲等待时间下限（秒）"),
+    'hedge_max_rate': (float, lambda value: 0 <= value <= 1, "对冲请求数占详情页请求数的比例上限"),
+    'hedge_min_samples': (int, _positive, "积累多少个耗时样本后才开始对冲"),
+
+    # Step 1
+    'pages_without_new_threshold': (int, _positive, "连续无新记录页数阈值"),
+    'time_window_days': (int, _non_negative, "时间窗口（天）"),
+    'empty_pages_threshold': (int, _positive, "连续空页数阈值"),
+    'rent_max_pages': (_optional(int), _positive, "租房总页数兜底值"),
+    'sale_max_pages': (_optional(int), _positive, "买房总页数兜底值"),
+    'delist_missed_passes': (_optional(int), _non_negative, "连续多少次完整遍历未出现的房源移入归档表，空或 0 表示不检测"),
+    'delist_max_missing_ratio': (float, lambda value: 0 <= value <= 1, "一次遍历中未出现的房源超过该比例时不计入下架检测"),
+
+    # Step 2
+    'agent_info_expiry_days': (int, _positive, "代理信息过期天数"),
+    'max_retries': (int, _non_negative, "最大重试次数（超过后转入死信表）"),
+    'retry_tier_base_seconds': (float, _positive, "第 1 次失败后到下次重试的等待时间（秒），之后每次乘以 4"),
+    'retry_tier_max_seconds': (float, _positive, "失败重试等待时间上限（秒）"),
+    'step2_prioritize': (_bool, None, "按优先级排序待处理记录"),
+    'step2_max_requests': (_optional(int), _non_negative, "单次运行最多处理的详情页数"),
+    'step2_max_spend': (_optional(float), _non_negative, "单次运行的 API 费用上限"),
+    'api_cost_per_request': (float, _non_negative, "每次详情页请求的 API 费用"),
+    'adaptive_recrawl': (_bool, None, "自适应重爬"),
+    'recrawl_min_days': (float, _positive, "重爬间隔下限（天）"),
+    'recrawl_max_days': (float, _positive, "重爬间隔上限（天）"),
+    'recrawl_daily_budget': (_optional(int), _non_negative, "每天最多刷新的记录数"),
+    'detail_fetch_mode': (str, _one_of('full', 'light'), "详情页请求方式"),
+    'save_detail_files': (_bool, None, "保存详情页原始文件"),
+    'stream_chunk_size': (int, _positive, "流式读取块大小（字节）"),
+
+    # 批量 / 队列
+    'step2_write_batch': (int, _positive, "多进程模式主进程批量写库的记录数"),
+    'queue_lease_seconds': (int, _positive, "任务租约时长（秒）"),
+    'queue_batch_size': (int, _positive, "每次领取的任务数"),
+    'queue_idle_wait': (float, _non_negative, "队列为空时的等待间隔（秒）"),
+
+    # 数据库
+    'db_timeout': (float, _positive, "数据库锁等待时间（秒）"),
+    'db_cache_size_kb': (int, _non_negative, "SQLite 页缓存大小（KB），0 使用默认值"),
+    'db_journal_mode': (str, _one_of('', 'DELETE', 'TRUNCATE', 'PERSIST', 'WAL'),
+                        "SQLite 日志模式，空表示不修改（多机器共享数据库文件时不要用 WAL）"),
+    'db_synchronous': (str, _one_of('', 'OFF', 'NORMAL', 'FULL'), "SQLite synchronous，空表示不修改"),
+
+    # 响应缓存
+    'response_cache': (_bool, None, "启用响应缓存"),
+    'response_cache_path': (_optional(str), None, "缓存文件路径（默认 data_dir/response_cache.db）"),
+    'response_cache_ttl_list': (float, _non_negative, "列表页缓存有效期（秒），0 表示不缓存"),
+    'response_cache_ttl_detail': (float, _non_negative, "详情页缓存有效期（秒），0 表示不缓存"),
+    'response_cache_max_mb': (int, _positive, "缓存总大小上限（MB）"),
+    'response_cache_bypass': (_bool, None, "不读缓存（仍写入），相当于强制刷新"),
+
+    # 常驻服务模式
+    'daemon_list_interval': (float, _non_negative, "列表页增量刷新间隔（秒），0 表示不运行"),
+    'daemon_detail_interval': (float, _non_negative, "补充缺失详情页的间隔（秒），0 表示不运行"),
+    'daemon_expired_interval': (float, _non_negative, "刷新到期详情页的间隔（秒），0 表示不运行"),
+    'daemon_retry_interval': (float, _non_negative, "重试失败记录的间隔（秒），0 表示不运行"),
+    'daemon_export_interval': (float, _non_negative, "导出 CSV 的间隔（秒），0 表示不运行"),
+    'daemon_hourly_requests': (_optional(int), _non_negative, "每小时最多发出的请求数，空表示不限制"),
+    'daemon_status_host': (str, None, "状态接口监听地址"),
+    'daemon_status_port': (int, lambda value: 0 <= value <= 65535, "状态接口端口，0 表示不启动"),
+
+    # 日志 / 导出
+    'log_level': (str, _one_of(*_LOG_LEVELS), "日志级别"),
+    'log_console_level': (str, _one_of(*_LOG_LEVELS), "控制台日志级别"),
+    'log_rotation': (_optional(_size), None, "日志文件超过该大小后轮转（如 500 MB），空表示不轮转"),
+    'log_retention': (_optional(_retention), None, "旧日志保留时间（如 30 days）或保留的文件个数"),
+    'log_compression': (_optional(str), _one_of(None, 'gz', 'zip'), "轮转后的旧日志压缩格式（gz / zip），空表示不压缩"),
+    'log_enqueue': (_bool, None, "日志由后台线程批量写出"),
+    'log_flush_interval': (float, _positive, "后台写日志的间隔（秒）"),
+    'log_sample_every': (int, _positive, "逐条记录的日志每 N 条输出 1 条，1 表示全部输出"),
+    'log_summary_interval': (float, _non_negative, "汇总进度日志的输出间隔（秒）"),
+    'export_encoding': (str, None, "CSV 导出编码"),
+}
+
+ENV_PREFIX = 'PROPERTYGURU_'
+
+
+def _convert(key, value, errors):
+    convert, check, _ = CONFIG_SCHEMA[key]
+    try:
+        value = convert(value)
+        if key in ('db_journal_mode', 'db_synchronous', 'log_level', 'log_console_level'):
+            value = value.upper()
+    except (TypeError, ValueError) as e:
+        errors.append(f"{key}: {e}")
+        return None
+    if check and not check(value):
+        errors.append(f"{key}: 取值不合法 ({value!r})")
+    return value
+
+
+def read_ini(path):
+    """读取 INI 文件中的配置项（不区分 section），文件不存在时返回空 dict"""
+    if not path or not os.path.exists(path):
+        return {}
+    parser = configparser.ConfigParser()
+    parser.read(path, encoding='utf-8')
+    values = {}
+    for section in parser.sections():
+        for key, value in parser.items(section):
+            values[key] = value
+    return values
+
+
+def read_env(env=None):
+    """读取 PROPERTYGURU_<KEY> 环境变量"""
+    env = os.environ if env is None else env
+    values = {}
+    for name, value in env.items():
+        if name.startswith(ENV_PREFIX):
+            values[name[len(ENV_PREFIX):].lower()] = value
+    return values
+
+
+# 已删除的配置项：旧的 config.ini / 环境变量中可能仍然存在，忽略并提示一次（不视为未知配置项）
+DEPRECATED_KEYS = {
+    'review_pages': "断点续爬改为按 crawl_pages 页表只补爬缺失 / 失败的页",
+}
+_deprecation_warned = set()
+
+
+def validate_config(config):
+    """转换类型并校验，返回 (转换后的配置, 错误列表)"""
+    errors = []
+    result = {}
+    for key, value in config.items():
+        if key in DEPRECATED_KEYS:
+            if key not in _deprecation_warned:
+                _deprecation_warned.add(key)
+                logger.warning(f"配置项 {key} 已废弃，忽略（{DEPRECATED_KEYS[key]}），可以从配置文件中删除")
+            continue
+        if key not in CONFIG_SCHEMA:
+            errors.append(f"{key}: 未知配置项")
+            continue
+        result[key] = _convert(key, value, errors)
+
+    # 组合校验
+    if (result.get('retry_backoff_base') or 0) > result.get('retry_backoff_max', float('inf')):
+        errors.append("retry_backoff_max 不能小于 retry_backoff_base")
+    if (result.get('recrawl_min_days') or 0) > result.get('recrawl_max_days', float('inf')):
+        errors.append("recrawl_max_days 不能小于 recrawl_min_days")
+    if (result.get('endpoint_quarantine_seconds') or 0) > result.get('endpoint_max_quarantine_seconds', float('inf')):
+        errors.append("endpoint_max_quarantine_seconds 不能小于 endpoint_quarantine_seconds")
+    if (result.get('breaker_cooldown_seconds') or 0) > result.get('breaker_max_cooldown_seconds', float('inf')):
+        errors.append("breaker_max_cooldown_seconds 不能小于 breaker_cooldown_seconds")
+    return result, errors
+
+
+def load_config(ini_path='config.ini', env=None, overrides=None, use_defaults=True):
+    """
+    合并各来源的配置并校验
+
+    - use_defaults: 是否以 Config 类中的值为最底层
+    - ini_path: INI 文件路径（None 不读取；文件不存在时忽略）
+    - env: 环境变量 dict（默认 os.environ；传 {} 不读取）
+    - overrides: 命令行 / 代码传入的配置，值为 None 的项忽略
+
+    INI 中值为空的项（如未填写的 apikey）视为未设置。
+    配置不合法时抛出 ConfigError。
+    """
+    merged = {}
+    if use_defaults:
+        merged.update(Config.get_config_dict())
+    merged.update({key: value for key, value in read_ini(ini_path).items() if value.strip() != ''})
+    merged.update(read_env(env))
+    merged.update({key: value for key, value in (overrides or {}).items() if value is not None})
+
+    config, errors = validate_config(merged)
+    if errors:
+        raise ConfigError("配置错误：\n" + "\n".join(f"  - {error}" for error in errors))
+    return config
+
+
+def parse_set_options(options):
+    """解析命令行的 --set key=value 列表"""
+    values = {}
+    for option in options or []:
+        if '=' not in option:
+            raise ConfigError(f"--set 参数格式应为 key=value: {option}")
+        key, value = option.split('=', 1)
+        values[key.strip().lower()] = value.strip()
+    return values
+
+
 # 便捷访问（向后兼容）
 config = Config.get_config_dict()
 
@@ -108,9 +459,13 @@ if __name__ == '__main__':
     Config.print_config()
 
     errors = Config.validate()
+    try:
+        load_config()
+    except ConfigError as e:
+        errors.append(str(e))
     if errors:
         print("\n配置错误：")
         for error in errors:
             print(error)
     else:
-        print("\n✅ 配置验证通过")
\ No newline at end of file
+        print("\n✅ 配置验证通过")
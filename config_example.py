@@ -18,7 +18,6 @@ config = {
     # ==================== Stage1配置（列表页爬取） ====================
     'pages_without_new_threshold': 5,  # 连续N页无新记录后停止
     'time_window_days': 3,             # 时间窗口（天），超过此时间自动全量爬取
-    'review_pages': 10,                # 断点续爬时回溯检查的页数
     
     # ==================== Stage2配置（详情页爬取） ====================
     'agent_info_expiry_days': 90,      # 代理信息过期天数（超过此时间需要更新）
@@ -0,0 +1,318 @@
+"""
+常驻服务模式：一个 Pipeline 实例持续运行，替代 cron 定时调用 run_daily.py / run_retry.py / run_details_only.py
+
+- 建表、HTTP 会话、端点池及其健康统计、响应缓存、耗时统计在整个运行期间保持，不再每次重新创建
+- 任务按各自的间隔循环执行：列表页增量刷新、补充缺失的详情页、刷新到期的详情页、重试失败记录、导出 CSV；
+  同一时间只执行一个任务（共用请求限速器和熔断器），到期最早的先执行，间隔为 0 的任务不执行
+- 全局请求预算：每小时窗口内最多发出 DAEMON_HOURLY_REQUESTS 个请求；详情页任务按窗口剩余额度截断，
+  额度用完后所有请求类任务推迟到下一个窗口
+- 收到 SIGHUP 时在两个任务之间重新加载配置（见 PropertyGuruPipeline.reload_config）；
+  收到 SIGTERM / SIGINT 时等当前任务结束后退出，再次收到则立即退出
+- 本地状态接口：GET http://127.0.0.1:<DAEMON_STATUS_PORT>/status 返回 JSON
+  （各任务的上次运行情况和下次运行时间、预算、请求统计、熔断器、端点池、详情页耗时分位数）
+"""
+
+import json
+import signal
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from loguru import logger
+
+from flow_control import PipelineAbortError
+
+
+def _format_time(timestamp):
+    return datetime.fromtimestamp(timestamp).isoformat(timespec='seconds') if timestamp else None
+
+
+class DaemonJob:
+    """一个周期性任务及其运行记录"""
+
+    __slots__ = ('name', 'interval_attr', 'func', 'budgeted', 'next_run', 'runs', 'failures',
+                 'last_started', 'last_finished', 'last_requests', 'last_error')
+
+    def __init__(self, name, interval_attr, func, budgeted=True):
+        self.name = name
+        self.interval_attr = interval_attr  # Pipeline 上的间隔属性名（秒），重新加载配置后立即生效
+        self.func = func
+        self.budgeted = budgeted  # 是否发出请求（受每小时请求预算约束）
+        self.next_run = 0.0
+        self.runs = 0
+        self.failures = 0
+        self.last_started = None
+        self.last_finished = None
+        self.last_requests = 0
+        self.last_error = None
+
+    def snapshot(self, interval):
+        return {
+            'interval': interval,
+            'enabled': interval > 0,
+            'next_run': _format_time(self.next_run) if interval > 0 else None,
+            'runs': self.runs,
+            'failures': self.failures,
+            'last_started': _format_time(self.last_started),
+            'last_duration': (round(self.last_finished - self.last_started, 1)
+                              if self.last_started and self.last_finished else None),
+            'last_requests': self.last_requests,
+            'last_error': self.last_error,
+        }
+
+
+class PipelineDaemon:
+    """常驻服务：按间隔调度 Pipeline 的各个任务"""
+
+    BUDGET_WINDOW_SECONDS = 3600
+
+    def __init__(self, pipeline, ini_path=None, overrides=None):
+        """
+        - pipeline: 已创建的 PropertyGuruPipeline（间隔、预算、状态端口等读取其 DAEMON_* 属性）
+        - ini_path / overrides: 重新加载配置时传给 config.load_config（None 时收到 SIGHUP 只记录日志）
+        """
+        self.pipeline = pipeline
+        self.ini_path = ini_path
+        self.overrides = overrides
+        self.jobs = [
+            DaemonJob('listings', 'DAEMON_LIST_INTERVAL',
+                      lambda: pipeline.step1_crawl_listings(mode='smart_incremental')),
+            DaemonJob('details', 'DAEMON_DETAIL_INTERVAL',
+                      lambda: pipeline.step2_crawl_agent_info(mode='incremental')),
+            DaemonJob('expired', 'DAEMON_EXPIRED_INTERVAL',
+                      lambda: pipeline.step2_crawl_agent_info(mode='expired')),
+            DaemonJob('retry', 'DAEMON_RETRY_INTERVAL', pipeline.retry_failed_records),
+            DaemonJob('export', 'DAEMON_EXPORT_INTERVAL', pipeline.export_csv, budgeted=False),
+        ]
+
+        self.started_at = None
+        self.current_job = None
+        self.stop_reason = None
+        self._stop = threading.Event()
+        self._reload = threading.Event()
+        self._wakeup = threading.Event()
+        self._server = None
+
+        # 每小时请求预算窗口：窗口开始时间、窗口开始时的请求计数
+        self._window_start = 0.0
+        self._window_requests = 0
+
+    # ---------- 控制 ----------
+
+    def request_stop(self, reason="收到停止请求"):
+        """当前任务结束后退出（可在其他线程或信号处理函数中调用）"""
+        if not self._stop.is_set():
+            self.stop_reason = reason
+            self._stop.set()
+            self._wakeup.set()
+
+    def request_reload(self):
+        """在两个任务之间重新加载配置"""
+        self._reload.set()
+        self._wakeup.set()
+
+    def install_signal_handlers(self):
+        """SIGTERM / SIGINT 优雅退出（第二次收到时立即退出），SIGHUP 重新加载配置；只能在主线程调用"""
+        def _on_stop(signum, frame):
+            name = signal.Signals(signum).name
+            if self._stop.is_set():
+                raise KeyboardInterrupt(name)
+            logger.warning(f"收到 {name}，当前任务结束后退出（再次发送立即退出）")
+            self.request_stop(f"收到 {name}")
+
+        def _on_reload(signum, frame):
+            logger.info("收到 SIGHUP，准备重新加载配置")
+            self.request_reload()
+
+        signal.signal(signal.SIGTERM, _on_stop)
+        signal.signal(signal.SIGINT, _on_stop)
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, _on_reload)
+
+    # ---------- 调度 ----------
+
+    def interval(self, job):
+        return getattr(self.pipeline, job.interval_attr) or 0
+
+    def run(self):
+        """运行直到收到停止请求或发生致命错误；致命错误时抛出 PipelineAbortError"""
+        self.started_at = time.time()
+        self._start_budget_window(self.started_at)
+        self.start_status_server()
+        logger.info("🛰️  常驻服务模式启动: " + ", ".join(
+            f"{job.name} 每 {self.interval(job):.0f} 秒" for job in self.jobs if self.interval(job) > 0))
+
+        try:
+            while not self._stop.is_set():
+                if self._reload.is_set():
+                    self._reload.clear()
+                    self.reload()
+
+                now = time.time()
+                job = self._next_job(now)
+                if job is None:
+                    self._wakeup.clear()
+                    self._wakeup.wait(self._idle_seconds(now))
+                    continue
+
+                if job.budgeted and self.budget_remaining(now) == 0:
+                    job.next_run = self._window_start + self.BUDGET_WINDOW_SECONDS
+                    logger.info(f"🎯 本小时请求预算已用完，{job.name} 推迟到 {_format_time(job.next_run)}")
+                    continue
+
+                self._run_job(job)
+        finally:
+            self.stop_status_server()
+            logger.info(f"常驻服务已停止: {self.stop_reason or '正常退出'}")
+
+    def _next_job(self, now):
+        due = [job for job in self.jobs if self.interval(job) > 0 and job.next_run <= now]
+        return min(due, key=lambda job: job.next_run) if due else None
+
+    def _idle_seconds(self, now):
+        upcoming = [job.next_run for job in self.jobs if self.interval(job) > 0]
+        return max(0.1, min(upcoming, default=now + 60) - now)
+
+    def _run_job(self, job):
+        pipeline = self.pipeline
+        job.last_started = time.time()
+        job.last_error = None
+        self.current_job = job.name
+        requests_before = pipeline.fetch_stats['requests']
+        max_requests = pipeline.STEP2_MAX_REQUESTS
+        remaining = self.budget_remaining(job.last_started) if job.budgeted else None
+        if remaining is not None and job.name in ('details', 'expired'):
+            pipeline.STEP2_MAX_REQUESTS = remaining if max_requests is None else min(max_requests, remaining)
+
+        logger.info(f"▶️  开始任务: {job.name}" + (f"（本小时剩余预算 {remaining} 次请求）" if remaining is not None else ""))
+        try:
+            job.func()
+        except PipelineAbortError as e:
+            job.failures += 1
+            job.last_error = str(e)
+            self.request_stop(f"致命错误: {e}")
+            raise
+        except Exception as e:
+            job.failures += 1
+            job.last_error = str(e)
+            logger.error(f"任务 {job.name} 执行失败: {str(e)}")
+        finally:
+            pipeline.STEP2_MAX_REQUESTS = max_requests
+            job.runs += 1
+            job.last_finished = time.time()
+            job.last_requests = pipeline.fetch_stats['requests'] - requests_before
+            job.next_run = job.last_finished + self.interval(job)
+            self.current_job = None
+
+        logger.info(f"⏹️  任务 {job.name} 完成，耗时 {job.last_finished - job.last_started:.1f} 秒，"
+                    f"请求 {job.last_requests} 次，下次运行: {_format_time(job.next_run)}")
+
+    # ---------- 请求预算 ----------
+
+    def _start_budget_window(self, now):
+        self._window_start = now
+        self._window_requests = self.pipeline.fetch_stats['requests']
+
+    def budget_remaining(self, now=None):
+        """当前小时窗口剩余的请求数，未设置预算时返回 None"""
+        budget = self.pipeline.DAEMON_HOURLY_REQUESTS
+        if budget is None:
+            return None
+        now = now or time.time()
+        if now - self._window_start >= self.BUDGET_WINDOW_SECONDS:
+            self._start_budget_window(now)
+        used = self.pipeline.fetch_stats['requests'] - self._window_requests
+        return max(0, budget - used)
+
+    # ---------- 重新加载配置 ----------
+
+    def reload(self):
+        """重新读取配置文件 / 环境变量并应用到 Pipeline；配置不合法时保持当前配置"""
+        if self.ini_path is None and self.overrides is None:
+            logger.warning("未指定配置来源，忽略重新加载请求")
+            return
+        from config import load_config
+        try:
+            config = load_config(ini_path=self.ini_path, overrides=self.overrides)
+            self.pipeline.reload_config(config)
+        except Exception as e:  # ConfigError、INI 格式错误等
+            logger.error(f"重新加载配置失败，继续使用当前配置: {e}")
+            return
+        # 间隔缩短后立即生效
+        for job in self.jobs:
+            if job.last_finished:
+                job.next_run = job.last_finished + self.interval(job)
+        logger.success("配置已重新加载")
+
+    # ---------- 状态接口 ----------
+
+    def status(self):
+        """当前状态（状态接口返回的 JSON 内容）"""
+        pipeline = self.pipeline
+        now = time.time()
+        with pipeline._stats_lock:
+            fetch_stats = dict(pipeline.fetch_stats)
+        p50, p95, p99 = pipeline.detail_completion.percentiles(50, 95, 99)
+        remaining = self.budget_remaining(now)
+        return {
+            'started_at': _format_time(self.started_at),
+            'uptime': round(now - self.started_at, 1) if self.started_at else None,
+            'current_job': self.current_job,
+            'stopping': self._stop.is_set(),
+            'jobs': {job.name: job.snapshot(self.interval(job)) for job in self.jobs},
+            'budget': {
+                'hourly_requests': pipeline.DAEMON_HOURLY_REQUESTS,
+                'remaining': remaining,
+                'window_resets_at': _format_time(self._window_start + self.BUDGET_WINDOW_SECONDS),
+            },
+            'fetch_stats': fetch_stats,
+            'breaker': pipeline.breaker.snapshot(),
+            'endpoints': pipeline.endpoint_pool.snapshot() if pipeline.endpoint_pool else [],
+            'detail_latency': {'samples': len(pipeline.detail_completion), 'p50': p50, 'p95': p95, 'p99': p99},
+        }
+
+    def start_status_server(self):
+        """在后台线程中启动状态接口（DAEMON_STATUS_PORT 为 0 时不启动）"""
+        port = self.pipeline.DAEMON_STATUS_PORT
+        if not port:
+            return None
+        daemon = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip('/') in ('', '/status'):
+                    body = json.dumps(daemon.status(), ensure_ascii=False, default=str).encode('utf-8')
+                    self._reply(200, body, 'application/json; charset=utf-8')
+                elif self.path == '/health':
+                    healthy = not daemon.pipeline.breaker.is_aborted
+                    self._reply(200 if healthy else 503, b'ok' if healthy else b'aborted', 'text/plain')
+                else:
+                    self._reply(404, b'not found', 'text/plain')
+
+            def _reply(self, code, body, content_type):
+                self.send_response(code)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug("状态接口: " + format % args)
+
+        try:
+            self._server = ThreadingHTTPServer((self.pipeline.DAEMON_STATUS_HOST, port), _Handler)
+        except OSError as e:
+            logger.error(f"状态接口启动失败（{self.pipeline.DAEMON_STATUS_HOST}:{port}）: {str(e)}")
+            return None
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="daemon-status", daemon=True).start()
+        host, port = self._server.server_address[:2]
+        logger.info(f"📡 状态接口: http://{host}:{port}/status")
+        return self._server
+
+    def stop_status_server(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -0,0 +1,235 @@
+"""
+请求端点池：多个 (apikey, proxy) 组合轮换使用
+
+- 每个端点有独立的并发上限，领取（acquire）时阻塞等待空闲端点
+- 记录每个端点的成功率和响应延迟（指数滑动平均），按 权重 × 成功率 / 延迟 加权随机选择
+- 连续失败或成功率过低的端点隔离一段时间（多次隔离时加倍，有上限），隔离结束后先放行一个试探请求
+- 端点专属的错误（API 密钥无效、余额不足、代理连接中断）只停用 / 隔离该端点；
+  还有其他可用端点时，向全局熔断器上报为临时错误（换端点重试），全部不可用时才按原错误类型处理
+- 只有一个端点时不隔离、不停用，错误原样交给全局熔断器（与不使用端点池时相同）
+"""
+
+import random
+import threading
+import time
+
+from loguru import logger
+
+from flow_control import PipelineAbortError, ERROR_FATAL, ERROR_SYSTEMIC, ERROR_PERMANENT, ERROR_TRANSIENT
+
+
+class Endpoint:
+    """一个 (apikey, proxy) 组合及其健康状态"""
+
+    __slots__ = ('name', 'apikey', 'proxy', 'max_concurrency', 'weight', 'in_flight',
+                 'requests', 'failures', 'consecutive_failures', 'success_rate', 'latency',
+                 'quarantined_until', 'quarantines', 'probation', 'disabled_reason')
+
+    def __init__(self, name, apikey, proxy, max_concurrency=None, weight=1.0):
+        self.name = name
+        self.apikey = apikey
+        self.proxy = proxy
+        self.max_concurrency = max_concurrency  # None 表示不限制
+        self.weight = weight
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.success_rate = 1.0  # 指数滑动平均
+        self.latency = None  # 指数滑动平均（秒）
+        self.quarantined_until = 0.0
+        self.quarantines = 0  # 连续隔离次数（试探请求成功后清零）
+        self.probation = False  # 隔离结束后的试探阶段：只允许一个请求
+        self.disabled_reason = None
+
+    def has_capacity(self, now):
+        if self.disabled_reason or now < self.quarantined_until:
+            return False
+        limit = 1 if self.probation else self.max_concurrency
+        return limit is None or self.in_flight < limit
+
+    def score(self, default_latency):
+        return self.weight * max(self.success_rate, 0.01) / max(self.latency or default_latency, 0.05)
+
+    def snapshot(self, now=None):
+        now = now or time.monotonic()
+        return {
+            'name': self.name,
+            'in_flight': self.in_flight,
+            'requests': self.requests,
+            'failures': self.failures,
+            'success_rate': round(self.success_rate, 3),
+            'latency': round(self.latency, 3) if self.latency is not None else None,
+            'quarantined_for': round(max(0.0, self.quarantined_until - now), 1),
+            'disabled': self.disabled_reason,
+        }
+
+
+class EndpointPool:
+    """按健康度加权选择端点，隔离不健康的端点"""
+
+    def __init__(self, endpoints, quarantine_failures=5, quarantine_seconds=60, max_quarantine_seconds=900,
+                 min_success_rate=0.5, min_samples=10, smoothing=0.2):
+        """
+        - endpoints: Endpoint 列表
+        - quarantine_failures: 连续失败多少次后隔离
+        - quarantine_seconds / max_quarantine_seconds: 首次隔离时长 / 隔离时长上限（之后每次加倍）
+        - min_success_rate: 成功率（至少 min_samples 次请求后）低于该值时隔离
+        - smoothing: 成功率和延迟的滑动平均系数
+        """
+        if not endpoints:
+            raise ValueError("端点池至少需要一个端点")
+        self.endpoints = list(endpoints)
+        self.quarantine_failures = quarantine_failures
+        self.quarantine_seconds = quarantine_seconds
+        self.max_quarantine_seconds = max_quarantine_seconds
+        self.min_success_rate = min_success_rate
+        self.min_samples = min_samples
+        self.smoothing = smoothing
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        return len(self.endpoints)
+
+    def acquire(self, timeout=None):
+        """
+        领取一个端点（占用一个并发名额），没有空闲端点时阻塞等待
+
+        所有端点都已停用时抛出 PipelineAbortError；超过 timeout 仍无空闲端点时抛出 TimeoutError
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                usable = [endpoint for endpoint in self.endpoints if not endpoint.disabled_reason]
+                if not usable:
+                    raise PipelineAbortError("所有请求端点均已停用: " + "; ".join(
+                        f"{endpoint.name}: {endpoint.disabled_reason}" for endpoint in self.endpoints))
+
+                candidates = [endpoint for endpoint in usable if endpoint.has_capacity(now)]
+                if candidates:
+                    endpoint = self._choose(candidates)
+                    endpoint.in_flight += 1
+                    return endpoint
+
+                # 等待有请求完成，或最早的隔离结束
+                wait = min((endpoint.quarantined_until - now for endpoint in usable
+                            if endpoint.quarantined_until > now), default=1.0)
+                if deadline is not None:
+                    if now >= deadline:
+                        raise TimeoutError("等待空闲请求端点超时")
+                    wait = min(wait, deadline - now)
+                self._cond.wait(max(0.01, wait))
+
+    def try_acquire(self, exclude=None):
+        """
+        不等待：领取一个有空闲名额的端点，没有时返回 None（用于对冲请求）
+
+        优先选择与 exclude 代理不同的端点，没有时才使用同一代理的端点
+        """
+        with self._cond:
+            now = time.monotonic()
+            candidates = [endpoint for endpoint in self.endpoints if endpoint.has_capacity(now)]
+            if exclude is not None:
+                preferred = [endpoint for endpoint in candidates
+                             if endpoint is not exclude and endpoint.proxy != exclude.proxy]
+                candidates = preferred or candidates
+            if not candidates:
+                return None
+            endpoint = self._choose(candidates)
+            endpoint.in_flight += 1
+            return endpoint
+
+    def _choose(self, candidates):
+        if len(candidates) == 1:
+            return candidates[0]
+        known = [endpoint.latency for endpoint in self.endpoints if endpoint.latency is not None]
+        default_latency = sum(known) / len(known) if known else 1.0
+        weights = [endpoint.score(default_latency) for endpoint in candidates]
+        return random.choices(candidates, weights=weights)[0]
+
+    def release(self, endpoint, kind=None, latency=None, reason=''):
+        """
+        归还端点并记录结果：kind 为 None 表示成功，否则为 flow_control 中的错误类型
+
+        返回应上报给全局熔断器的错误类型（成功时返回 None）
+        """
+        with self._cond:
+            endpoint.in_flight -= 1
+            endpoint.requests += 1
+            try:
+                return self._record(endpoint, kind, latency, reason)
+            finally:
+                self._cond.notify_all()
+
+    def _record(self, endpoint, kind, latency, reason):
+        alpha = self.smoothing
+        if latency is not None and kind in (None, ERROR_PERMANENT):
+            endpoint.latency = latency if endpoint.latency is None else (1 - alpha) * endpoint.latency + alpha * latency
+
+        if kind in (None, ERROR_PERMANENT):
+            # 页面本身不存在等错误与端点无关，按成功计入健康度
+            endpoint.success_rate = (1 - alpha) * endpoint.success_rate + alpha
+            endpoint.consecutive_failures = 0
+            if endpoint.probation:
+                endpoint.probation = False
+                endpoint.quarantines = 0
+                logger.success(f"请求端点 {endpoint.name} 试探成功，恢复使用")
+            return kind
+
+        endpoint.failures += 1
+        endpoint.consecutive_failures += 1
+        endpoint.success_rate = (1 - alpha) * endpoint.success_rate
+        if len(self.endpoints) == 1:
+            return kind  # 只有一个端点时由全局熔断器处理
+        others = any(other is not endpoint and not other.disabled_reason for other in self.endpoints)
+
+        if kind == ERROR_FATAL:
+            endpoint.disabled_reason = reason or '致命错误'
+            logger.error(f"请求端点 {endpoint.name} 已停用: {endpoint.disabled_reason}")
+            return ERROR_TRANSIENT if others else ERROR_FATAL
+
+        if (kind == ERROR_SYSTEMIC or endpoint.probation
+                or endpoint.consecutive_failures >= self.quarantine_failures
+                or (endpoint.requests >= self.min_samples and endpoint.success_rate < self.min_success_rate)):
+            self._quarantine(endpoint, reason)
+            if kind == ERROR_SYSTEMIC and others:
+                return ERROR_TRANSIENT
+        return kind
+
+    def _quarantine(self, endpoint, reason):
+        duration = min(self.max_quarantine_seconds, self.quarantine_seconds * 2 ** endpoint.quarantines)
+        endpoint.quarantines += 1
+        endpoint.quarantined_until = time.monotonic() + duration
+        endpoint.probation = True
+        endpoint.consecutive_failures = 0
+        logger.warning(f"🚧 请求端点 {endpoint.name} 隔离 {duration:.0f} 秒"
+                       f"（成功率 {endpoint.success_rate:.0%}）: {reason}")
+        # 隔离结束后从中间值重新评估，避免一直被加权选择排除
+        endpoint.success_rate = max(endpoint.success_rate, self.min_success_rate + 0.1)
+
+    def snapshot(self):
+        """各端点状态（用于日志和监控）"""
+        with self._cond:
+            now = time.monotonic()
+            return [endpoint.snapshot(now) for endpoint in self.endpoints]
+
+
+def build_endpoint_pool(specs, default_apikey='', default_proxy='', default_concurrency=None, **options):
+    """
+    根据配置创建端点池
+
+    specs: [{'apikey':, 'proxy':, 'max_concurrency':, 'weight':}, ...]（见 config._endpoints），
+           未填写的 apikey / proxy / max_concurrency 使用默认值；为空时只有一个默认端点
+    """
+    specs = specs or [{}]
+    endpoints = []
+    for index, spec in enumerate(specs, 1):
+        endpoints.append(Endpoint(
+            name=spec.get('name') or f"endpoint-{index}",
+            apikey=spec.get('apikey') or default_apikey,
+            proxy=spec.get('proxy') or default_proxy,
+            max_concurrency=spec.get('max_concurrency') or default_concurrency,
+            weight=spec.get('weight') or 1.0,
+        ))
+    return EndpointPool(endpoints, **options)
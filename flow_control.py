@@ -0,0 +1,260 @@
+"""
+请求流量控制：错误分类、指数退避、熔断器
+
+- classify_error: 把 CloudBypass 错误码 / HTTP 状态码 / 请求异常分为
+  fatal（致命，停止整个 Pipeline）、systemic（系统性，暂停所有线程）、
+  transient（临时，退避后重试）、permanent（重试无意义，直接放弃）
+- backoff_delay: 带随机抖动的指数退避时间
+- CircuitBreaker: 连续失败或系统性错误时熔断，所有线程暂停等待冷却；
+  冷却后只放行一个探测请求，成功则恢复，失败则加倍冷却时间；
+  致命错误时进入 aborted 状态，后续请求抛出 PipelineAbortError，由上层优雅退出
+- RateLimiter: 所有线程共享的令牌桶限速
+- LatencyTracker: 最近若干次请求的延迟分位数（对冲请求的触发阈值、耗时统计）
+- HedgeBudget: 对冲请求预算，限制对冲请求占普通请求的比例
+"""
+
+import collections
+import math
+import random
+import threading
+import time
+
+from loguru import logger
+
+
+class PipelineAbortError(Exception):
+    """致命错误（API密钥无效、余额不足等），需要停止整个 Pipeline"""
+
+
+ERROR_FATAL = 'fatal'
+ERROR_SYSTEMIC = 'systemic'
+ERROR_TRANSIENT = 'transient'
+ERROR_PERMANENT = 'permanent'
+
+# CloudBypass 错误码分类
+FATAL_CODES = {'APIKEY_INVALID', 'INSUFFICIENT_BALANCE'}
+SYSTEMIC_CODES = {'PROXY_CONNECT_ABORTED'}
+TRANSIENT_CODES = {'CLOUDFLARE_CHALLENGE_TIMEOUT'}
+
+PERMANENT_STATUS = {400, 404, 410}
+
+
+def classify_error(code=None, status_code=None):
+    """根据错误码和 HTTP 状态码判断错误类型"""
+    if code in FATAL_CODES:
+        return ERROR_FATAL
+    if code in SYSTEMIC_CODES:
+        return ERROR_SYSTEMIC
+    if code in TRANSIENT_CODES:
+        return ERROR_TRANSIENT
+    if status_code in PERMANENT_STATUS:
+        return ERROR_PERMANENT
+    # 429 / 5xx / 请求异常 / 未知错误码：按临时错误处理
+    return ERROR_TRANSIENT
+
+
+def backoff_delay(attempt, base=1.0, cap=30.0):
+    """第 attempt 次（从 0 开始）重试前的等待时间：full jitter 指数退避"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """所有请求线程共享的熔断器"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=10, cooldown_seconds=60, max_cooldown_seconds=600, max_trips=5):
+        self.failure_threshold = failure_threshold  # 连续临时错误达到该数量时熔断
+        self.cooldown_seconds = cooldown_seconds
+        self.max_cooldown_seconds = max_cooldown_seconds
+        self.max_trips = max_trips  # 连续熔断次数上限，超过后视为致命错误
+
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.trips = 0
+        self.open_until = 0
+        self.abort_reason = None
+
+        self._probe_in_flight = False
+        self._cond = threading.Condition()
+
+    @property
+    def is_aborted(self):
+        return self.abort_reason is not None
+
+    def before_request(self):
+        """请求前调用：熔断时阻塞等待冷却；已中止时抛出 PipelineAbortError"""
+        with self._cond:
+            while True:
+                if self.abort_reason:
+                    raise PipelineAbortError(self.abort_reason)
+
+                if self.state == self.CLOSED:
+                    return
+
+                now = time.time()
+                if self.state == self.OPEN and now >= self.open_until:
+                    self.state = self.HALF_OPEN
+                    logger.info("熔断冷却结束，发送探测请求")
+
+                if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                    self._probe_in_flight = True
+                    return
+
+                timeout = max(0.1, self.open_until - now) if self.state == self.OPEN else 1
+                self._cond.wait(timeout)
+
+    def record_success(self):
+        with self._cond:
+            if self.state != self.CLOSED:
+                logger.success("探测请求成功，熔断恢复")
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self.trips = 0
+            self._probe_in_flight = False
+            self._cond.notify_all()
+
+    def record_failure(self, kind, reason=''):
+        """记录一次失败；系统性错误立即熔断，临时错误累计到阈值后熔断"""
+        with self._cond:
+            if kind == ERROR_FATAL:
+                self._abort(reason)
+                return
+
+            if kind == ERROR_PERMANENT:
+                # 页面本身的问题，与服务状态无关
+                self._probe_in_flight = False
+                self._cond.notify_all()
+                return
+
+            self.consecutive_failures += 1
+            probe_failed = self.state == self.HALF_OPEN
+            if kind == ERROR_SYSTEMIC or probe_failed or self.consecutive_failures >= self.failure_threshold:
+                self._trip(reason)
+            self._probe_in_flight = False
+            self._cond.notify_all()
+
+    def abort(self, reason):
+        with self._cond:
+            self._abort(reason)
+
+    def _abort(self, reason):
+        if not self.abort_reason:
+            logger.error(f"致命错误，停止所有请求: {reason}")
+        self.abort_reason = reason or '致命错误'
+        self._cond.notify_all()
+
+    def _trip(self, reason):
+        self.trips += 1
+        if self.trips > self.max_trips:
+            self._abort(f"连续熔断 {self.trips - 1} 次仍未恢复: {reason}")
+            return
+
+        cooldown = min(self.max_cooldown_seconds, self.cooldown_seconds * (2 ** (self.trips - 1)))
+        self.state = self.OPEN
+        self.open_until = time.time() + cooldown
+        logger.warning(f"⛔ 熔断（第 {self.trips} 次），所有请求暂停 {cooldown:.0f} 秒: {reason}")
+
+    def snapshot(self):
+        """当前状态（用于日志和监控）"""
+        with self._cond:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'trips': self.trips,
+                'aborted': self.is_aborted,
+                'abort_reason': self.abort_reason,
+            }
+
+
+class RateLimiter:
+    """所有请求线程共享的令牌桶限速器：平均每 interval 秒放行一个请求，最多允许 burst 个突发请求"""
+
+    def __init__(self, interval=0, burst=1):
+        self.interval = interval
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """请求前调用，必要时阻塞等待；返回等待的秒数"""
+        if not self.interval or self.interval <= 0:
+            return 0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) / self.interval)
+            self._last = now
+            # 令牌可以为负：预约后续的时间片，等待在锁外进行
+            self._tokens -= 1
+            wait = 0 if self._tokens >= 0 else -self._tokens * self.interval
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def try_acquire(self):
+        """不等待：有可用令牌时取走并返回 True，否则返回 False（用于可有可无的请求，如对冲请求）"""
+        if not self.interval or self.interval <= 0:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) / self.interval)
+            self._last = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class LatencyTracker:
+    """记录最近 window 次请求的耗时（秒），计算分位数"""
+
+    def __init__(self, window=500):
+        self._samples = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._samples)
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p):
+        """第 p 百分位（0-100）的耗时，没有样本时返回 None"""
+        return self.percentiles(p)[0]
+
+    def percentiles(self, *ps):
+        """一次计算多个分位数"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return [None] * len(ps)
+        return [samples[min(len(samples) - 1, max(0, math.ceil(p / 100 * len(samples)) - 1))] for p in ps]
+
+
+class HedgeBudget:
+    """对冲请求预算：每个普通请求积累 max_rate 个额度，每次对冲消耗 1 个，最多积累 burst 个"""
+
+    def __init__(self, max_rate=0.05, burst=5):
+        self.max_rate = max_rate
+        self.burst = burst
+        self._credits = 0.0
+        self._lock = threading.Lock()
+
+    def record_request(self):
+        with self._lock:
+            self._credits = min(self.burst, self._credits + self.max_rate)
+
+    def try_spend(self):
+        with self._lock:
+            if self._credits < 1:
+                return False
+            self._credits -= 1
+            return True
+
+    def refund(self):
+        with self._lock:
+            self._credits = min(self.burst, self._credits + 1)
@@ -0,0 +1,195 @@
+"""
+房源表的字典编码
+
+propertyguru 的每一行都重复保存代理名称 / 简介 / 主页、CEA、房型、产权、地铁信息、租/售类型等长字符串，
+这些列的取值统一存放在字典表 text_values 中，数据表只保存整数 id：
+
+- text_values: 字典表，每个不同的字符串一行（id INTEGER PRIMARY KEY, value UNIQUE）
+- listings:    实际存储；ENCODED_COLUMNS 保存为 <列名>_id，listing_id 为 INTEGER PRIMARY KEY
+               （VACUUM 不会改变，全文索引以它为 rowid）
+- propertyguru: 兼容视图，列名和顺序与原来的 propertyguru 表一致（SELECT * / 导出结果不变）；
+               INSTEAD OF 触发器把对视图的 INSERT / UPDATE / DELETE 转为对 listings 的写入，原有 SQL 不需要修改
+
+注意：
+- 通过视图写入时 cursor.rowcount 始终为 0（SQLite 不计入触发器中的修改），写入数需自行统计
+- url_path 不能通过视图修改；只改普通列的批量更新可以直接写 listings，跳过视图的触发器
+- 字典中不再被引用的值不会自动删除，由 prune_text_values 清理（见 PropertyGuruPipeline.compact_database）
+"""
+
+from models import AgentInfo, Listing
+
+# 视图的列（与原 propertyguru 表的列顺序一致）
+COLUMNS = Listing.FIELDS + ('created_at', 'updated_at', 'last_seen_at', 'missed_passes')
+
+# 字典编码的列：取值少、重复多（房型、产权、租/售、地铁信息）或随代理重复（代理名称 / 简介 / 主页、CEA）
+ENCODED_COLUMNS = (
+    'nearbyText', 'property_type', 'tenure', 'agent_name', 'agent_description', 'agent_url_path', 'CEA', 'buy_rent',
+)
+
+
+def storage_column(column):
+    """列在 listings 中的名字"""
+    return f'{column}_id' if column in ENCODED_COLUMNS else column
+
+
+def decode_sql(column, table=''):
+    """读取编码列的 SQL 表达式（按 id 在字典表中查找，主键查找）"""
+    return f"(SELECT value FROM text_values WHERE id = {table}{column}_id)"
+
+
+def encode_sql(value):
+    """value（SQL 表达式）在字典表中的 id；字典中没有时为 NULL"""
+    return f"(SELECT id FROM text_values WHERE value = {value})"
+
+
+def _intern_sql(ref, *columns):
+    """
+    把 ref（new）的编码列（默认全部）加入字典表
+
+    先检查是否已存在，不产生唯一约束冲突，外层语句的 ON CONFLICT（如 INSERT OR IGNORE）不影响字典
+    """
+    return '\n        '.join(
+        f"INSERT INTO text_values (value) SELECT {ref}.{column} "
+        f"WHERE {ref}.{column} IS NOT NULL AND NOT EXISTS (SELECT 1 FROM text_values WHERE value = {ref}.{column});"
+        for column in columns or ENCODED_COLUMNS
+    )
+
+
+# 编码列按写入方分组，每组一个 UPDATE OF 触发器：Step 2 更新代理信息（AgentInfo.UPDATE_SQL）只查 CEA 的字典，
+# 列表页更新（Listing.UPDATE_SQL）两组都触发；只改普通列的 UPDATE 不查字典
+_UPDATE_GROUPS = {
+    'agent_info': tuple(column for column in AgentInfo.FIELDS if column in ENCODED_COLUMNS),
+    'listing': tuple(column for column in ENCODED_COLUMNS if column not in AgentInfo.FIELDS),
+}
+
+_STORAGE_COLUMNS = [storage_column(column) for column in COLUMNS]
+_PLAIN_UPDATE_COLUMNS = [column for column in COLUMNS if column not in ENCODED_COLUMNS and column != 'url_path']
+
+
+def _insert_value(column):
+    if column in ENCODED_COLUMNS:
+        return encode_sql(f'new.{column}')
+    if column in ('created_at', 'updated_at'):
+        return f"COALESCE(new.{column}, CURRENT_TIMESTAMP)"
+    if column == 'missed_passes':
+        return "COALESCE(new.missed_passes, 0)"
+    return f'new.{column}'
+
+
+TABLE_SQL = (
+    '''
+    CREATE TABLE IF NOT EXISTS text_values (
+        id INTEGER PRIMARY KEY,
+        value TEXT NOT NULL UNIQUE
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS listings (
+        listing_id INTEGER PRIMARY KEY,
+        ID TEXT,
+        localizedTitle TEXT,
+        fullAddress TEXT,
+        price_pretty TEXT,
+        beds TEXT,
+        baths TEXT,
+        area_sqft TEXT,
+        price_psf TEXT,
+        nearbyText_id INTEGER REFERENCES text_values (id),
+        built_year TEXT,
+        property_type_id INTEGER REFERENCES text_values (id),
+        tenure_id INTEGER REFERENCES text_values (id),
+        url_path TEXT UNIQUE,
+        recency_text TEXT,
+        agent_id TEXT,
+        agent_name_id INTEGER REFERENCES text_values (id),
+        agent_description_id INTEGER REFERENCES text_values (id),
+        agent_url_path_id INTEGER REFERENCES text_values (id),
+        CEA_id INTEGER REFERENCES text_values (id),
+        mobile TEXT,
+        rating TEXT,
+        buy_rent_id INTEGER REFERENCES text_values (id),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_seen_at TIMESTAMP,
+        missed_passes INTEGER DEFAULT 0
+    )
+    ''',
+)
+
+VIEW_SQL = (
+    f'''
+    CREATE VIEW IF NOT EXISTS propertyguru AS
+    SELECT {', '.join(f'{decode_sql(column)} AS {column}' if column in ENCODED_COLUMNS else column
+                      for column in COLUMNS)}
+    FROM listings
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS propertyguru_insert INSTEAD OF INSERT ON propertyguru BEGIN
+        {_intern_sql('new')}
+        INSERT INTO listings ({', '.join(_STORAGE_COLUMNS)})
+        VALUES ({', '.join(_insert_value(column) for column in COLUMNS)});
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS propertyguru_update INSTEAD OF UPDATE ON propertyguru BEGIN
+        UPDATE listings SET {', '.join(f'{column} = new.{column}' for column in _PLAIN_UPDATE_COLUMNS)}
+        WHERE url_path = old.url_path;
+    END
+    ''',
+) + tuple(
+    f'''
+    CREATE TRIGGER IF NOT EXISTS propertyguru_update_{group} INSTEAD OF UPDATE OF {', '.join(columns)} ON propertyguru
+    BEGIN
+        {_intern_sql('new', *columns)}
+        UPDATE listings SET {', '.join(f'{column}_id = {encode_sql(f"new.{column}")}' for column in columns)}
+        WHERE url_path = old.url_path;
+    END
+    '''
+    for group, columns in _UPDATE_GROUPS.items()
+) + (
+    '''
+    CREATE TRIGGER IF NOT EXISTS propertyguru_delete INSTEAD OF DELETE ON propertyguru BEGIN
+        DELETE FROM listings WHERE url_path = old.url_path;
+    END
+    ''',
+)
+
+SCHEMA_SQL = TABLE_SQL + VIEW_SQL
+
+
+def has_legacy_table(cursor):
+    """propertyguru 是否还是旧版本的普通表（未编码）"""
+    row = cursor.execute("SELECT type FROM sqlite_master WHERE name = 'propertyguru'").fetchone()
+    return row is not None and row[0] == 'table'
+
+
+def migrate(cursor, table='propertyguru'):
+    """
+    把旧版本的 propertyguru 表（列与 COLUMNS 相同）复制到 listings 后删除，返回迁移的记录数
+
+    listing_id 沿用原表的 rowid。调用方负责事务（复制和删除在同一事务中提交），
+    之后执行 VIEW_SQL 创建兼容视图；原表上的触发器随表一起删除
+    """
+    for sql in TABLE_SQL:
+        cursor.execute(sql)
+    cursor.execute(
+        "INSERT OR IGNORE INTO text_values (value) "
+        + ' UNION '.join(f"SELECT {column} FROM {table} WHERE {column} IS NOT NULL" for column in ENCODED_COLUMNS)
+    )
+    values = ', '.join(encode_sql(f'p.{column}') if column in ENCODED_COLUMNS else f'p.{column}'
+                       for column in COLUMNS)
+    cursor.execute(
+        f"INSERT INTO listings (listing_id, {', '.join(_STORAGE_COLUMNS)}) SELECT p.rowid, {values} FROM {table} p"
+    )
+    count = cursor.rowcount
+    cursor.execute(f"DROP TABLE {table}")
+    return count
+
+
+def prune_text_values(cursor):
+    """删除字典中不再被 listings 引用的值（调用方负责事务），返回删除的个数"""
+    used = ' UNION ALL '.join(
+        f"SELECT {column}_id FROM listings WHERE {column}_id IS NOT NULL" for column in ENCODED_COLUMNS
+    )
+    cursor.execute(f"DELETE FROM text_values WHERE id NOT IN ({used})")
+    return cursor.rowcount
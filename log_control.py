@@ -0,0 +1,264 @@
+"""
+日志输出控制：后台批量写日志、逐条日志采样、定时进度汇总
+
+- setup_logging: 日志消息格式化后放入内存队列，由后台线程按批写出（文件 / 控制台），
+  工作线程不再等待磁盘 / 终端 IO；日志文件按大小轮转，旧文件压缩，超过保留期的删除
+- BatchedWriter / RotatingFileWriter: 上述后台批量写出的 loguru sink；
+  ERROR 及以上的日志立即唤醒写线程，进程退出时 loguru 停止 sink，写出队列中剩余的日志
+- LogSampler: 逐条记录的日志（插入成功、详情页成功 / 跳过等）只输出第 1 条和之后每 N 条，
+  失败和警告不采样
+- ProgressReporter: 按时间间隔输出一次汇总进度（已处理数、成功 / 失败 / 跳过、速率、预计剩余时间），
+  替代按条数输出的进度日志
+
+注：loguru 自带的 enqueue=True 通过 multiprocessing 队列传递（每条日志都要 pickle），
+多线程下比同步写文件更慢，因此这里使用进程内队列。
+"""
+
+import collections
+import glob
+import gzip
+import itertools
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+import zipfile
+from datetime import datetime
+
+from loguru import logger
+
+_logging_configured = False
+
+_SIZE_UNITS = {'B': 1, 'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3}
+_DURATION_UNITS = {'hour': 3600, 'day': 86400, 'week': 7 * 86400}
+
+
+def parse_size(value):
+    """'500 MB' -> 字节数；None / 空字符串返回 None，格式不合法时抛出 ValueError"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*(B|KB|MB|GB)\s*', str(value), re.I)
+    if not match:
+        raise ValueError(f"无法解析为文件大小（如 500 MB）: {value!r}")
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2).upper()])
+
+
+def parse_retention(value):
+    """'30 days' -> 秒数；整数表示保留的旧文件个数（返回 int）；None / 空字符串返回 None"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, int):
+        return value
+    text = str(value).strip()
+    if text.isdigit():
+        return int(text)
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)\s*(hour|day|week)s?', text, re.I)
+    if not match:
+        raise ValueError(f"无法解析为保留时间（如 30 days）或文件个数: {value!r}")
+    return float(match.group(1)) * _DURATION_UNITS[match.group(2).lower()]
+
+
+class BatchedWriter:
+    """
+    loguru sink：调用方只把格式化后的消息追加到队列，后台线程每 flush_interval 秒批量写出一次
+
+    stream 为已打开的文本流（如 sys.stderr）；子类可重写 _open / _after_write 写文件
+    """
+
+    def __init__(self, stream=None, flush_interval=1.0):
+        self.flush_interval = flush_interval
+        self._stream = stream
+        self._pending = collections.deque()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._write_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name=f"log-writer-{id(self):x}", daemon=True)
+        self._thread.start()
+
+    def write(self, message):
+        self._pending.append(message)
+        if message.record['level'].no >= 40:  # ERROR 及以上尽快写出
+            self._wakeup.set()
+
+    def stop(self):
+        """loguru 移除 sink（包括进程退出）时调用：写出剩余日志并关闭"""
+        self._stopped = True
+        self._wakeup.set()
+        self._thread.join(timeout=5)
+        self._flush_pending()
+        self._close()
+
+    def _flush_pending(self):
+        with self._write_lock:
+            batch = []
+            while self._pending:
+                batch.append(self._pending.popleft())
+            if not batch:
+                return
+            stream = self._stream or self._open()
+            stream.write(''.join(batch))
+            stream.flush()
+            self._after_write()
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self._flush_pending()
+            except Exception as e:
+                sys.stderr.write(f"日志写出失败: {e}\n")
+
+    def _open(self):
+        return self._stream
+
+    def _after_write(self):
+        pass
+
+    def _close(self):
+        pass
+
+
+class RotatingFileWriter(BatchedWriter):
+    """批量写日志文件；超过 rotation 字节后轮转，旧文件按 compression 压缩，按 retention 清理"""
+
+    def __init__(self, path, rotation=None, retention=None, compression=None, flush_interval=1.0,
+                 encoding='utf-8'):
+        self.path = path
+        self.rotation = parse_size(rotation)
+        self.retention = parse_retention(retention)
+        self.compression = compression
+        self.encoding = encoding
+        super().__init__(None, flush_interval)
+
+    def _open(self):
+        if self._stream is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._stream = open(self.path, 'a', encoding=self.encoding)
+        return self._stream
+
+    def _after_write(self):
+        if self.rotation and self._stream.tell() >= self.rotation:
+            self._rotate()
+
+    def _close(self):
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+    def _rotate(self):
+        self._close()
+        root, ext = os.path.splitext(self.path)
+        rotated = f"{root}.{datetime.now().strftime('%Y-%m-%d_%H-%M-%S_%f')}{ext}"
+        os.replace(self.path, rotated)
+
+        if self.compression == 'gz':
+            with open(rotated, 'rb') as src, gzip.open(rotated + '.gz', 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(rotated)
+        elif self.compression == 'zip':
+            with zipfile.ZipFile(rotated + '.zip', 'w', zipfile.ZIP_DEFLATED) as archive:
+                archive.write(rotated, os.path.basename(rotated))
+            os.remove(rotated)
+        self._cleanup(root, ext)
+
+    def _cleanup(self, root, ext):
+        if self.retention is None:
+            return
+        old_files = sorted(glob.glob(f"{glob.escape(root)}.*{ext}*"), key=os.path.getmtime, reverse=True)
+        if isinstance(self.retention, int):
+            expired = old_files[self.retention:]
+        else:
+            cutoff = time.time() - self.retention
+            expired = [path for path in old_files if os.path.getmtime(path) < cutoff]
+        for path in expired:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def setup_logging(log_file="logs/propertyguru_pipeline.log", level="INFO", rotation=None, retention=None,
+                  compression=None, enqueue=True, flush_interval=1.0, console_level="INFO"):
+    """
+    添加日志文件输出并替换默认的控制台输出（重复调用只生效一次）；导入模块本身不修改日志配置
+
+    - enqueue: 由后台线程批量写出（见 BatchedWriter）；False 时使用 loguru 自带的同步文件 sink
+    - flush_interval: 后台写出间隔（秒）
+    - rotation / retention / compression: 如 '500 MB' / '30 days'（或保留文件个数）/ 'gz'
+    - console_level: 控制台日志级别，None 保留 loguru 默认的控制台输出
+    """
+    global _logging_configured
+    if _logging_configured:
+        return
+    os.makedirs(os.path.dirname(log_file) or '.', exist_ok=True)
+
+    if console_level:
+        try:
+            logger.remove(0)  # loguru 默认的 stderr 输出（DEBUG 级别，同步写）
+        except ValueError:
+            pass  # 已被调用方移除或替换
+        else:
+            console = BatchedWriter(sys.stderr, flush_interval) if enqueue else sys.stderr
+            logger.add(console, level=console_level, colorize=sys.stderr.isatty())
+
+    if enqueue:
+        logger.add(RotatingFileWriter(log_file, rotation, retention, compression, flush_interval), level=level)
+    else:
+        logger.add(log_file, level=level, rotation=rotation, retention=retention, compression=compression,
+                   encoding='utf-8')
+    _logging_configured = True
+
+
+class LogSampler:
+    """逐条日志采样：同一类日志只放行第 1 条和之后每 every 条（every <= 1 时全部放行）"""
+
+    def __init__(self, every=1):
+        self.every = every
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def sample(self, key):
+        if self.every <= 1:
+            return True
+        counter = self._counters.get(key)
+        if counter is None:
+            with self._lock:
+                counter = self._counters.setdefault(key, itertools.count())
+        return next(counter) % self.every == 0
+
+
+class ProgressReporter:
+    """定时汇总进度：由汇总结果的线程调用 update，距上次输出超过 interval 秒时输出一行"""
+
+    def __init__(self, label, total=None, interval=30):
+        self.label = label
+        self.total = total
+        self.interval = interval
+        self.start_time = time.monotonic()
+        self._last_log = self.start_time
+
+    def update(self, done, success=None, failed=None, skipped=None, extra=None):
+        now = time.monotonic()
+        if now - self._last_log < self.interval:
+            return
+        self._last_log = now
+
+        elapsed = now - self.start_time
+        rate = done / elapsed if elapsed > 0 else 0.0
+        parts = [f"{self.label} 进度: {done}/{self.total}" if self.total else f"{self.label} 进度: {done}"]
+        for name, value in (('成功', success), ('失败', failed), ('跳过', skipped)):
+            if value is not None:
+                parts.append(f"{name}: {value}")
+        parts.append(f"速率: {rate:.1f} 条/秒")
+        if self.total and rate > 0:
+            parts.append(f"预计剩余: {(self.total - done) / rate / 60:.1f} 分钟")
+        if callable(extra):
+            extra = extra()  # 只在输出时才计算（如需要查询数据库的统计）
+        if extra:
+            parts.append(str(extra))
+        logger.info(" | ".join(parts))
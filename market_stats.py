@@ -0,0 +1,262 @@
+"""
+市场统计汇总表（增量维护）
+
+- 按 租/售 × 房型 × 产权 × 最近地铁站 汇总房源数、价格 / 尺价（psf）的计数与总和；
+  每条房源同时计入所有维度组合（'*' 表示不区分该维度），查询任意一个分组只读汇总表中的一行，
+  与房源总数无关
+- 中位数等分位数用对数分桶直方图近似（DDSketch 的思路）：相对误差不超过 RELATIVE_ACCURACY；
+  桶计数可加可减，房源更新时先减去旧值再加上新值
+- 每个分组一行：计数、总和和序列化的分桶直方图（load_sketch / dump_sketch）；MarketStatsDelta 先在内存中合并
+  同一批房源的增量，再与房源写入在同一个事务中读出受影响的分组、合并后写回
+"""
+
+import math
+import re
+import sys
+from array import array
+from collections import Counter
+from itertools import product
+from operator import itemgetter
+
+from models import Listing
+from scheduling import parse_price
+
+ALL = '*'
+DIMENSIONS = ('property_type', 'tenure', 'mrt')
+
+# 计算汇总需要的 propertyguru 列（按此顺序取值）
+STATS_COLUMNS = ('buy_rent', 'property_type', 'tenure', 'nearbyText', 'price_pretty', 'price_psf')
+row_stats_values = itemgetter(*(Listing.FIELDS.index(column) for column in STATS_COLUMNS))
+row_url_path = itemgetter(Listing.FIELDS.index('url_path'))
+
+RELATIVE_ACCURACY = 0.01
+_GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(_GAMMA)
+
+NO_MRT = '无地铁'
+# 维度值为空（列表页 JSON 中为 null）时的分组名：主键中的 NULL 互不相等，按主键合并 / 删除分组时匹配不到
+UNKNOWN = '未知'
+_MRT_RE = re.compile(r'\bfrom\s+(.+?)\s*$', re.I)
+_STATION_CODES_RE = re.compile(r'^(?:[A-Z]{1,3}\d+[A-Z]?\s*/\s*)*[A-Z]{1,3}\d+[A-Z]?\s+')
+
+SCHEMA_SQL = (
+    '''
+    CREATE TABLE IF NOT EXISTS market_stats (
+        buy_rent TEXT,
+        property_type TEXT,
+        tenure TEXT,
+        mrt TEXT,
+        listing_count INTEGER DEFAULT 0,
+        price_count INTEGER DEFAULT 0,
+        price_sum REAL DEFAULT 0,
+        psf_count INTEGER DEFAULT 0,
+        psf_sum REAL DEFAULT 0,
+        price_sketch BLOB,
+        psf_sketch BLOB,
+        updated_at TIMESTAMP,
+        PRIMARY KEY (buy_rent, property_type, tenure, mrt)
+    )
+    ''',
+)
+
+GROUP_COLUMNS = ('buy_rent', 'property_type', 'tenure', 'mrt', 'listing_count', 'price_count', 'price_sum',
+                 'psf_count', 'psf_sum', 'price_sketch', 'psf_sketch')
+SELECT_GROUPS_SQL = f"SELECT {', '.join(GROUP_COLUMNS)} FROM market_stats"
+_REPLACE_GROUP_SQL = (
+    f"INSERT OR REPLACE INTO market_stats ({', '.join(GROUP_COLUMNS)}, updated_at) "
+    f"VALUES ({', '.join('?' * (len(GROUP_COLUMNS) + 1))})"
+)
+_DELETE_GROUP_SQL = "DELETE FROM market_stats WHERE buy_rent = ? AND property_type = ? AND tenure = ? AND mrt = ?"
+# 旧版本写入的维度为 NULL 的分组（升级时据此重建汇总表）
+NULL_GROUP_SQL = (
+    "SELECT 1 FROM market_stats WHERE buy_rent IS NULL OR property_type IS NULL OR tenure IS NULL OR mrt IS NULL LIMIT 1"
+)
+
+
+def nearest_mrt(nearby_text):
+    """从地铁信息（如 '5 min (400 m) from EW1 Pasir Ris MRT'）中取出车站名（'Pasir Ris MRT'）"""
+    if not nearby_text or not isinstance(nearby_text, str):
+        return NO_MRT
+    match = _MRT_RE.search(nearby_text)
+    if not match:
+        return nearby_text.strip() or NO_MRT
+    return _STATION_CODES_RE.sub('', match.group(1)) or match.group(1)
+
+
+def bucket_index(value):
+    """value（> 0）所在的对数分桶"""
+    return math.ceil(math.log(value) / _LOG_GAMMA)
+
+
+def bucket_value(index):
+    """分桶的代表值（与桶内任意值的相对误差不超过 RELATIVE_ACCURACY）"""
+    return 2 * _GAMMA ** index / (_GAMMA + 1)
+
+
+def load_sketch(blob):
+    """BLOB -> int32 数组 [起始分桶, 计数, 计数, ...]；没有数据时返回空数组"""
+    values = array('i')
+    if blob:
+        values.frombytes(blob)
+        if sys.byteorder == 'big':
+            values.byteswap()
+    return values
+
+
+def dump_sketch(values):
+    """load_sketch 的逆过程（小端存储），去掉两端计数为 0 的分桶，全部为 0 时返回 None"""
+    first = next((i for i in range(1, len(values)) if values[i]), None)
+    if first is None:
+        return None
+    last = next(i for i in range(len(values) - 1, 0, -1) if values[i])
+    if first > 1 or last < len(values) - 1:
+        values = array('i', [values[0] + first - 1]) + values[first:last + 1]
+    if sys.byteorder == 'big':
+        values = array('i', values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def merge_sketch(blob, changes):
+    """把 {分桶: 计数增量} 合并进序列化的直方图，返回新的 BLOB（只改动涉及的分桶，不展开整个直方图）"""
+    changes = {index: count for index, count in changes.items() if count}
+    if not changes:
+        return blob
+    values = load_sketch(blob)
+    low, high = min(changes), max(changes)
+    if values:
+        low, high = min(low, values[0]), max(high, values[0] + len(values) - 2)
+        if low < values[0]:
+            values = array('i', [low]) + array('i', [0]) * (values[0] - low) + values[1:]
+        values.extend(array('i', [0]) * (high - low + 2 - len(values)))
+    else:
+        values = array('i', [low]) + array('i', [0]) * (high - low + 1)
+    for index, count in changes.items():
+        values[index - low + 1] += count
+    return dump_sketch(values)
+
+
+def _positive(value):
+    return value if value and value > 0 else None
+
+
+def group_keys(buy_rent, property_type, tenure, mrt):
+    """一条房源计入的所有分组：租/售固定，其余每个维度取自身的值（为空时取 UNKNOWN）或 '*'"""
+    return set(product((buy_rent or UNKNOWN,), (property_type or UNKNOWN, ALL), (tenure or UNKNOWN, ALL),
+                       (mrt or UNKNOWN, ALL)))
+
+
+class MarketStatsDelta:
+    """
+    一批房源对汇总表的增量
+
+    同一分组的增量先在内存中合并，apply 时每个分组只读一行、写一行（分桶直方图整体序列化在该行中），
+    一页房源只涉及几十个分组
+    """
+
+    __slots__ = ('groups',)
+
+    def __init__(self):
+        # 分组 -> [房源数, 价格数, 价格和, 尺价数, 尺价和, 价格分桶 Counter, 尺价分桶 Counter]
+        self.groups = {}
+
+    def add(self, values, sign=1):
+        """values: 按 STATS_COLUMNS 顺序的一行；sign=-1 表示减去（记录被更新前的旧值）"""
+        buy_rent, property_type, tenure, nearby_text, price_pretty, price_psf = values
+        price = _positive(parse_price(price_pretty))
+        psf = _positive(parse_price(price_psf))
+        price_bucket = bucket_index(price) if price else None
+        psf_bucket = bucket_index(psf) if psf else None
+
+        for key in group_keys(buy_rent, property_type, tenure, nearest_mrt(nearby_text)):
+            group = self.groups.get(key)
+            if group is None:
+                group = self.groups[key] = [0, 0, 0.0, 0, 0.0, Counter(), Counter()]
+            group[0] += sign
+            if price:
+                group[1] += sign
+                group[2] += sign * price
+                group[5][price_bucket] += sign
+            if psf:
+                group[3] += sign
+                group[4] += sign * psf
+                group[6][psf_bucket] += sign
+
+    def remove(self, values):
+        self.add(values, sign=-1)
+
+    def __bool__(self):
+        return bool(self.groups)
+
+    def apply(self, cursor, now):
+        """
+        把增量合并进汇总表（调用方负责事务），房源数降为 0 的分组删除
+
+        房源先于汇总表写入，执行到这里时本事务已持有写锁，读出的当前值不会被其他连接并发修改
+        """
+        changed = [key for key, group in self.groups.items()
+                   if any(group[:5]) or any(group[5].values()) or any(group[6].values())]
+        current = {}
+        for i in range(0, len(changed), 200):
+            chunk = changed[i:i + 200]
+            placeholders = ', '.join(['(?, ?, ?, ?)'] * len(chunk))
+            # 与 VALUES 连接（按主键逐个查找）；写成 (...) IN (VALUES ...) 时 SQLite 会扫描全表
+            cursor.execute(f'''
+                WITH changed (buy_rent, property_type, tenure, mrt) AS (VALUES {placeholders})
+                SELECT {', '.join(f'm.{column}' for column in GROUP_COLUMNS)}
+                FROM changed JOIN market_stats m USING (buy_rent, property_type, tenure, mrt)
+            ''', [value for key in chunk for value in key])
+            current.update((row[:4], row[4:]) for row in cursor.fetchall())
+
+        replaced, deleted = [], []
+        for key in changed:
+            delta = self.groups[key]
+            listing_count, price_count, price_sum, psf_count, psf_sum, price_sketch, psf_sketch = (
+                current.get(key) or (0, 0, 0.0, 0, 0.0, None, None))
+            listing_count += delta[0]
+            if listing_count <= 0:
+                if key in current:
+                    deleted.append(key)
+                continue
+            replaced.append(key + (
+                listing_count, price_count + delta[1], price_sum + delta[2], psf_count + delta[3],
+                psf_sum + delta[4], merge_sketch(price_sketch, delta[5]), merge_sketch(psf_sketch, delta[6]), now,
+            ))
+        cursor.executemany(_REPLACE_GROUP_SQL, replaced)
+        cursor.executemany(_DELETE_GROUP_SQL, deleted)
+
+
+def quantile(values, q):
+    """从 load_sketch 的结果估计 q 分位数"""
+    total = sum(values) - values[0] if values else 0
+    if total <= 0:
+        return None
+    rank = q * (total - 1)
+    seen = 0
+    for i in range(1, len(values)):
+        seen += values[i]
+        if seen > rank:
+            return bucket_value(values[0] + i - 1)
+    return bucket_value(values[0] + len(values) - 2)
+
+
+def summarize(row):
+    """一个分组的统计结果，row 为 market_stats 的一行（GROUP_COLUMNS 顺序）"""
+    (buy_rent, property_type, tenure, mrt, listing_count,
+     price_count, price_sum, psf_count, psf_sum, price_sketch, psf_sketch) = row
+    stats = {
+        'buy_rent': buy_rent,
+        'property_type': property_type,
+        'tenure': tenure,
+        'mrt': mrt,
+        'listing_count': listing_count,
+    }
+    for metric, count, total, sketch in (('price', price_count, price_sum, price_sketch),
+                                         ('psf', psf_count, psf_sum, psf_sketch)):
+        values = load_sketch(sketch)
+        stats[f'{metric}_count'] = count
+        stats[f'{metric}_mean'] = round(total / count, 2) if count else None
+        for name, q in (('p25', 0.25), ('median', 0.5), ('p75', 0.75)):
+            value = quantile(values, q)
+            stats[f'{metric}_{name}'] = round(value, 2) if value is not None else None
+    return stats
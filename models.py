@@ -0,0 +1,244 @@
+"""
+房源记录模型
+
+- Listing: 列表页的一条房源，字段顺序与 propertyguru 表的列一致，直接生成 INSERT / UPDATE 参数
+- AgentInfo: Step 2 详情页解析出的代理信息
+- extract_listing_columns: 把整页 listingsData 转为按列组织的 list，供 executemany 批量写库
+
+两个类都使用 __slots__，并提供 get() 以兼容按键读取的旧代码。
+"""
+
+from operator import attrgetter
+
+
+class Listing:
+    """列表页解析出的一条房源记录"""
+
+    FIELDS = (
+        'ID', 'localizedTitle', 'fullAddress', 'price_pretty', 'beds', 'baths',
+        'area_sqft', 'price_psf', 'nearbyText', 'built_year', 'property_type',
+        'tenure', 'url_path', 'recency_text', 'agent_id', 'agent_name',
+        'agent_description', 'agent_url_path', 'CEA', 'mobile', 'rating', 'buy_rent',
+    )
+    __slots__ = FIELDS
+
+    INSERT_SQL = (
+        f"INSERT INTO propertyguru ({', '.join(FIELDS)}) VALUES ({', '.join('?' * len(FIELDS))})"
+    )
+    INSERT_OR_IGNORE_SQL = INSERT_SQL.replace('INSERT INTO', 'INSERT OR IGNORE INTO', 1)
+    UPDATE_SQL = (
+        f"UPDATE propertyguru SET {', '.join(f'{field}=?' for field in FIELDS if field != 'url_path')}, "
+        f"updated_at=? WHERE url_path = ?"
+    )
+
+    def __init__(self, ID='无id', localizedTitle='无标题', fullAddress='无地址', price_pretty='无价格',
+                 beds='未知', baths='未知', area_sqft='未知', price_psf='未知', nearbyText='无地铁',
+                 built_year='未知', property_type='未知', tenure='未知', url_path='',
+                 recency_text='无更新时间', agent_id='无id', agent_name='无名字', agent_description='无描述',
+                 agent_url_path=None, CEA='', mobile='', rating='', buy_rent='无buy_rent'):
+        self.ID = ID
+        self.localizedTitle = localizedTitle
+        self.fullAddress = fullAddress
+        self.price_pretty = price_pretty
+        self.beds = beds
+        self.baths = baths
+        self.area_sqft = area_sqft
+        self.price_psf = price_psf
+        self.nearbyText = nearbyText
+        self.built_year = built_year
+        self.property_type = property_type
+        self.tenure = tenure
+        self.url_path = url_path
+        self.recency_text = recency_text
+        self.agent_id = agent_id
+        self.agent_name = agent_name
+        self.agent_description = agent_description
+        self.agent_url_path = agent_url_path
+        self.CEA = CEA
+        self.mobile = mobile
+        self.rating = rating
+        self.buy_rent = buy_rent
+
+    @classmethod
+    def from_listing_data(cls, listingData, buy_rent):
+        """从 listingsData[i]['listingData'] 构建记录"""
+        return cls(*extract_listing(listingData, buy_rent))
+
+    @classmethod
+    def from_dict(cls, data):
+        """从按列名组织的 dict 构建记录（缺少的字段使用默认占位值）"""
+        return cls(**{field: data[field] for field in cls.FIELDS if field in data})
+
+    def insert_params(self):
+        """INSERT_SQL 的参数"""
+        return _listing_values(self)
+
+    def update_params(self, updated_at):
+        """UPDATE_SQL 的参数"""
+        return update_params(_listing_values(self), updated_at)
+
+    def get(self, key, default=None):
+        """兼容 dict 的按键读取"""
+        return getattr(self, key, default)
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def __repr__(self):
+        return f"Listing(url_path={self.url_path!r}, ID={self.ID!r})"
+
+
+_listing_values = attrgetter(*Listing.FIELDS)
+_URL_PATH_INDEX = Listing.FIELDS.index('url_path')
+
+
+def update_params(values, updated_at):
+    """把按 FIELDS 顺序排列的一行转为 UPDATE_SQL 的参数"""
+    return values[:_URL_PATH_INDEX] + values[_URL_PATH_INDEX + 1:] + (updated_at, values[_URL_PATH_INDEX])
+
+
+class AgentInfo:
+    """详情页解析出的代理信息"""
+
+    FIELDS = ('CEA', 'mobile', 'rating')
+    __slots__ = FIELDS + ('url_path',)
+
+    UPDATE_SQL = "UPDATE propertyguru SET CEA=?, mobile=?, rating=?, updated_at=? WHERE url_path = ?"
+
+    def __init__(self, CEA='', mobile='', rating='', url_path=None):
+        self.CEA = CEA
+        self.mobile = mobile
+        self.rating = rating
+        self.url_path = url_path
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get('CEA', ''), data.get('mobile', ''), data.get('rating', ''), data.get('url_path'))
+
+    def values(self):
+        """(CEA, mobile, rating)"""
+        return self.CEA, self.mobile, self.rating
+
+    def update_params(self, updated_at, url_path=None):
+        """UPDATE_SQL 的参数"""
+        return self.CEA, self.mobile, self.rating, updated_at, url_path or self.url_path
+
+    def get(self, key, default=None):
+        """兼容 dict 的按键读取"""
+        return getattr(self, key, default)
+
+    def to_dict(self):
+        return {'CEA': self.CEA, 'mobile': self.mobile, 'rating': self.rating}
+
+    def __repr__(self):
+        return f"AgentInfo(CEA={self.CEA!r}, mobile={self.mobile!r}, rating={self.rating!r})"
+
+
+def extract_listing_columns(listingsData, buy_rent):
+    """
+    把整页 listingsData 转为列：{字段名: [值, ...]}，字段与 Listing.FIELDS 一致
+
+    不为每条房源创建 Listing 对象；写库时用 listing_rows 取出需要的行交给 executemany
+    """
+    rows = [extract_listing(item.get('listingData') or {}, buy_rent) for item in listingsData]
+    if not rows:
+        return {field: [] for field in Listing.FIELDS}
+    return dict(zip(Listing.FIELDS, map(list, zip(*rows))))
+
+
+def listing_rows(columns, indexes=None):
+    """从 extract_listing_columns 的结果中取出行（按 Listing.FIELDS 顺序的元组），indexes 为 None 时取全部"""
+    ordered = [columns[field] for field in Listing.FIELDS]
+    if indexes is None:
+        return list(zip(*ordered))
+    return [tuple(column[i] for column in ordered) for i in indexes]
+
+
+def extract_listing(listingData, buy_rent):
+    """从 listingsData[i]['listingData'] 中提取一条房源，返回按 Listing.FIELDS 顺序排列的元组"""
+    get = listingData.get
+    beds = "未知"
+    baths = "未知"
+    area_sqft = "未知"
+    price_psf = "未知"
+
+    bedrooms = get('bedrooms')
+    if bedrooms is not None and bedrooms >= 0:
+        beds = f"{bedrooms} Beds"
+
+    bathrooms = get('bathrooms')
+    if bathrooms is not None and bathrooms >= 0:
+        baths = f"{bathrooms} Baths"
+
+    floorArea = get('floorArea')
+    if floorArea:
+        area_sqft = f"{floorArea} sqft"
+
+    pricePerArea = (get('pricePerArea') or {}).get('localeStringValue')
+    if pricePerArea:
+        price_psf = f"S$ {pricePerArea} psf"
+
+    for feature_item in get('listingFeatures') or ():
+        if isinstance(feature_item, list):
+            for sub_feature in feature_item:
+                text = sub_feature.get("text", "")
+                if "sqft" in text and area_sqft == "未知":
+                    area_sqft = text
+        elif isinstance(feature_item, dict):
+            text = feature_item.get("text", "")
+            icon_name = feature_item.get("iconName", "")
+
+            if icon_name == "bed-o" and beds == "未知":
+                beds = text
+            elif icon_name == "bath-o" and baths == "未知":
+                baths = text
+            elif icon_name == "room-o" and beds == "未知":
+                beds = text
+            elif "sqft" in text and area_sqft == "未知":
+                area_sqft = text
+
+    built_year = "未知"
+    property_type = "未知"
+    tenure = "未知"
+    for badge in get("badges") or ():
+        badge_name = badge.get("name", "")
+        badge_text = badge.get("text", "")
+
+        if badge_name == "launch" and "Built:" in badge_text:
+            built_year = badge_text
+        elif badge_name == "unit_type":
+            property_type = badge_text
+        elif badge_name == "tenure":
+            tenure = badge_text
+
+    if tenure == '未知':
+        additional = get('additionalData')
+        if isinstance(additional, dict):
+            tenure = additional.get('tenure', '未知')
+
+    agent = get("agent") or {}
+    return (
+        get('id', '无id'),
+        get('localizedTitle', '无标题'),
+        get('fullAddress', '无地址'),
+        (get('price') or {}).get('pretty', '无价格'),
+        beds,
+        baths,
+        area_sqft,
+        price_psf,
+        (get("mrt") or {}).get('nearbyText', '无地铁'),
+        built_year,
+        property_type,
+        tenure,
+        get("url", "").replace('https://www.propertyguru.com.sg/', ''),
+        (get("recency") or {}).get("text", '无更新时间'),
+        agent.get("id", '无id'),
+        agent.get("name", '无名字'),
+        agent.get("description", '无描述'),
+        agent.get("profileUrl"),
+        '',
+        '',
+        '',
+        buy_rent,
+    )
+
@@ -0,0 +1,150 @@
+"""
+__NEXT_DATA__ 局部解析
+
+列表页 / 详情页的 __NEXT_DATA__ 是一个很大的 JSON，而实际只用到其中很小的几棵子树：
+- 列表页：props.pageProps.pageData.data.listingsData 和分页信息
+- 详情页：contactAgentData.contactAgentCard.agentInfoProps
+
+这里不对整个 JSON 调用 json.loads，而是在原始文本中定位子树的键，
+用 json.JSONDecoder.raw_decode 只解码该子树，其余部分不构建任何 Python 对象。
+定位失败（页面结构变化）时回退到完整解析，保证结果与完整解析一致。
+"""
+
+import json
+import re
+
+_DECODER = json.JSONDecoder()
+_SCRIPT_OPEN_RE = re.compile(r'<script id="__NEXT_DATA__" type="application/json"[^>]*>')
+_PAGINATION_KEY_RE = re.compile(r'"(\w*[Pp]agination\w*)"\s*:\s*(?=\{)')
+
+_key_patterns = {}
+
+
+def _key_pattern(key):
+    pattern = _key_patterns.get(key)
+    if pattern is None:
+        # JSON 字符串中的引号会被转义为 \"，因此 "key": 只会匹配到真正的键
+        pattern = _key_patterns[key] = re.compile(r'"%s"\s*:\s*' % re.escape(key))
+    return pattern
+
+
+def locate(text):
+    """返回 __NEXT_DATA__ 脚本内容在 text 中的 (start, end)，找不到时返回 None"""
+    match = _SCRIPT_OPEN_RE.search(text)
+    if not match:
+        return None
+    end = text.find('</script>', match.end())
+    if end < 0:
+        return None
+    return match.end(), end
+
+
+def extract_value(text, key, start=0, end=None, after=None):
+    """
+    解码 text[start:end] 中第一个 "key": 对应的值
+
+    after: 先定位到该键，再从其后查找 key（用于限定在某棵子树内）
+    找不到或解码失败时返回 None
+    """
+    end = len(text) if end is None else end
+    if after:
+        match = _key_pattern(after).search(text, start, end)
+        if not match:
+            return None
+        start = match.end()
+
+    match = _key_pattern(key).search(text, start, end)
+    if not match:
+        return None
+    try:
+        value, _ = _DECODER.raw_decode(text, match.end())
+    except ValueError:
+        return None
+    return value
+
+
+def extract_build_id(text, start=0, end=None):
+    """读取 buildId（位于 __NEXT_DATA__ 末尾，从后往前查找）"""
+    end = len(text) if end is None else end
+    pos = text.rfind('"buildId"', start, end)
+    if pos < 0:
+        return None
+    value = extract_value(text, 'buildId', pos, end)
+    return value if isinstance(value, str) else None
+
+
+def _dig(data, *keys):
+    for key in keys:
+        if not isinstance(data, dict):
+            return {}
+        data = data.get(key, {})
+    return data
+
+
+def parse_list_page(text):
+    """
+    解析列表页 HTML
+
+    返回 dict: listings（listingsData 列表）、pagination（形如 pageData.data 的部分字典，
+    只包含名称带 pagination 的子树）、build_id、span（__NEXT_DATA__ 在 text 中的位置）；
+    页面中没有 __NEXT_DATA__ 时返回 None
+    """
+    span = locate(text)
+    if span is None:
+        return None
+    start, end = span
+
+    listings = extract_value(text, 'listingsData', start, end, after='pageData')
+    if not isinstance(listings, list):
+        return parse_list_page_full(text, span)
+
+    pagination = {}
+    for match in _PAGINATION_KEY_RE.finditer(text, start, end):
+        try:
+            value, _ = _DECODER.raw_decode(text, match.end())
+        except ValueError:
+            continue
+        if isinstance(value, dict):
+            pagination.setdefault(match.group(1), value)
+
+    return {
+        'listings': listings,
+        'pagination': pagination,
+        'build_id': extract_build_id(text, start, end),
+        'span': span,
+    }
+
+
+def parse_list_page_full(text, span=None):
+    """完整解析 __NEXT_DATA__（子树定位失败时的回退路径），返回格式与 parse_list_page 相同"""
+    span = span or locate(text)
+    if span is None:
+        return None
+    data_json = json.loads(text[span[0]:span[1]])
+    data = _dig(data_json, 'props', 'pageProps', 'pageData', 'data')
+    return {
+        'listings': data.get('listingsData', []) if isinstance(data, dict) else [],
+        'pagination': data if isinstance(data, dict) else {},
+        'build_id': data_json.get('buildId'),
+        'span': span,
+    }
+
+
+def parse_agent_info_props(text):
+    """
+    从详情页 HTML 或 Next.js JSON 路由的响应中读取 agentInfoProps
+
+    返回 (agentInfoProps, build_id)；agentInfoProps 不存在时为 {}
+    """
+    span = locate(text)
+    start, end = span if span else (0, len(text))
+
+    props = extract_value(text, 'agentInfoProps', start, end, after='contactAgentCard')
+    if isinstance(props, dict):
+        return props, extract_build_id(text, start, end)
+
+    # 回退：完整解析
+    data_json = json.loads(text[start:end])
+    page_props = data_json.get('props', {}).get('pageProps') if 'props' in data_json else data_json.get('pageProps')
+    props = _dig(page_props or {}, 'pageData', 'data', 'contactAgentData', 'contactAgentCard', 'agentInfoProps')
+    return props or {}, data_json.get('buildId')
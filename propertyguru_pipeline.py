@@ -1,62 +1,377 @@
-import requests
 import json
 import time
 import os
+from contextlib import contextmanager
 from loguru import logger
 import re
-from func_timeout import func_set_timeout
-import urllib3
-urllib3.disable_warnings()
+from func_timeout import func_timeout, FunctionTimedOut
 import sqlite3
-import pandas as pd
+import zlib
+import queue
+import math
+import multiprocessing
+from urllib.parse import urlencode, parse_qsl
 from datetime import datetime, timedelta
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from threading import Lock
-
-logger.add("logs/propertyguru_pipeline.log", level="INFO")
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from threading import Lock, Thread, Event
+from config import validate_config, ConfigError
+from work_queue import WorkQueue
+from response_cache import ResponseCache
+from endpoint_pool import build_endpoint_pool
+from models import Listing, AgentInfo, extract_listing_columns, listing_rows, update_params
+import listing_schema
+import market_stats
+import next_data
+from scheduling import (DEFAULT_PRIORITY_WEIGHTS, prioritize_records, request_budget,
+                        agent_content_hash, next_interval, spread_due_time, daily_budget, next_attempt_time)
+from log_control import setup_logging, LogSampler, ProgressReporter
+from flow_control import (CircuitBreaker, RateLimiter, LatencyTracker, HedgeBudget, PipelineAbortError,
+                          classify_error, backoff_delay, ERROR_FATAL, ERROR_PERMANENT, ERROR_TRANSIENT)
+
+# requests / pandas 在首次使用时才导入（get_request / export_csv），
+# 只跑重试、少量详情刷新等短任务时不必承担这部分启动开销
 
 
 class PropertyGuruPipeline:
     """PropertyGuru 爬虫完整流程 - 支持多线程"""
 
-    def __init__(self, max_workers=5):
+    # 数据库结构版本（PRAGMA user_version），修改 init_database 中的表结构时加 1
+    # 2: failed_records 增加 next_attempt_at / first_failed_at，新增 dead_letters
+    # 7: propertyguru 改为字典编码的 listings 表 + 兼容视图（见 listing_schema）
+    # 8: market_stats 中为空的维度记为 '未知'（重建含 NULL 维度的汇总表）
+    SCHEMA_VERSION = 8
+
+    def __init__(self, max_workers=None, config=None):
+        """
+        参数:
+        - max_workers: 线程数（优先于 config 中的 max_workers，都未设置时为 5）
+        - config: 配置 dict（config.load_config() 的结果，或只包含部分配置项的 dict）
+        """
+        if isinstance(max_workers, dict):
+            # 兼容 PropertyGuruPipeline(config) 的写法
+            max_workers, config = None, max_workers
+
         self.apikey = ''
         self.proxy = ''
         self.data_dir = "data"
         self.html_dir = os.path.join(self.data_dir, "html")
         self.json_dir = os.path.join(self.data_dir, "json")
-        
-        os.makedirs(self.html_dir, exist_ok=True)
-        os.makedirs(self.json_dir, exist_ok=True)
-        os.makedirs(self.data_dir, exist_ok=True)
-        os.makedirs("logs", exist_ok=True)
-        
+        self.export_dir = os.path.join(self.data_dir, "export")
+        self.logs_dir = "logs"
         self.db_path = os.path.join(self.data_dir, "propertyguru_integrated.db")
+        self.response_cache_path = os.path.join(self.data_dir, "response_cache.db")
         
         # Step 1 配置
         self.PAGES_WITHOUT_NEW_THRESHOLD = 5  # 连续无新记录页数阈值
         self.TIME_WINDOW_DAYS = 3  # 时间窗口阈值（天数）
-        self.REVIEW_PAGES = 10  # 回溯检查页数
+        self.STEP1_CATEGORIES = ['property-for-rent', 'property-for-sale']
+        # 总页数兜底值：首页分页信息解析失败且数据库中没有记录时使用
+        self.DEFAULT_TOTAL_PAGES = {'property-for-rent': 1483, 'property-for-sale': 2662}
+        self.EMPTY_PAGES_THRESHOLD = 2  # 连续空页数阈值（到达列表末尾，提前停止）
+        # Step 1 并发窗口按待爬取页数确定（见 step1_window）：每 STEP1_PAGES_PER_WORKER 页一个并发，
+        # 不超过 max_workers 和限速器；STEP1_WORKERS 设置时作为上限
+        self.STEP1_WORKERS = None
+        self.STEP1_PAGES_PER_WORKER = 50
+        # 下架检测：连续多少次完整遍历（爬到列表末尾、没有失败页）都没出现的房源移入归档表，None / 0 表示不检测
+        self.DELIST_MISSED_PASSES = 3
+        # 一次遍历中未出现的房源超过该比例时不计入（分页上限、分片未覆盖整个分类、网站改版等导致遍历不完整）
+        self.DELIST_MAX_MISSING_RATIO = 0.3
+
+        # 分片爬取配置：把两个大列表按 区域/物业类型/价格区间 拆成多个小的筛选查询并行爬取
+        self.SEARCH_SHARDS = []  # [{'category': ..., 'params': {...}}, ...]，可用 build_search_shards 生成
+        self.STEP1_SHARD_WORKERS = 4  # 同时爬取的分片数
+        self.SHARD_PARAM_NAMES = {  # 筛选条件对应的查询参数名
+            'district': 'districtCode',
+            'property_type': 'propertyTypeGroup',
+            'min_price': 'minPrice',
+            'max_price': 'maxPrice',
+        }
         
         # Step 2 配置
         self.AGENT_INFO_EXPIRY_DAYS = 90  # 代理信息过期时间（天数）
-        self.MAX_RETRIES = 3  # 最大重试次数
+        self.MAX_RETRIES = 3  # 最大重试次数（超过后失败记录转入死信表，不再自动重试）
+        self.STEP2_PRIORITIZE = True  # 按优先级（新鲜度/价格/类型）排序待处理记录
+        self.STEP2_PRIORITY_WEIGHTS = dict(DEFAULT_PRIORITY_WEIGHTS)  # 优先级打分权重
+        self.STEP2_MAX_REQUESTS = None  # 单次运行最多处理的详情页数（None 不限制）
+        self.STEP2_MAX_SPEND = None  # 单次运行的 API 费用上限（None 不限制）
+        self.API_COST_PER_REQUEST = 1.0  # 每次详情页请求的 API 费用（用于换算费用上限）
+
+        # 自适应重爬配置（expired 模式）
+        self.ADAPTIVE_RECRAWL = True  # False 时退回按 AGENT_INFO_EXPIRY_DAYS 一次性全量刷新
+        self.RECRAWL_MIN_DAYS = 7  # 重爬间隔下限（代理信息频繁变化的记录）
+        self.RECRAWL_MAX_DAYS = 180  # 重爬间隔上限（长期不变的记录）
+        self.RECRAWL_DAILY_BUDGET = None  # 每天最多刷新的记录数（None 按 记录数/平均间隔 自动计算）
+
+        # 详情页轻量请求配置
+        self.DETAIL_FETCH_MODE = 'full'  # 'full' 下载完整页面；'light' 优先走 Next.js JSON 路由、流式读取、条件请求
+        self.SAVE_DETAIL_FILES = True  # 是否保存详情页 HTML/JSON 原始文件（light 模式只保存代理信息片段）
+        self.STREAM_CHUNK_SIZE = 16 * 1024  # 流式读取的块大小
+        self.next_build_id = None  # Next.js buildId，从已解析的 __NEXT_DATA__ 中获取
+        self.fetch_stats = {
+            'requests': 0,  # 实际发出的请求数
+            'bytes_downloaded': 0,  # 实际下载的字节数（light 模式统计）
+            'bytes_saved': 0,  # 估算节省的字节数（light 模式统计）
+            'not_modified': 0,  # 条件请求命中 304 次数
+            'next_data_route': 0,  # 通过 Next.js JSON 路由获取的次数
+            'stream_early_stop': 0,  # 读到 __NEXT_DATA__ 后提前停止读取的次数
+            'cache_hits': 0,  # 响应缓存命中（未发出请求）的次数
+            'hedged': 0,  # 发出的对冲请求数
+            'hedge_wins': 0,  # 对冲请求先于原请求返回的次数
+        }
+        self._stats_lock = Lock()
         
         # 多线程配置
-        self.max_workers = max_workers
+        self.max_workers = 5
         self.db_lock = Lock()  # 数据库操作锁
-        
+
+        # 请求配置
+        self.REQUEST_TIMEOUT = 60  # 单次请求超时（秒）
+        self.REQUEST_DELAY = 0  # 所有线程之间的最小请求间隔（秒），0 不限速
+        self.RATE_LIMIT_BURST = 1  # 限速时允许的突发请求数
+        self.HTTP_POOL_SIZE = 10  # HTTP 连接池大小（实际取值不小于线程数）
+
+        # 请求端点池：多个 (apikey, proxy) 轮换使用，为空时只使用 apikey / proxy
+        self.ENDPOINTS = []  # [{'apikey':, 'proxy':, 'max_concurrency':, 'weight':}, ...]
+        self.ENDPOINT_MAX_CONCURRENCY = None  # 未单独设置并发上限的端点的默认值（None 不限制）
+        self.ENDPOINT_QUARANTINE_FAILURES = 5  # 连续失败多少次后隔离该端点
+        self.ENDPOINT_QUARANTINE_SECONDS = 60  # 首次隔离时长，之后每次加倍
+        self.ENDPOINT_MAX_QUARANTINE_SECONDS = 900
+        self.ENDPOINT_MIN_SUCCESS_RATE = 0.5  # 成功率低于该值时隔离
+        self.endpoint_pool = None
+        self._endpoint_pool_lock = Lock()
+
+        # 对冲请求（详情页）：请求超过最近 p95 耗时仍未返回时，通过另一个端点再发一次，取先成功返回的结果
+        self.HEDGE_REQUESTS = False
+        self.HEDGE_PERCENTILE = 95  # 触发对冲的耗时分位数
+        self.HEDGE_MIN_DELAY = 2.0  # 对冲等待时间下限（秒），避免对本来就很快的请求对冲
+        self.HEDGE_MAX_RATE = 0.05  # 对冲请求数占详情页请求数的比例上限（控制 API 费用）
+        self.HEDGE_MIN_SAMPLES = 20  # 积累多少个耗时样本后才开始对冲
+        self.detail_latency = LatencyTracker()  # 单次详情页请求耗时（对冲阈值）
+        self.detail_completion = LatencyTracker()  # 详情页从第一次请求到成功返回的总耗时（含重试、对冲）
+        self.list_latency = LatencyTracker()  # 单次列表页请求耗时（限速时确定 Step 1 并发窗口）
+        self.hedge_budget = None
+        self._hedge_executor = None
+        self._hedge_executor_lock = Lock()
+        self._session = None
+        self._session_lock = Lock()
+
+        # 数据库配置
+        self.DB_TIMEOUT = 30  # 锁等待时间（秒）
+        self.DB_CACHE_SIZE_KB = 0  # 页缓存大小（KB），0 使用 SQLite 默认值
+        self.DB_JOURNAL_MODE = ''  # 日志模式（如 WAL），空表示不修改；多机器共享数据库文件时不要用 WAL
+        self.DB_SYNCHRONOUS = ''  # synchronous（OFF / NORMAL / FULL），空表示不修改
+
+        # 日志与导出配置
+        self.LOG_LEVEL = 'INFO'
+        self.LOG_CONSOLE_LEVEL = 'INFO'
+        self.LOG_ROTATION = '500 MB'  # 按大小轮转
+        self.LOG_RETENTION = '30 days'
+        self.LOG_COMPRESSION = 'gz'  # 轮转后的旧日志压缩格式，空表示不压缩
+        self.LOG_ENQUEUE = True  # 日志由后台线程批量写出，工作线程不等待磁盘 / 终端 IO
+        self.LOG_FLUSH_INTERVAL = 1.0  # 后台写日志的间隔（秒）
+        self.LOG_SAMPLE_EVERY = 100  # 逐条记录的日志每 N 条输出 1 条（失败不采样），1 表示全部输出
+        self.LOG_SUMMARY_INTERVAL = 30  # 汇总进度日志的输出间隔（秒）
+        self.EXPORT_ENCODING = 'utf-8-sig'
+
+        # 多进程配置（Step 2）
+        self.STEP2_PROCESSES = 1  # Step 2 工作进程数，>1 时按 url_path 哈希分片到多个进程
+        self.STEP2_WRITE_BATCH = 50  # 主进程批量写库的记录数
+
+        # 流水线模式：Step 1 新写入的房源直接推入 Step 2 详情队列，两个阶段同时运行
+        self.PIPELINE_OVERLAP = False
+        self._detail_sink = None  # 流水线模式下接收新房源 url_path 列表的回调
+
+        # 重试与熔断配置
+        self.RETRY_BACKOFF_BASE = 1.0  # 指数退避基数（秒）
+        self.RETRY_BACKOFF_MAX = 30.0  # 单次退避上限（秒）
+        self.BREAKER_FAILURE_THRESHOLD = 10  # 连续 10 次临时错误后熔断，暂停所有线程
+        self.BREAKER_COOLDOWN_SECONDS = 60  # 首次熔断冷却时间，之后每次加倍
+        self.BREAKER_MAX_COOLDOWN_SECONDS = 600
+        self.BREAKER_MAX_TRIPS = 5  # 连续熔断超过 5 次视为致命错误，优雅停止
+
+        # 失败记录分级重试配置（Step 3）：第 n 次失败后等待 base * 4^(n-1) 秒再重试，不超过上限
+        self.RETRY_TIER_BASE_SECONDS = 15 * 60
+        self.RETRY_TIER_MAX_SECONDS = 24 * 3600
+        self._permanent_failures = set()  # 本进程中返回永久性错误（404 / 410 等）的 url_path
+
+        # 分布式任务队列配置（多进程/多机器共享同一数据库时使用）
+        self.QUEUE_LEASE_SECONDS = 300  # 任务租约时长（秒），超时未续租的任务会被其他进程回收
+        self.QUEUE_BATCH_SIZE = 20  # 每次领取的任务数
+        self.QUEUE_IDLE_WAIT = 5  # 队列暂时为空时的等待间隔（秒）
+        self.work_queue = None
+
+        # 响应缓存配置（短时间内重复请求同一页面时直接使用缓存，不再调用 API）
+        self.RESPONSE_CACHE = True
+        self.RESPONSE_CACHE_TTL_LIST = 30 * 60  # 列表页缓存有效期（秒），0 表示不缓存
+        self.RESPONSE_CACHE_TTL_DETAIL = 6 * 3600  # 详情页（含 Next.js JSON 路由）缓存有效期（秒）
+        self.RESPONSE_CACHE_MAX_MB = 500  # 缓存总大小上限（压缩后），超过后按最近访问时间淘汰
+        self.RESPONSE_CACHE_BYPASS = False  # True 时不读缓存（仍写入），全量爬取 / 过期更新 / 重试时自动启用
+        self.response_cache = None
+
+        # 常驻服务模式配置（daemon.PipelineDaemon）：各任务的运行间隔（秒），0 表示不运行
+        self.DAEMON_LIST_INTERVAL = 30 * 60  # 列表页增量刷新
+        self.DAEMON_DETAIL_INTERVAL = 5 * 60  # 补充缺失的详情页
+        self.DAEMON_EXPIRED_INTERVAL = 60 * 60  # 刷新到期的详情页
+        self.DAEMON_RETRY_INTERVAL = 15 * 60  # 重试到期的失败记录
+        self.DAEMON_EXPORT_INTERVAL = 24 * 3600  # 导出 CSV
+        self.DAEMON_HOURLY_REQUESTS = None  # 每小时最多发出的请求数（None 不限制）
+        self.DAEMON_STATUS_HOST = '127.0.0.1'
+        self.DAEMON_STATUS_PORT = 8765  # 状态接口端口，0 表示不启动
+
+        self.config = {}
+        if config:
+            self.apply_config(config)
+        if max_workers is not None:
+            self.max_workers = max_workers
+
+        setup_logging(os.path.join(self.logs_dir, "propertyguru_pipeline.log"), self.LOG_LEVEL,
+                      self.LOG_ROTATION, self.LOG_RETENTION, compression=self.LOG_COMPRESSION or None,
+                      enqueue=self.LOG_ENQUEUE, flush_interval=self.LOG_FLUSH_INTERVAL,
+                      console_level=self.LOG_CONSOLE_LEVEL)
+        self.log_sampler = LogSampler(self.LOG_SAMPLE_EVERY)
+
+        os.makedirs(self.html_dir, exist_ok=True)
+        os.makedirs(self.json_dir, exist_ok=True)
+        os.makedirs(self.data_dir, exist_ok=True)
+
+        self.breaker = CircuitBreaker(
+            failure_threshold=self.BREAKER_FAILURE_THRESHOLD,
+            cooldown_seconds=self.BREAKER_COOLDOWN_SECONDS,
+            max_cooldown_seconds=self.BREAKER_MAX_COOLDOWN_SECONDS,
+            max_trips=self.BREAKER_MAX_TRIPS
+        )
+        self.rate_limiter = RateLimiter(self.REQUEST_DELAY, self.RATE_LIMIT_BURST)
+        self.hedge_budget = HedgeBudget(self.HEDGE_MAX_RATE)
+
         self.init_database()
+        if self.RESPONSE_CACHE:
+            self.response_cache = ResponseCache(
+                self.response_cache_path,
+                {'list': self.RESPONSE_CACHE_TTL_LIST, 'detail': self.RESPONSE_CACHE_TTL_DETAIL},
+                max_bytes=self.RESPONSE_CACHE_MAX_MB * 1024 * 1024,
+                timeout=self.DB_TIMEOUT
+            )
+
+    # 配置项与属性名不是 key.upper() 关系的项
+    _CONFIG_LOWERCASE_KEYS = ('apikey', 'proxy', 'max_workers', 'data_dir', 'db_path',
+                              'html_dir', 'json_dir', 'export_dir', 'logs_dir', 'response_cache_path')
+
+    def apply_config(self, config):
+        """
+        应用配置（在 __init__ 中调用；创建目录、熔断器、数据库之前）
+
+        config 中的配置项见 config.CONFIG_SCHEMA，这里再做一次类型转换和校验，
+        不合法时抛出 ConfigError
+        """
+        config, errors = validate_config(config)
+        if errors:
+            raise ConfigError("配置错误：\n" + "\n".join(f"  - {error}" for error in errors))
+        self.config = dict(config)
+
+        # 路径：未单独指定的子目录和数据库文件跟随 data_dir
+        data_dir = config.get('data_dir', self.data_dir)
+        self.data_dir = data_dir
+        self.html_dir = config.get('html_dir') or os.path.join(data_dir, "html")
+        self.json_dir = config.get('json_dir') or os.path.join(data_dir, "json")
+        self.export_dir = config.get('export_dir') or os.path.join(data_dir, "export")
+        self.db_path = config.get('db_path') or os.path.join(
+            data_dir, config.get('db_name') or "propertyguru_integrated.db")
+        self.response_cache_path = config.get('response_cache_path') or os.path.join(data_dir, "response_cache.db")
+
+        for key, value in config.items():
+            if key in ('data_dir', 'html_dir', 'json_dir', 'export_dir', 'db_path', 'db_name', 'response_cache_path'):
+                continue
+            if key in self._CONFIG_LOWERCASE_KEYS:
+                setattr(self, key, value)
+            elif key == 'rent_max_pages' and value:
+                self.DEFAULT_TOTAL_PAGES['property-for-rent'] = value
+            elif key == 'sale_max_pages' and value:
+                self.DEFAULT_TOTAL_PAGES['property-for-sale'] = value
+            elif hasattr(self, key.upper()):
+                setattr(self, key.upper(), value)
+
+    # 运行中不能切换的路径类配置（数据库、目录、缓存文件）
+    _RELOAD_FIXED_ATTRS = ('data_dir', 'html_dir', 'json_dir', 'export_dir', 'logs_dir', 'db_path',
+                           'response_cache_path')
+
+    def reload_config(self, config):
+        """
+        运行中重新加载配置（常驻服务模式收到 SIGHUP 时调用）
+
+        重建请求限速器、对冲预算和端点池（端点健康统计清零），更新熔断器参数（保留当前状态）；
+        数据库、目录、响应缓存等路径需要重启才能生效，配置中删除的项保持当前值
+        """
+        fixed = {attr: getattr(self, attr) for attr in self._RELOAD_FIXED_ATTRS}
+        self.apply_config(config)
+        for attr, value in fixed.items():
+            if getattr(self, attr) != value:
+                logger.warning(f"{attr} 需要重启才能生效，继续使用: {value}")
+                setattr(self, attr, value)
+
+        self.rate_limiter = RateLimiter(self.REQUEST_DELAY, self.RATE_LIMIT_BURST)
+        self.hedge_budget = HedgeBudget(self.HEDGE_MAX_RATE)
+        self.breaker.failure_threshold = self.BREAKER_FAILURE_THRESHOLD
+        self.breaker.cooldown_seconds = self.BREAKER_COOLDOWN_SECONDS
+        self.breaker.max_cooldown_seconds = self.BREAKER_MAX_COOLDOWN_SECONDS
+        self.breaker.max_trips = self.BREAKER_MAX_TRIPS
+        with self._endpoint_pool_lock:
+            self.endpoint_pool = None
+        self.log_sampler = LogSampler(self.LOG_SAMPLE_EVERY)
+
+    def _connect(self):
+        """打开数据库连接，并应用连接级 PRAGMA（页缓存、synchronous）"""
+        conn = sqlite3.connect(self.db_path, timeout=self.DB_TIMEOUT)
+        if self.DB_CACHE_SIZE_KB:
+            # 负数表示以 KB 为单位
+            conn.execute(f"PRAGMA cache_size = -{int(self.DB_CACHE_SIZE_KB)}")
+        if self.DB_SYNCHRONOUS:
+            conn.execute(f"PRAGMA synchronous = {self.DB_SYNCHRONOUS}")
+        return conn
 
     def init_database(self):
-        """初始化数据库，创建表结构"""
+        """
+        初始化数据库，创建表结构
+
+        建表完成后把 SCHEMA_VERSION 写入 PRAGMA user_version，
+        之后的运行检查到版本一致时直接跳过建表语句
+        """
+        conn = None
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self._connect()
             cursor = conn.cursor()
 
-            # 主数据表
+            if self.DB_JOURNAL_MODE:
+                # journal_mode 保存在数据库文件中，每次启动检查一次即可
+                mode = cursor.execute(f"PRAGMA journal_mode = {self.DB_JOURNAL_MODE}").fetchone()[0]
+                logger.debug(f"数据库日志模式: {mode}")
+
+            version = cursor.execute("PRAGMA user_version").fetchone()[0]
+            if version >= self.SCHEMA_VERSION:
+                logger.debug(f"数据库结构已是最新（版本 {version}），跳过建表")
+                return
+
+            # 建表和迁移在同一个事务中提交；IMMEDIATE 先取得写锁，多个进程同时启动时只有一个执行迁移
+            cursor.execute("BEGIN IMMEDIATE")
+
+            # 主数据表：字典编码的 listings + 兼容视图 propertyguru（见 listing_schema）
+            migrated = None
+            if listing_schema.has_legacy_table(cursor):
+                # 旧版本的 propertyguru 表：先补充新增的列，再迁移到 listings
+                # last_seen_at: 最近一次在列表页中出现的时间；missed_passes: 连续未出现的完整遍历次数
+                self._add_missing_columns(cursor, 'propertyguru', {
+                    'last_seen_at': 'TIMESTAMP',
+                    'missed_passes': 'INTEGER DEFAULT 0',
+                })
+                # 全文索引的外部内容表改为 listings_search，删除后由 _create_search_index 重建
+                cursor.execute("DROP TABLE IF EXISTS listings_fts")
+                logger.info("数据库结构升级: propertyguru 迁移为字典编码的 listings 表...")
+                migrated = listing_schema.migrate(cursor)
+            for sql in listing_schema.SCHEMA_SQL:
+                cursor.execute(sql)
+
+            # 归档表：已下架的房源（从 propertyguru 移出，Step 2 和导出只处理在售 / 在租的房源）
             cursor.execute('''
-                CREATE TABLE IF NOT EXISTS propertyguru (
+                CREATE TABLE IF NOT EXISTS propertyguru_archive (
                     ID TEXT,
                     localizedTitle TEXT,
                     fullAddress TEXT,
@@ -79,8 +394,11 @@ class PropertyGuruPipeline:
                     mobile TEXT,
                     rating TEXT,
                     buy_rent TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    created_at TIMESTAMP,
+                    updated_at TIMESTAMP,
+                    last_seen_at TIMESTAMP,
+                    missed_passes INTEGER,
+                    archived_at TIMESTAMP
                 )
             ''')
 
@@ -95,28 +413,118 @@ class PropertyGuruPipeline:
                 )
             ''')
 
-            # 爬取进度表
+            # 爬取进度表（每个分类 / 分片一行，记录当前轮次）
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS crawl_progress (
                     category TEXT PRIMARY KEY,
                     last_page INTEGER,
                     total_pages INTEGER,
-                    last_update TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    last_update TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    run_id INTEGER,
+                    run_started_at TIMESTAMP,
+                    run_completed_at TIMESTAMP
                 )
             ''')
+            self._add_missing_columns(cursor, 'crawl_progress', {
+                'run_id': 'INTEGER',
+                'run_started_at': 'TIMESTAMP',
+                'run_completed_at': 'TIMESTAMP',
+            })
 
-            # 失败记录表
+            # 列表页页表：每页最后一次爬取的轮次、状态（done / failed）、房源数，断点续爬时只补爬缺失 / 失败的页
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS crawl_pages (
+                    category TEXT,
+                    page INTEGER,
+                    run_id INTEGER,
+                    status TEXT,
+                    listing_count INTEGER,
+                    new_records INTEGER,
+                    crawled_at TIMESTAMP,
+                    PRIMARY KEY (category, page)
+                ) WITHOUT ROWID
+            ''')
+
+            # 失败记录表（retry_count 为已失败次数，按次数分级安排下次重试时间）
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS failed_records (
                     url_path TEXT PRIMARY KEY,
                     error_message TEXT,
                     retry_count INTEGER DEFAULT 0,
-                    last_attempt TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    last_attempt TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    next_attempt_at TIMESTAMP,
+                    first_failed_at TIMESTAMP
+                )
+            ''')
+            # 旧版本数据库：补充新增的列（已有记录 next_attempt_at 为空，视为已到期）
+            self._add_missing_columns(cursor, 'failed_records', {
+                'next_attempt_at': 'TIMESTAMP',
+                'first_failed_at': 'TIMESTAMP',
+            })
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_failed_next_attempt ON failed_records (next_attempt_at)")
+
+            # 死信表：超过最大重试次数或永久性错误（404 / 410 等）的记录，不再自动重试
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS dead_letters (
+                    url_path TEXT PRIMARY KEY,
+                    error_message TEXT,
+                    retry_count INTEGER,
+                    first_failed_at TIMESTAMP,
+                    dead_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+
+            # HTTP 缓存校验信息（详情页条件请求）
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS http_validators (
+                    url_path TEXT PRIMARY KEY,
+                    etag TEXT,
+                    last_modified TEXT,
+                    body_bytes INTEGER,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             ''')
 
+            # 重爬计划表（自适应重爬）
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS recrawl_schedule (
+                    url_path TEXT PRIMARY KEY,
+                    agent_id TEXT,
+                    content_hash TEXT,
+                    check_count INTEGER DEFAULT 0,
+                    change_count INTEGER DEFAULT 0,
+                    interval_days REAL,
+                    last_checked_at TIMESTAMP,
+                    next_due_at TIMESTAMP
+                )
+            ''')
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_recrawl_next_due ON recrawl_schedule (next_due_at)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_recrawl_agent ON recrawl_schedule (agent_id)")
+
+            # 全文索引（标题、地址、地铁信息）
+            populate_search_index = self._create_search_index(cursor)
+
+            # 市场统计汇总表（写入房源时增量更新）；旧版本写入的维度为 NULL 的分组无法按主键合并，重建
+            had_market_stats = cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'market_stats'").fetchone() is not None
+            for sql in market_stats.SCHEMA_SQL:
+                cursor.execute(sql)
+            populate_market_stats = cursor.execute("SELECT 1 FROM propertyguru LIMIT 1").fetchone() is not None and (
+                not had_market_stats or cursor.execute(market_stats.NULL_GROUP_SQL).fetchone() is not None)
+
+            # PRAGMA 不支持参数绑定，SCHEMA_VERSION 为整数常量
+            cursor.execute(f"PRAGMA user_version = {int(self.SCHEMA_VERSION)}")
             conn.commit()
             logger.success(f"数据库初始化成功: {self.db_path}")
+            if populate_search_index:
+                logger.info("为已有数据建立全文索引（只在升级时执行一次）...")
+                self.rebuild_search_index()
+            if populate_market_stats:
+                logger.info("为已有数据计算市场统计（只在升级时执行一次）...")
+                self.rebuild_market_stats()
+            if migrated is not None:
+                logger.success(f"propertyguru 已迁移为字典编码: {migrated} 条记录")
+                self.compact_database()
 
         except Exception as e:
             logger.error(f"数据库初始化失败: {str(e)}")
@@ -124,62 +532,144 @@ class PropertyGuruPipeline:
             if conn:
                 conn.close()
 
+    @staticmethod
+    def _add_missing_columns(cursor, table, columns):
+        """ALTER TABLE 补充旧版本表中缺少的列"""
+        existing = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}
+        for name, column_type in columns.items():
+            if name not in existing:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
+                logger.info(f"数据库结构升级: {table} 增加列 {name}")
+
     # ==================== Step 1: 列表页爬取 ====================
     
-    def get_crawl_progress(self, category):
-        """获取爬取进度，考虑时间窗口"""
+    def start_crawl_run(self, category, resume=True):
+        """
+        开始（或继续）一轮列表页爬取，返回 (轮次, 本轮已完成的页码集合)
+
+        resume=True 时，上一轮未完成且开始时间在 TIME_WINDOW_DAYS 以内则继续该轮，
+        只需补爬本轮中缺失或失败的页；否则开始新的一轮（所有页都需要重新爬取）。
+        旧版本数据库只有 last_page：把第 1 ~ last_page-1 页视为本轮已完成
+        """
+        now = datetime.now()
+        conn = None
         try:
             with self.db_lock:
-                conn = sqlite3.connect(self.db_path)
+                conn = self._connect()
                 cursor = conn.cursor()
-                cursor.execute(
-                    "SELECT last_page, last_update FROM crawl_progress WHERE category = ?",
-                    (category,)
-                )
-                result = cursor.fetchone()
-
-                if result:
-                    last_page, last_update = result[0], result[1]
-                    last_update_time = datetime.fromisoformat(last_update)
-                    days_ago = (datetime.now() - last_update_time).days
-
+                row = cursor.execute('''
+                    SELECT run_id, run_started_at, run_completed_at, last_page, last_update
+                    FROM crawl_progress WHERE category = ?
+                ''', (category,)).fetchone()
+                run_id, started_at, completed_at, last_page, last_update = row or (None,) * 5
+
+                if resume and row and not completed_at and (started_at or last_update):
+                    days_ago = (now - datetime.fromisoformat(str(started_at or last_update))).days
                     if days_ago > self.TIME_WINDOW_DAYS:
                         logger.warning(
-                            f"上次更新已过去 {days_ago} 天（阈值: {self.TIME_WINDOW_DAYS}天），重新全量爬取"
+                            f"上一轮开始已过去 {days_ago} 天（阈值: {self.TIME_WINDOW_DAYS}天），重新全量爬取"
                         )
-                        return 1, None
-
-                    logger.info(f"继续上次进度，从第 {last_page} 页开始")
-                    return last_page, None
+                        resume = False
+                else:
+                    resume = False
+
+                if resume and run_id is None:
+                    run_id = 1
+                    done = set(range(1, last_page or 1))
+                    cursor.executemany('''
+                        INSERT OR REPLACE INTO crawl_pages (category, page, run_id, status, crawled_at)
+                        VALUES (?, ?, ?, 'done', ?)
+                    ''', [(category, page, run_id, last_update) for page in done])
+                    cursor.execute(
+                        "UPDATE crawl_progress SET run_id = ?, run_started_at = ? WHERE category = ?",
+                        (run_id, last_update, category)
+                    )
+                elif resume:
+                    done = {page for (page,) in cursor.execute(
+                        "SELECT page FROM crawl_pages WHERE category = ? AND run_id = ? AND status = 'done'",
+                        (category, run_id)
+                    )}
+                else:
+                    run_id = (run_id or 0) + 1
+                    done = set()
+                    cursor.execute('''
+                        INSERT INTO crawl_progress (category, last_page, last_update, run_id, run_started_at)
+                        VALUES (?, 1, ?, ?, ?)
+                        ON CONFLICT(category) DO UPDATE SET
+                            last_page = 1, last_update = excluded.last_update, run_id = excluded.run_id,
+                            run_started_at = excluded.run_started_at, run_completed_at = NULL
+                    ''', (category, now, run_id, now))
+                conn.commit()
 
+            if resume:
+                logger.info(f"继续第 {run_id} 轮爬取：已完成 {len(done)} 页，只补爬缺失 / 失败的页")
+            elif row:
+                logger.info(f"开始第 {run_id} 轮爬取 {category}")
+            else:
                 logger.info(f"首次爬取 {category}")
-                return 1, None
+            return run_id, done
 
         except Exception as e:
             logger.error(f"获取爬取进度失败: {str(e)}")
-            return 1, None
+            return None, set()
         finally:
             if conn:
                 conn.close()
 
-    def update_crawl_progress(self, category, last_page, total_pages=None):
-        """更新爬取进度"""
+    @staticmethod
+    def _page_state(page, page_info):
+        """crawl_pages 中的一行：(页码, 状态, 房源数, 新增数)；page_info 中没有 listing_count 表示请求或解析失败"""
+        status = 'done' if 'listing_count' in page_info else 'failed'
+        return page, status, page_info.get('listing_count'), page_info.get('new_records')
+
+    def record_page_states(self, category, states, run_id=None):
+        """
+        批量写入列表页状态 [(页码, 状态, 房源数, 新增数), ...]（一个事务）
+
+        run_id 为 None 时记入该分类当前的轮次（队列消费者、失败重试）；同时更新 crawl_progress 的 last_page / last_update
+        """
+        if not states:
+            return
+        now = datetime.now()
+        conn = None
         try:
             with self.db_lock:
-                conn = sqlite3.connect(self.db_path)
+                conn = self._connect()
                 cursor = conn.cursor()
-                if total_pages:
-                    cursor.execute(
-                        "INSERT OR REPLACE INTO crawl_progress (category, last_page, total_pages, last_update) VALUES (?, ?, ?, ?)",
-                        (category, last_page, total_pages, datetime.now())
-                    )
-                else:
-                    cursor.execute(
-                        "INSERT OR REPLACE INTO crawl_progress (category, last_page, last_update) VALUES (?, ?, ?)",
-                        (category, last_page, datetime.now())
-                    )
+                cursor.executemany('''
+                    INSERT INTO crawl_pages (category, page, run_id, status, listing_count, new_records, crawled_at)
+                    VALUES (?, ?, COALESCE(?, (SELECT run_id FROM crawl_progress WHERE category = ?)), ?, ?, ?, ?)
+                    ON CONFLICT(category, page) DO UPDATE SET
+                        run_id = excluded.run_id, status = excluded.status, listing_count = excluded.listing_count,
+                        new_records = excluded.new_records, crawled_at = excluded.crawled_at
+                ''', [(category, page, run_id, category, status, listing_count, new_records, now)
+                      for page, status, listing_count, new_records in states])
+                done = [page for page, status, _, _ in states if status == 'done']
+                if done:
+                    cursor.execute('''
+                        UPDATE crawl_progress SET last_page = MAX(COALESCE(last_page, 1), ?), last_update = ?
+                        WHERE category = ?
+                    ''', (max(done) + 1, now, category))
+                conn.commit()
+            logger.debug(f"更新爬取进度: {category} {len(states)} 页")
+        except Exception as e:
+            logger.error(f"更新爬取进度失败: {str(e)}")
+        finally:
+            if conn:
+                conn.close()
+
+    def complete_crawl_run(self, category, run_id):
+        """标记本轮爬取完成（下次增量爬取开始新的一轮）"""
+        conn = None
+        try:
+            with self.db_lock:
+                conn = self._connect()
+                cursor = conn.cursor()
+                cursor.execute(
+                    "UPDATE crawl_progress SET run_completed_at = ? WHERE category = ? AND run_id = ?",
+                    (datetime.now(), category, run_id)
+                )
                 conn.commit()
-                logger.debug(f"更新爬取进度: {category} 第 {last_page} 页")
         except Exception as e:
             logger.error(f"更新爬取进度失败: {str(e)}")
         finally:
@@ -188,9 +678,10 @@ class PropertyGuruPipeline:
 
     def insert_spider_record(self, url_path, status, error_msg=None):
         """向爬虫记录表中插入记录"""
+        conn = None
         try:
             with self.db_lock:
-                conn = sqlite3.connect(self.db_path)
+                conn = self._connect()
                 cursor = conn.cursor()
 
                 cursor.execute("SELECT retry_count FROM propertyguru_spider WHERE url_path = ?", (url_path,))
@@ -217,7 +708,7 @@ class PropertyGuruPipeline:
 
         try:
             with self.db_lock:
-                conn = sqlite3.connect(self.db_path)
+                conn = self._connect()
                 cursor = conn.cursor()
                 cursor.execute(
                     "SELECT status FROM propertyguru_spider WHERE url_path = ? AND status = '已爬取'",
@@ -233,105 +724,57 @@ class PropertyGuruPipeline:
                 conn.close()
 
     def insert_record(self, result, force_update=False, update_agent_only=False):
-        """向数据库中插入或更新记录"""
+        """
+        向数据库中插入或更新记录
+
+        result: Listing（update_agent_only 时为 AgentInfo）；也兼容按列名组织的 dict
+        """
+        conn = None
+        url_path = result.get("url_path") or '无url_path'
         try:
             with self.db_lock:
-                conn = sqlite3.connect(self.db_path)
+                conn = self._connect()
                 cursor = conn.cursor()
 
-                url_path = result.get("url_path", '无url_path')
-                cursor.execute("SELECT * FROM propertyguru WHERE url_path = ?", (url_path,))
+                cursor.execute("SELECT 1 FROM propertyguru WHERE url_path = ?", (url_path,))
                 existing = cursor.fetchone()
 
                 if existing:
                     if update_agent_only:
                         # 只更新代理信息
-                        cursor.execute('''
-                            UPDATE propertyguru
-                            SET CEA=?, mobile=?, rating=?, updated_at=?
-                            WHERE url_path = ?
-                        ''', (
-                            result.get("CEA", ''),
-                            result.get("mobile", ''),
-                            result.get("rating", ''),
-                            datetime.now(),
-                            url_path
-                        ))
-                        logger.info(f"代理信息更新成功: {url_path}")
+                        agent = result if isinstance(result, AgentInfo) else AgentInfo.from_dict(result)
+                        cursor.execute(AgentInfo.UPDATE_SQL, agent.update_params(datetime.now(), url_path))
+                        action = "代理信息更新成功"
                     elif force_update:
-                        # 更新所有字段
-                        cursor.execute('''
-                            UPDATE propertyguru
-                            SET ID=?, localizedTitle=?, fullAddress=?, price_pretty=?, beds=?, baths=?,
-                                area_sqft=?, price_psf=?, nearbyText=?, built_year=?, property_type=?,
-                                tenure=?, recency_text=?, agent_id=?, agent_name=?, agent_description=?,
-                                agent_url_path=?, CEA=?, mobile=?, rating=?, buy_rent=?, updated_at=?
-                            WHERE url_path = ?
-                        ''', (
-                            result.get("ID", '无id'),
-                            result.get("localizedTitle", '无标题'),
-                            result.get("fullAddress", '无地址'),
-                            result.get("price_pretty", '无价格'),
-                            result.get("beds", '无床数'),
-                            result.get("baths", '无浴室数'),
-                            result.get("area_sqft", '无面积'),
-                            result.get("price_psf", '无每平方英尺价格'),
-                            result.get("nearbyText", '无地铁'),
-                            result.get("built_year", '无建造年份'),
-                            result.get("property_type", '无物业类型'),
-                            result.get("tenure", '无产权'),
-                            result.get("recency_text", '无更新时间'),
-                            result.get("agent_id", '无id'),
-                            result.get("agent_name", '无名字'),
-                            result.get("agent_description", '无描述'),
-                            result.get("agent_url_path", '无url_path'),
-                            result.get("CEA", ''),
-                            result.get("mobile", ''),
-                            result.get("rating", ''),
-                            result.get("buy_rent", '无buy_rent'),
-                            datetime.now(),
-                            url_path
-                        ))
-                        logger.info(f"记录强制更新: {url_path}")
+                        # 更新所有字段（市场统计先减去旧值再计入新值）
+                        listing = result if isinstance(result, Listing) else Listing.from_dict(result)
+                        now = datetime.now()
+                        row = listing.insert_params()
+                        old_stats = self._market_stats_values(cursor, [row])
+                        cursor.execute(Listing.UPDATE_SQL, listing.update_params(now))
+                        self._update_market_stats(cursor, [row], old_stats, now)
+                        action = "记录强制更新"
                     else:
-                        logger.debug(f"记录已存在，跳过: {url_path}")
-                        return False
+                        action = None
                 else:
                     # 插入新记录
-                    cursor.execute('''
-                        INSERT INTO propertyguru (ID, localizedTitle, fullAddress, price_pretty, beds, baths,
-                                                  area_sqft, price_psf, nearbyText, built_year, property_type,
-                                                  tenure, url_path, recency_text, agent_id, agent_name,
-                                                  agent_description, agent_url_path, CEA, mobile, rating, buy_rent)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        result.get("ID", '无id'),
-                        result.get("localizedTitle", '无标题'),
-                        result.get("fullAddress", '无地址'),
-                        result.get("price_pretty", '无价格'),
-                        result.get("beds", '无床数'),
-                        result.get("baths", '无浴室数'),
-                        result.get("area_sqft", '无面积'),
-                        result.get("price_psf", '无每平方英尺价格'),
-                        result.get("nearbyText", '无地铁'),
-                        result.get("built_year", '无建造年份'),
-                        result.get("property_type", '无物业类型'),
-                        result.get("tenure", '无产权'),
-                        url_path,
-                        result.get("recency_text", '无更新时间'),
-                        result.get("agent_id", '无id'),
-                        result.get("agent_name", '无名字'),
-                        result.get("agent_description", '无描述'),
-                        result.get("agent_url_path", '无url_path'),
-                        result.get("CEA", ''),
-                        result.get("mobile", ''),
-                        result.get("rating", ''),
-                        result.get("buy_rent", '无buy_rent')
-                    ))
-                    logger.info(f"记录插入成功: {url_path}")
-
-                conn.commit()
-                return True
+                    listing = result if isinstance(result, Listing) else Listing.from_dict(result)
+                    row = listing.insert_params()
+                    cursor.execute(Listing.INSERT_SQL, row)
+                    self._update_market_stats(cursor, [row], {}, datetime.now())
+                    cursor.execute("DELETE FROM propertyguru_archive WHERE url_path = ?", (url_path,))
+                    action = "记录插入成功"
+
+                if action:
+                    conn.commit()
+
+            # 日志在释放 db_lock 之后输出，逐条日志按 LOG_SAMPLE_EVERY 采样
+            if action is None:
+                logger.debug(f"记录已存在，跳过: {url_path}")
+                return False
+            if self.log_sampler.sample(action):
+                logger.info(f"{action}: {url_path}")
+            return True
 
         except Exception as e:
             logger.error(f"记录操作失败: {url_path}, 错误: {str(e)}")
@@ -340,11 +783,84 @@ class PropertyGuruPipeline:
             if conn:
                 conn.close()
 
+    def insert_listings(self, rows, force_update=False, seen=None):
+        """
+        批量写入一页房源（单个事务，executemany）
+
+        rows: 按 Listing.FIELDS 顺序排列的元组列表（见 models.listing_rows）
+        force_update 时已存在的记录更新所有字段；否则已存在的记录保持不变
+        seen: 本页出现的全部 url_path（含已存在的记录），更新 last_seen_at 并清零 missed_passes（下架检测）
+        返回写入（插入或更新）的记录数
+        """
+        if not rows and not seen:
+            return 0
+
+        conn = None
+        try:
+            with self.db_lock:
+                conn = self._connect()
+                cursor = conn.cursor()
+                now = datetime.now()
+                # 写入前的旧值：区分插入 / 更新，并从市场统计中减去被更新记录的旧值
+                old_stats = self._market_stats_values(cursor, rows)
+                new_paths = {market_stats.row_url_path(row) for row in rows} - old_stats.keys()
+                if force_update:
+                    cursor.executemany(Listing.UPDATE_SQL, [update_params(row, now) for row in rows])
+                cursor.executemany(Listing.INSERT_OR_IGNORE_SQL, rows)
+                # 写入数按写入前是否已存在统计：经视图写入时 rowcount 始终为 0（见 listing_schema）
+                written = len(new_paths)
+                if force_update:
+                    written += sum(1 for row in rows if market_stats.row_url_path(row) in old_stats)
+                self._update_market_stats(cursor, rows, old_stats, now, force_update)
+                # 重新上架的房源作为新记录写入，删除归档中的旧记录
+                cursor.executemany(
+                    "DELETE FROM propertyguru_archive WHERE url_path = ?", [(url_path,) for url_path in new_paths]
+                )
+                if seen:
+                    # 只改普通列，直接写 listings（不经过视图的触发器）
+                    cursor.executemany(
+                        "UPDATE listings SET last_seen_at = ?, missed_passes = 0 WHERE url_path = ?",
+                        [(now, url_path) for url_path in seen]
+                    )
+                conn.commit()
+            if rows:
+                logger.info(f"批量写入房源: {written}/{len(rows)} 条")
+            return written
+        except Exception as e:
+            logger.error(f"批量写入房源失败: {str(e)}")
+            return 0
+        finally:
+            if conn:
+                conn.close()
+
+    def get_existing_url_paths(self, url_paths):
+        """一次查询返回 url_paths 中已在数据库中的记录（set）"""
+        existing = set()
+        if not url_paths:
+            return existing
+
+        conn = None
+        try:
+            with self.db_lock:
+                conn = self._connect()
+                cursor = conn.cursor()
+                for i in range(0, len(url_paths), 500):
+                    chunk = url_paths[i:i + 500]
+                    placeholders = ','.join('?' * len(chunk))
+                    cursor.execute(f"SELECT url_path FROM propertyguru WHERE url_path IN ({placeholders})", chunk)
+                    existing.update(row[0] for row in cursor.fetchall())
+        except Exception as e:
+            logger.error(f"批量检查记录失败: {str(e)}")
+        finally:
+            if conn:
+                conn.close()
+        return existing
+
     def check_record_exists(self, url_path):
         """检查记录是否存在"""
         try:
             with self.db_lock:
-                conn = sqlite3.connect(self.db_path)
+                conn = self._connect()
                 cursor = conn.cursor()
                 cursor.execute("SELECT url_path FROM propertyguru WHERE url_path = ?", (url_path,))
                 result = cursor.fetchone()
@@ -356,282 +872,837 @@ class PropertyGuruPipeline:
             if conn:
                 conn.close()
 
-    @func_set_timeout(60)
-    def get_request(self, method, url, headers):
-        return requests.request(method, url, headers=headers, verify=False)
+    def get_session(self):
+        """本进程共享的 requests.Session（复用连接），连接池大小不小于线程数"""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    requests = _requests()
+                    pool_size = max(self.HTTP_POOL_SIZE, self.max_workers, self.step1_max_window())
+                    if self.HEDGE_REQUESTS:
+                        pool_size += self.max_workers  # 对冲请求与原请求同时占用连接
+                    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+                    session = requests.Session()
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self._session = session
+        return self._session
+
+    def get_request(self, method, url, headers, stream=False):
+        # requests 的 timeout 只限制连接和单次读取，func_timeout 限制整个请求的总耗时
+        return func_timeout(
+            self.REQUEST_TIMEOUT, self.get_session().request, args=(method, url),
+            kwargs={'headers': headers, 'verify': False, 'stream': stream, 'timeout': self.REQUEST_TIMEOUT}
+        )
+
+    def count_stat(self, key, value=1):
+        """累加请求统计"""
+        with self._stats_lock:
+            self.fetch_stats[key] = self.fetch_stats.get(key, 0) + value
+
+    def fetch(self, url_path, max_try=3, extra_headers=None, stream=False, use_cache=True):
+        """
+        请求网页
+
+        - 响应缓存中有未过期的页面时直接返回 CachedResponse，不发请求（use_cache=False 或 cache_bypass 时跳过）
+        - 临时错误：指数退避（带抖动）后重试
+        - 系统性错误（如代理连接中断）：熔断，所有线程暂停等待冷却
+        - 致命错误（API密钥无效、余额不足）：抛出 PipelineAbortError，由上层保存进度后优雅退出
 
-    def fetch(self, url_path, max_try=3):
-        """请求网页"""
+        extra_headers 中带有条件请求头（If-None-Match / If-Modified-Since）时，304 也视为成功返回。
+        流式请求和条件请求不经过缓存（由 get_property_detail_light 自行处理）。
+        """
+        cacheable = use_cache and not stream and not self._is_conditional(extra_headers)
+        if cacheable:
+            cached = self.get_cached_response(url_path)
+            if cached is not None:
+                return cached
+
+        pool = self.get_endpoint_pool()
+        is_detail = self.cache_page_type(url_path) == 'detail'
+        hedge_delay = self.hedge_delay() if is_detail else None
+        fetch_started = time.monotonic()
         for attempt in range(max_try):
+            self.breaker.before_request()
+            self.rate_limiter.acquire()
+            endpoint = pool.acquire()
+            started = time.monotonic()
+
             try:
-                url = f"https://api.cloudbypass.com/{url_path}"
-                method = "GET"
-                headers = {
-                    "x-cb-apikey": f"{self.apikey}",
-                    "x-cb-host": r"www.propertyguru.com.sg",
-                    "x-cb-version": r"2",
-                    "x-cb-part": r"0",
-                    "x-cb-fp": r"chrome",
-                    "x-cb-proxy": f"{self.proxy}",
-                }
-
-                response = self.get_request(method, url, headers)
-
-                if response and response.status_code == 200:
-                    return response
+                if hedge_delay is not None:
+                    response, endpoint, latency = self._hedged_request(
+                        url_path, endpoint, extra_headers, stream, hedge_delay)
                 else:
-                    logger.error(f"请求失败第 {attempt + 1} 次: {url_path}")
-                    if response:
-                        code = response.json().get('code')
-                        if code in ['CLOUDFLARE_CHALLENGE_TIMEOUT']:
-                            continue
-                        if code in ["PROXY_CONNECT_ABORTED", 'APIKEY_INVALID', 'INSUFFICIENT_BALANCE']:
-                            logger.error(f"致命错误: {url_path} - {response.text}")
-                            os._exit(0)
-            except Exception as e:
+                    response = self._send_request(url_path, endpoint, extra_headers, stream)
+                    latency = time.monotonic() - started
+            except (Exception, FunctionTimedOut) as e:
                 logger.error(f"请求异常第 {attempt + 1} 次: {url_path} - {str(e)}")
+                kind = pool.release(endpoint, ERROR_TRANSIENT, reason=str(e))
+                self.breaker.record_failure(kind, str(e))
+                self._sleep_before_retry(attempt, max_try)
                 continue
+
+            if self._response_ok(response, extra_headers):
+                pool.release(endpoint, latency=latency)
+                self.breaker.record_success()
+                if is_detail:
+                    self.detail_latency.record(latency)
+                    self.detail_completion.record(time.monotonic() - fetch_started)
+                else:
+                    self.list_latency.record(latency)
+                if cacheable and response.status_code == 200:
+                    self.store_cached_response(url_path, response.content)
+                return response
+
+            logger.error(f"请求失败第 {attempt + 1} 次: {url_path}")
+            code = None
+            status_code = None
+            if response is not None:
+                status_code = response.status_code
+                try:
+                    code = response.json().get('code')
+                except Exception:
+                    code = None
+
+            kind = classify_error(code, status_code)
+            # 端点专属的错误（密钥无效、代理中断）在还有其他可用端点时按临时错误处理，换端点重试
+            kind = pool.release(endpoint, kind, latency, reason=f"{code or status_code}")
+            self.breaker.record_failure(kind, f"{code or status_code}: {url_path}")
+
+            if kind == ERROR_FATAL:
+                logger.error(f"致命错误: {url_path} - {response.text}")
+                raise PipelineAbortError(f"{code}: {url_path}")
+            if kind == ERROR_PERMANENT:
+                logger.warning(f"请求返回 {status_code}，不再重试: {url_path}")
+                self._permanent_failures.add(url_path)
+                return None
+
+            self._sleep_before_retry(attempt, max_try)
         return None
 
-    def analysis_list_page(self, response, page, html_name, force_update=False):
-        """解析列表页"""
+    def _send_request(self, url_path, endpoint, extra_headers=None, stream=False):
+        """通过指定端点发出一次请求"""
+        url = f"https://api.cloudbypass.com/{url_path}"
+        method = "GET"
+        headers = {
+            "x-cb-apikey": f"{endpoint.apikey}",
+            "x-cb-host": r"www.propertyguru.com.sg",
+            "x-cb-version": r"2",
+            "x-cb-part": r"0",
+            "x-cb-fp": r"chrome",
+            "x-cb-proxy": f"{endpoint.proxy}",
+        }
+        if extra_headers:
+            headers.update(extra_headers)
+
+        self.count_stat('requests')
+        return self.get_request(method, url, headers, stream=stream)
+
+    @staticmethod
+    def _is_conditional(extra_headers):
+        """请求头中是否带有条件请求头（If-None-Match / If-Modified-Since）"""
+        return bool(extra_headers) and ('If-None-Match' in extra_headers or 'If-Modified-Since' in extra_headers)
+
+    @classmethod
+    def _response_ok(cls, response, extra_headers=None):
+        """200，或条件请求的 304（其他请求头如 Accept-Encoding 不算条件请求）"""
+        return response is not None and (response.status_code == 200 or
+                                         (response.status_code == 304 and cls._is_conditional(extra_headers)))
+
+    # ---------- 对冲请求 ----------
+
+    def hedge_delay(self):
+        """对冲等待时间（详情页请求耗时的 HEDGE_PERCENTILE 分位数）；未启用或样本不足时返回 None"""
+        if not self.HEDGE_REQUESTS or len(self.detail_latency) < self.HEDGE_MIN_SAMPLES:
+            return None
+        return max(self.HEDGE_MIN_DELAY, self.detail_latency.percentile(self.HEDGE_PERCENTILE))
+
+    def get_hedge_executor(self):
+        """对冲模式下执行请求的线程池（原请求和对冲请求都在其中执行，调用线程等待结果）"""
+        if self._hedge_executor is None:
+            with self._hedge_executor_lock:
+                if self._hedge_executor is None:
+                    self._hedge_executor = ThreadPoolExecutor(
+                        max_workers=2 * (self.max_workers + self.step1_max_window()), thread_name_prefix='hedge')
+        return self._hedge_executor
+
+    def _acquire_hedge_endpoint(self, endpoint):
+        """在对冲预算、请求限速和端点并发名额都允许时领取对冲用的端点（不等待），否则返回 None"""
+        if self.breaker.state != CircuitBreaker.CLOSED or not self.hedge_budget.try_spend():
+            return None
+        if not self.rate_limiter.try_acquire():
+            self.hedge_budget.refund()
+            return None
+        backup = self.get_endpoint_pool().try_acquire(exclude=endpoint)
+        if backup is None:
+            self.hedge_budget.refund()
+        return backup
+
+    def _hedged_request(self, url_path, endpoint, extra_headers, stream, delay):
+        """
+        发出请求；超过 delay 秒仍未返回时，通过另一个端点（优先不同代理）再发一次，取先成功返回的结果
+
+        返回 (response, 该响应所用的端点, 耗时)，返回的端点由调用方归还；
+        落后的请求无法中断，返回后关闭响应并归还端点。两次请求都失败时按原请求的结果处理（异常原样抛出）
+        """
+        self.hedge_budget.record_request()
+        executor = self.get_hedge_executor()
+        started = time.monotonic()
+        primary = executor.submit(self._send_request, url_path, endpoint, extra_headers, stream)
+        done, _ = wait([primary], timeout=delay)
+        backup_endpoint = None if done else self._acquire_hedge_endpoint(endpoint)
+        if backup_endpoint is None:
+            return primary.result(), endpoint, time.monotonic() - started
+
+        self.count_stat('hedged')
+        logger.debug(f"请求超过 {delay:.1f} 秒未返回，发出对冲请求（{backup_endpoint.name}）: {url_path}")
+        backup_started = time.monotonic()
+        backup = executor.submit(self._send_request, url_path, backup_endpoint, extra_headers, stream)
+        owners = {primary: (endpoint, started), backup: (backup_endpoint, backup_started)}
+
+        winner = None
+        pending = {primary, backup}
+        while pending and winner is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winner = next((future for future in done if future.exception() is None
+                           and self._response_ok(future.result(), extra_headers)), None)
+        if winner is None:
+            winner = primary
+        loser = backup if winner is primary else primary
+        loser_endpoint = owners[loser][0]
+        loser.add_done_callback(lambda future: self._discard_hedge_loser(future, loser_endpoint, extra_headers))
+
+        if winner is backup:
+            self.count_stat('hedge_wins')
+        winner_endpoint, winner_started = owners[winner]
+        return winner.result(), winner_endpoint, time.monotonic() - winner_started
+
+    def _discard_hedge_loser(self, future, endpoint, extra_headers):
+        """对冲中落后的请求：关闭响应，按其结果归还端点（不计入熔断器）"""
+        response = None if future.exception() is not None else future.result()
+        kind = None if self._response_ok(response, extra_headers) else ERROR_TRANSIENT
+        self.get_endpoint_pool().release(endpoint, kind, reason="对冲请求失败")
+        if response is not None:
+            try:
+                response.close()
+            except Exception:
+                pass
+
+    def get_endpoint_pool(self):
+        """请求端点池（首次请求时创建，之后修改 apikey / proxy / ENDPOINTS 需把 endpoint_pool 置为 None）"""
+        if self.endpoint_pool is None:
+            with self._endpoint_pool_lock:
+                if self.endpoint_pool is None:
+                    self.endpoint_pool = build_endpoint_pool(
+                        self.ENDPOINTS, self.apikey, self.proxy, self.ENDPOINT_MAX_CONCURRENCY,
+                        quarantine_failures=self.ENDPOINT_QUARANTINE_FAILURES,
+                        quarantine_seconds=self.ENDPOINT_QUARANTINE_SECONDS,
+                        max_quarantine_seconds=self.ENDPOINT_MAX_QUARANTINE_SECONDS,
+                        min_success_rate=self.ENDPOINT_MIN_SUCCESS_RATE,
+                    )
+                    if len(self.endpoint_pool) > 1:
+                        logger.info(f"请求端点池: {len(self.endpoint_pool)} 个端点")
+        return self.endpoint_pool
+
+    def log_endpoint_stats(self):
+        """输出各请求端点的请求数、成功率、延迟和隔离状态（只有一个端点时不输出）"""
+        if self.endpoint_pool is None or len(self.endpoint_pool) < 2:
+            return None
+        stats = self.endpoint_pool.snapshot()
+        for item in stats:
+            state = f"已停用（{item['disabled']}）" if item['disabled'] else (
+                f"隔离中（剩余 {item['quarantined_for']:.0f} 秒）" if item['quarantined_for'] else "正常")
+            latency = f"{item['latency']:.2f}s" if item['latency'] is not None else "-"
+            logger.info(f"🔌 {item['name']}: 请求 {item['requests']} 次 | 失败 {item['failures']} 次 | "
+                        f"成功率 {item['success_rate']:.0%} | 延迟 {latency} | {state}")
+        return stats
+
+    # ---------- 响应缓存 ----------
+
+    def cache_page_type(self, url_path):
+        """缓存按页面类型设置有效期：列表页 'list'，详情页和 Next.js JSON 路由 'detail'"""
+        return 'list' if self.parse_list_url(url_path) else 'detail'
+
+    def get_cached_response(self, url_path):
+        """读取未过期的缓存；未启用缓存或 cache_bypass 时返回 None"""
+        if self.response_cache is None or self.RESPONSE_CACHE_BYPASS:
+            return None
+        cached = self.response_cache.get(url_path, self.cache_page_type(url_path))
+        if cached is not None:
+            self.count_stat('cache_hits')
+            logger.debug(f"使用缓存: {url_path}")
+        return cached
+
+    def store_cached_response(self, url_path, content):
+        """写入缓存；只缓存包含页面数据的响应（HTML 中有 __NEXT_DATA__，或 JSON 路由），避免缓存验证页等异常页面"""
+        if self.response_cache is None:
+            return
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        if not url_path.startswith('_next/data/') and b'id="__NEXT_DATA__"' not in content:
+            return
+        self.response_cache.put(url_path, self.cache_page_type(url_path), content)
+
+    @contextmanager
+    def cache_bypassed(self, enabled=True):
+        """在 with 块内不读缓存（仍写入）：全量爬取、过期更新、重试时使用"""
+        previous = self.RESPONSE_CACHE_BYPASS
+        self.RESPONSE_CACHE_BYPASS = previous or enabled
+        try:
+            yield
+        finally:
+            self.RESPONSE_CACHE_BYPASS = previous
+
+    def log_cache_stats(self):
+        """输出响应缓存统计"""
+        if self.response_cache is None:
+            return None
+        stats = self.response_cache.stats()
+        logger.info(
+            f"🗃️  响应缓存: 命中 {stats['hits']} 次 | 未命中 {stats['misses']} 次 | 过期 {stats['expired']} 次 | "
+            f"命中率 {stats['hit_rate']:.1%} | 写入 {stats['stores']} 条 | 淘汰 {stats['evictions']} 条 | "
+            f"大小 {stats['bytes'] / 1024 / 1024:.1f}/{self.RESPONSE_CACHE_MAX_MB} MB"
+        )
+        return stats
+
+    def _sleep_before_retry(self, attempt, max_try):
+        if attempt + 1 < max_try:
+            time.sleep(backoff_delay(attempt, self.RETRY_BACKOFF_BASE, self.RETRY_BACKOFF_MAX))
+
+    def analysis_list_page(self, response, page, html_name, force_update=False, page_info=None, buy_rent=None):
+        """
+        解析列表页
+
+        page_info: 可选的 dict，解析后写入本页房源数量 listing_count 以及
+                   分页信息 total_pages / total_listings（解析不到时为 None）
+        buy_rent: 写入记录的租/售类型，默认与 html_name 相同（分片爬取时 html_name 为分片名）
+        """
         consecutive_exists = 0
         new_records = 0
 
         with open(os.path.join(self.html_dir, f'{html_name}_page_{page}.html'), 'w', encoding='utf-8') as f:
             f.write(response.text)
 
-        data_json = re.findall('<script id="__NEXT_DATA__" type="application/json".*?>(.*?)</script>', 
-                              response.text, re.S)
-        if not data_json:
+        text = response.text
+        parsed = next_data.parse_list_page(text)
+        if parsed is None:
             logger.error(f"data_json 获取失败：{page}")
             return consecutive_exists, new_records
 
-        data_json = json.loads(data_json[0])
+        self.next_build_id = parsed['build_id'] or self.next_build_id
 
+        # 直接保存 __NEXT_DATA__ 原文，不再为写文件解析、重新序列化整个 JSON
         with open(os.path.join(self.json_dir, f'{html_name}_page_{page}.json'), 'w', encoding='utf-8') as f:
-            json.dump(data_json, f, ensure_ascii=False, indent=4)
+            f.write(text[parsed['span'][0]:parsed['span'][1]])
 
-        listingsData = data_json.get('props', {}).get('pageProps', {}).get('pageData', {}).get('data', {}).get(
-            'listingsData', [])
+        listingsData = parsed['listings']
         logger.info(f"{html_name} {page}页数据数量：{len(listingsData)}")
 
-        for item in listingsData:
-            listingData = item.get('listingData', {})
-            url_path = listingData.get("url", "").replace('https://www.propertyguru.com.sg/', '')
-
-            if not force_update and self.check_record_exists(url_path):
+        if page_info is not None:
+            total_pages, total_listings = self.extract_pagination(parsed['pagination'], len(listingsData))
+            if total_pages is None and total_listings is None:
+                # 分页信息不在 *pagination* 子树中，完整解析一次
+                full = next_data.parse_list_page_full(text, parsed['span'])
+                total_pages, total_listings = self.extract_pagination(full['pagination'], len(listingsData))
+            page_info.update(listing_count=len(listingsData), total_pages=total_pages, total_listings=total_listings)
+
+        columns = extract_listing_columns(listingsData, buy_rent or html_name)
+        url_paths = columns['url_path']
+        existing = set() if force_update else self.get_existing_url_paths(url_paths)
+
+        to_write = []
+        for index, url_path in enumerate(url_paths):
+            if url_path in existing:
                 consecutive_exists += 1
                 logger.debug(f"记录已存在: {url_path} (连续第{consecutive_exists}条)")
                 continue
             else:
                 consecutive_exists = 0
                 new_records += 1
+                to_write.append(index)
 
-            # 提取数据
-            id_ = listingData.get('id', '无id')
-            localizedTitle = listingData.get('localizedTitle', '无标题')
-            fullAddress = listingData.get('fullAddress', '无地址')
-            price_pretty = listingData.get('price', {}).get('pretty', '无价格')
-
-            beds = "未知"
-            baths = "未知"
-            area_sqft = "未知"
-            price_psf = "未知"
-
-            bedrooms = listingData.get('bedrooms')
-            if bedrooms is not None and bedrooms >= 0:
-                beds = f"{bedrooms} Beds"
-
-            bathrooms = listingData.get('bathrooms')
-            if bathrooms is not None and bathrooms >= 0:
-                baths = f"{bathrooms} Baths"
-
-            floorArea = listingData.get('floorArea')
-            if floorArea:
-                area_sqft = f"{floorArea} sqft"
-
-            pricePerArea = listingData.get('pricePerArea', {}).get('localeStringValue')
-            if pricePerArea:
-                price_psf = f"S$ {pricePerArea} psf"
-
-            listingFeatures = listingData.get('listingFeatures', [])
-            if listingFeatures:
-                for feature_item in listingFeatures:
-                    if isinstance(feature_item, list):
-                        for sub_feature in feature_item:
-                            text = sub_feature.get("text", "")
-                            if "sqft" in text and area_sqft == "未知":
-                                area_sqft = text
-                    elif isinstance(feature_item, dict):
-                        text = feature_item.get("text", "")
-                        icon_name = feature_item.get("iconName", "")
-
-                        if icon_name == "bed-o" and beds == "未知":
-                            beds = text
-                        elif icon_name == "bath-o" and baths == "未知":
-                            baths = text
-                        elif icon_name == "room-o" and beds == "未知":
-                            beds = text
-                        elif "sqft" in text and area_sqft == "未知":
-                            area_sqft = text
-
-            nearbyText = listingData.get("mrt", {}).get('nearbyText', '无地铁')
-            badges = listingData.get("badges", [])
-
-            built_year = "未知"
-            property_type = "未知"
-            tenure = "未知"
-
-            for badge in badges:
-                badge_name = badge.get("name", "")
-                badge_text = badge.get("text", "")
-
-                if badge_name == "launch" and "Built:" in badge_text:
-                    built_year = badge_text
-                elif badge_name == "unit_type":
-                    property_type = badge_text
-                elif badge_name == "tenure":
-                    tenure = badge_text
-
-            if tenure == '未知':
-                try:
-                    tenure = listingData.get('additionalData', {}).get('tenure', '未知')
-                except:
-                    tenure = "未知"
-
-            recency_text = listingData.get("recency", {}).get("text", '无更新时间')
-            agent = listingData.get("agent", {})
-            agent_id = agent.get("id", '无id')
-            agent_name = agent.get("name", '无名字')
-            agent_description = agent.get("description", '无描述')
-            agent_url_path = agent.get("profileUrl")
-
-            dic = {
-                'ID': id_,
-                "localizedTitle": localizedTitle,
-                "fullAddress": fullAddress,
-                "price_pretty": price_pretty,
-                "beds": beds,
-                "baths": baths,
-                "area_sqft": area_sqft,
-                "price_psf": price_psf,
-                "nearbyText": nearbyText,
-                "built_year": built_year,
-                "property_type": property_type,
-                "tenure": tenure,
-                "url_path": url_path,
-                "recency_text": recency_text,
-                "agent_id": agent_id,
-                "agent_name": agent_name,
-                "agent_description": agent_description,
-                "agent_url_path": agent_url_path,
-                "CEA": '',
-                "mobile": '',
-                "rating": '',
-                "buy_rent": html_name
-            }
-            self.insert_record(dic, force_update=force_update)
+        written = self.insert_listings(listing_rows(columns, to_write), force_update=force_update, seen=url_paths)
+        sink = self._detail_sink
+        if sink is not None and written:
+            sink([url_paths[index] for index in to_write])
+
+        if page_info is not None:
+            page_info['new_records'] = new_records
 
         return consecutive_exists, new_records
 
-    def get_data(self, url_path, page, html_name, force_update=False):
-        """获取页面数据"""
-        if not force_update and self.check_spider_record(url_path):
-            logger.info(f"页面已爬取: {url_path}")
-            return 0, 0
+    @staticmethod
+    def extract_pagination(data, page_size=0):
+        """从 pageData.data（或只包含分页子树的部分字典）中读取分页信息，返回 (总页数, 总房源数)，读取不到时为 None"""
+
+        candidates = [data]
+        for key, value in data.items():
+            if isinstance(value, dict) and 'pagination' in key.lower():
+                candidates.insert(0, value)
+
+        total_pages = None
+        total_listings = None
+        for candidate in candidates:
+            for key in ('totalPages', 'pageCount', 'lastPage', 'totalPage'):
+                if total_pages is None and isinstance(candidate.get(key), int):
+                    total_pages = candidate[key]
+            for key in ('totalCount', 'totalListings', 'total', 'totalItems'):
+                if total_listings is None and isinstance(candidate.get(key), int):
+                    total_listings = candidate[key]
+
+        if total_pages is None and total_listings is not None:
+            per_page = None
+            for candidate in candidates:
+                for key in ('itemsPerPage', 'pageSize', 'perPage', 'limit'):
+                    if per_page is None and isinstance(candidate.get(key), int) and candidate[key] > 0:
+                        per_page = candidate[key]
+            per_page = per_page or page_size
+            if per_page:
+                total_pages = math.ceil(total_listings / per_page)
+
+        return total_pages, total_listings
+
+    def set_total_pages(self, category, total_pages):
+        """只更新总页数，不改变 last_page 和 last_update（不影响时间窗口判断）"""
+        conn = None
+        try:
+            with self.db_lock:
+                conn = self._connect()
+                cursor = conn.cursor()
+                cursor.execute("UPDATE crawl_progress SET total_pages = ? WHERE category = ?", (total_pages, category))
+                if cursor.rowcount == 0:
+                    cursor.execute(
+                        "INSERT INTO crawl_progress (category, last_page, total_pages, last_update) VALUES (?, ?, ?, ?)",
+                        (category, 1, total_pages, datetime.now())
+                    )
+                conn.commit()
+        except Exception as e:
+            logger.error(f"更新总页数失败: {str(e)}")
+        finally:
+            if conn:
+                conn.close()
+
+    def get_stored_total_pages(self, category):
+        """读取数据库中记录的总页数"""
+        conn = None
+        try:
+            with self.db_lock:
+                conn = self._connect()
+                cursor = conn.cursor()
+                cursor.execute("SELECT total_pages FROM crawl_progress WHERE category = ?", (category,))
+                result = cursor.fetchone()
+                return result[0] if result and result[0] else None
+        except Exception as e:
+            logger.error(f"读取总页数失败: {str(e)}")
+            return None
+        finally:
+            if conn:
+                conn.close()
+
+    def discover_total_pages(self, category, page_info=None, params=None):
+        """请求第一页，从分页信息中获取总页数并写入 crawl_progress.total_pages"""
+        key = self.shard_key(category, params)
+        url_path = self.list_page_url(category, 1, params)
+        logger.info(f"🔎 获取 {key} 总页数：{url_path}")
+
+        page_info = {} if page_info is None else page_info
+        response = self.fetch(url_path)
+        if response:
+            self.analysis_list_page(response, 1, key, page_info=page_info, buy_rent=category)
+
+        total_pages = page_info.get('total_pages')
+        if total_pages:
+            logger.success(f"{key} 总页数: {total_pages}（房源总数: {page_info.get('total_listings') or '未知'}）")
+            self.set_total_pages(key, total_pages)
+            return total_pages
+
+        total_pages = self.get_stored_total_pages(key) or self.DEFAULT_TOTAL_PAGES.get(category)
+        if page_info.get('listing_count') == 0:
+            # 分片没有任何房源
+            total_pages = 0
+        logger.warning(f"未能从首页获取 {key} 分页信息，使用已知总页数: {total_pages}")
+        return total_pages
+
+    @staticmethod
+    def list_page_url(category, page, params=None):
+        """列表页 url_path，分片爬取时附带筛选参数"""
+        url_path = f'{category}/{page}'
+        if params:
+            url_path += '?' + urlencode(sorted(params.items()))
+        return url_path
+
+    @staticmethod
+    def parse_list_url(url_path):
+        """解析列表页 url_path，返回 (category, page, params)；不是列表页时返回 None"""
+        match = re.match(r'(property-for-rent|property-for-sale)/(\d+)(?:\?(.*))?$', url_path)
+        if not match:
+            return None
+        params = dict(parse_qsl(match.group(3))) if match.group(3) else None
+        return match.group(1), int(match.group(2)), params
+
+    @staticmethod
+    def shard_key(category, params=None):
+        """分片名：用作 crawl_progress 的 category 以及保存文件的前缀"""
+        if not params:
+            return category
+        suffix = '_'.join(f'{k}-{v}' for k, v in sorted(params.items()))
+        suffix = re.sub(r'[^\w\-]+', '-', suffix)
+        return f"{category}__{suffix}"
+
+    def build_search_shards(self, categories=None, districts=None, property_types=None, price_bands=None):
+        """
+        生成分片列表（各维度的笛卡尔积）
 
-        logger.info(f"开始请求：{url_path}")
+        参数:
+        - districts: 区域代码列表，如 ['D01', 'D02']；传 'all' 表示 D01-D28
+        - property_types: 物业类型列表，如 ['N', 'L', 'H']（公寓/有地/组屋）
+        - price_bands: 价格区间列表，如 [(0, 3000), (3000, None)]
+        """
+        if districts == 'all':
+            districts = [f'D{i:02d}' for i in range(1, 29)]
+
+        shards = []
+        for category in categories or self.STEP1_CATEGORIES:
+            for district in districts or [None]:
+                for property_type in property_types or [None]:
+                    for price_band in price_bands or [None]:
+                        params = {}
+                        if district:
+                            params[self.SHARD_PARAM_NAMES['district']] = district
+                        if property_type:
+                            params[self.SHARD_PARAM_NAMES['property_type']] = property_type
+                        if price_band:
+                            min_price, max_price = price_band
+                            if min_price is not None:
+                                params[self.SHARD_PARAM_NAMES['min_price']] = min_price
+                            if max_price is not None:
+                                params[self.SHARD_PARAM_NAMES['max_price']] = max_price
+                        shards.append({'category': category, 'params': params})
+        return shards
+
+    def get_data(self, url_path, page, html_name, force_update=False, page_info=None, buy_rent=None):
+        """获取页面数据（是否需要爬取由调用方按 crawl_pages 页表判断，页面状态也由调用方批量写入）"""
+        logger.debug(f"开始请求：{url_path}")
         response = self.fetch(url_path)
         if not response:
             logger.error(f"请求失败：{url_path}")
             self.add_failed_record(url_path, "请求失败")
             return 0, 0
 
-        logger.info(f"请求成功：{url_path}")
-        consecutive_exists, new_records = self.analysis_list_page(response, page, html_name, force_update)
-        self.insert_spider_record(url_path, '已爬取')
-
-        return consecutive_exists, new_records
+        if self.log_sampler.sample('list_request'):
+            logger.info(f"请求成功：{url_path}")
+        return self.analysis_list_page(response, page, html_name, force_update, page_info, buy_rent)
 
-    def crawl_category(self, category, start_page, end_page, incremental=True):
-        """爬取某个分类（支持智能增量更新）"""
-        if incremental:
-            last_page, _ = self.get_crawl_progress(category)
+    def crawl_category(self, category, start_page=1, end_page=None, incremental=True, params=None):
+        """
+        爬取某个分类（支持智能增量更新）
 
-            if last_page > 1:
-                review_start = max(1, last_page - self.REVIEW_PAGES)
-                logger.info(f"🔄 回溯检查第 {review_start}-{last_page - 1} 页（共{last_page - review_start}页）")
+        end_page 为 None 时从首页分页信息中获取总页数（不含 end_page，与 range 一致）。
+        params 为分片筛选参数，每个分片在 crawl_progress / crawl_pages 中有独立的进度记录。
+        增量模式继续未完成的一轮时，只爬取本轮 crawl_pages 中缺失或失败的页（不再回溯重爬）；
+        每个并发窗口的页面状态批量写入一次。
 
-                for page in range(review_start, last_page):
-                    url_path = f'{category}/{page}'
-                    self.get_data(url_path, page, category, force_update=True)
-                    time.sleep(1)
+        返回本轮是否完成了一次完整遍历（从第 1 页爬到列表末尾、没有失败页、没有因无新记录早停），
+        只有完整遍历才计入下架检测（见 record_full_pass）
+        """
+        key = self.shard_key(category, params)
+        # 先开始本轮再爬首页：首页房源的 last_seen_at 不早于本轮开始时间（下架检测以此为基准）
+        run_id, done = self.start_crawl_run(key, resume=incremental)
 
-                start_page = last_page
+        first_page_info = None
+        if end_page is None:
+            first_page_info = {}
+            end_page = self.discover_total_pages(category, page_info=first_page_info, params=params) + 1
 
         pages_without_new = 0
+        empty_pages = 0
+        failed_pages = 0
 
-        for page in range(start_page, end_page):
-            url_path = f'{category}/{page}'
-            consecutive_exists, new_records = self.get_data(url_path, page, category)
-
-            if new_records == 0:
-                pages_without_new += 1
-                logger.info(f"⚠️  第 {page} 页无新记录（连续第{pages_without_new}页）")
+        # 首页已在获取总页数时爬取，直接计入结果
+        if first_page_info and start_page == 1:
+            if first_page_info.get('new_records'):
+                logger.info(f"✅ 第 1 页新增 {first_page_info['new_records']} 条记录")
             else:
-                pages_without_new = 0
-                logger.info(f"✅ 第 {page} 页新增 {new_records} 条记录")
-
-            if pages_without_new >= self.PAGES_WITHOUT_NEW_THRESHOLD:
-                logger.warning(
-                    f"连续 {pages_without_new} 页无新记录（阈值: {self.PAGES_WITHOUT_NEW_THRESHOLD}），停止爬取"
-                )
-                break
+                pages_without_new = 1
+                logger.info(f"⚠️  第 1 页无新记录（连续第{pages_without_new}页）")
+            self.record_page_states(key, [self._page_state(1, first_page_info)], run_id)
+            done.add(1)
+
+        pending = [page for page in range(start_page, end_page) if page not in done]
+        skipped = end_page - start_page - len(pending)
+        if skipped > 0 and not (skipped == 1 and first_page_info):
+            logger.info(f"📋 {key} 第 {run_id} 轮: 已完成 {skipped} 页，待爬取 {len(pending)} 页，"
+                        f"并发窗口: {self.step1_window(len(pending))}")
+        else:
+            logger.info(f"📋 {key} 爬取计划: 第 {start_page}-{end_page - 1} 页，"
+                        f"并发窗口: {self.step1_window(len(pending))}")
+
+        stop = False
+        early_stop = False
+        index = 0
+        while index < len(pending) and not stop:
+            # 并发窗口：待爬取的页不一定连续；限速时随列表页耗时调整
+            window = pending[index:index + self.step1_window(len(pending))]
+            index += len(window)
+            results = self.crawl_page_window(category, window, params)
+            states = [self._page_state(page_no, page_info) for page_no, (_, _, page_info) in zip(window, results)]
+            self.record_page_states(key, states, run_id)
+
+            for (page_no, status, listing_count, _), (consecutive_exists, new_records, _) in zip(states, results):
+                if status == 'failed':
+                    # 失败的页已写入失败记录，本轮未完成，下次运行时补爬；不计入早停条件
+                    failed_pages += 1
+                    continue
+
+                if new_records == 0:
+                    pages_without_new += 1
+                    logger.info(f"⚠️  第 {page_no} 页无新记录（连续第{pages_without_new}页）")
+                else:
+                    pages_without_new = 0
+                    logger.info(f"✅ 第 {page_no} 页新增 {new_records} 条记录")
+
+                if listing_count == 0:
+                    empty_pages += 1
+                elif listing_count:
+                    empty_pages = 0
+
+                if empty_pages >= self.EMPTY_PAGES_THRESHOLD:
+                    last_non_empty = page_no - empty_pages
+                    logger.warning(f"连续 {empty_pages} 页没有房源，已到达列表末尾（第 {last_non_empty} 页），停止爬取")
+                    self.set_total_pages(key, last_non_empty)
+                    stop = True
+                    break
+
+                if pages_without_new >= self.PAGES_WITHOUT_NEW_THRESHOLD:
+                    logger.warning(
+                        f"连续 {pages_without_new} 页无新记录（阈值: {self.PAGES_WITHOUT_NEW_THRESHOLD}），停止爬取"
+                    )
+                    stop = early_stop = True
+                    break
 
-            self.update_crawl_progress(category, page + 1, end_page - 1)
             time.sleep(1)
 
-        logger.success(f"{category} 爬取完成")
+        if stop or not failed_pages:
+            self.complete_crawl_run(key, run_id)
+            logger.success(f"{key} 爬取完成")
+        else:
+            logger.warning(f"{key} 有 {failed_pages} 页爬取失败，下次增量爬取时只补爬这些页")
+        return start_page == 1 and first_page_info is not None and not failed_pages and not early_stop
+
+    def step1_max_window(self):
+        """Step 1 并发窗口上限：STEP1_WORKERS，未设置时为 max_workers"""
+        return self.STEP1_WORKERS or self.max_workers
+
+    def step1_window(self, page_count):
+        """
+        Step 1 并发窗口：按本轮待爬取的页数确定（每 STEP1_PAGES_PER_WORKER 页一个并发），不超过 step1_max_window；
+        限速时不超过一次列表页请求耗时（中位数）内限速器能放行的请求数，更大的窗口只会在限速器上排队
+        """
+        window = min(math.ceil(page_count / self.STEP1_PAGES_PER_WORKER), self.step1_max_window())
+        if self.REQUEST_DELAY and self.REQUEST_DELAY > 0:
+            latency = self.list_latency.percentile(50)
+            window = min(window, max(self.RATE_LIMIT_BURST, math.ceil(latency / self.REQUEST_DELAY) if latency else 1))
+        return max(1, window)
+
+    def crawl_page_window(self, category, pages, params=None):
+        """并发爬取一个窗口内的列表页，按页码顺序返回 [(consecutive_exists, new_records, page_info), ...]"""
+        key = self.shard_key(category, params)
+
+        def _crawl(page):
+            page_info = {}
+            consecutive_exists, new_records = self.get_data(
+                self.list_page_url(category, page, params), page, key, page_info=page_info, buy_rent=category)
+            return consecutive_exists, new_records, page_info
+
+        if len(pages) == 1:
+            return [_crawl(pages[0])]
+
+        with ThreadPoolExecutor(max_workers=len(pages)) as executor:
+            return list(executor.map(_crawl, pages))
+
+    def crawl_shards(self, shards, incremental=True):
+        """并行爬取多个筛选分片，重复房源通过 url_path 主键去重；返回 {分片名: 是否完成完整遍历}"""
+        logger.info(f"🧩 分片爬取：共 {len(shards)} 个分片，并行数: {self.STEP1_SHARD_WORKERS}")
+
+        with ThreadPoolExecutor(max_workers=self.STEP1_SHARD_WORKERS) as executor:
+            future_to_key = {
+                executor.submit(
+                    self.crawl_category, shard['category'], incremental=incremental, params=shard.get('params')
+                ): self.shard_key(shard['category'], shard.get('params'))
+                for shard in shards
+            }
+            full_passes = {}
+            for index, future in enumerate(as_completed(future_to_key), 1):
+                key = future_to_key[future]
+                try:
+                    full_passes[key] = future.result()
+                    logger.success(f"[{index}/{len(shards)}] 分片完成: {key}")
+                except PipelineAbortError:
+                    self._cancel_pending(future_to_key)
+                    raise
+                except Exception as exc:
+                    full_passes[key] = False
+                    logger.error(f"[{index}/{len(shards)}] 分片异常: {key} - {str(exc)}")
+        return full_passes
+
+    def step1_crawl_listings(self, mode='smart_incremental', shards=None):
+        """
+        Step 1: 爬取房产列表（总页数从首页分页信息中获取）
 
-    def step1_crawl_listings(self, mode='smart_incremental'):
-        """Step 1: 爬取房产列表"""
+        shards: 分片列表（默认使用 SEARCH_SHARDS），非空时按分片并行爬取
+        """
         logger.info("=" * 60)
         logger.info("Step 1: 开始爬取房产列表")
         logger.info("=" * 60)
 
+        shards = shards if shards is not None else self.SEARCH_SHARDS
+        incremental = mode != 'full'
+
         if mode == 'full':
             logger.info("📊 执行全量爬取")
-            self.crawl_category('property-for-rent', 1, 1484, incremental=False)
-            self.crawl_category('property-for-sale', 1, 2663, incremental=False)
         else:
             logger.info("⚡ 执行增量爬取")
-            self.crawl_category('property-for-rent', 1, 1484, incremental=True)
-            self.crawl_category('property-for-sale', 1, 2663, incremental=True)
 
+        # 全量爬取不使用缓存（增量模式的回溯检查、中断后重跑可以复用几分钟前的页面）
+        with self.cache_bypassed(mode == 'full'):
+            if shards:
+                full_passes = self.crawl_shards(shards, incremental=incremental)
+                # 一个分类的所有分片都完成完整遍历，才算该分类的一次完整遍历
+                categories = {}
+                for shard in shards:
+                    key = self.shard_key(shard['category'], shard.get('params'))
+                    categories.setdefault(shard['category'], []).append(key)
+                for category, keys in categories.items():
+                    if all(full_passes.get(key) for key in keys):
+                        self.record_full_pass(category, keys)
+            else:
+                for category in self.STEP1_CATEGORIES:
+                    if self.crawl_category(category, incremental=incremental):
+                        self.record_full_pass(category)
+
+        self.log_cache_stats()
+        self.log_endpoint_stats()
         logger.success("Step 1 完成：房产列表爬取完成")
 
+    # ==================== 下架检测 ====================
+
+    # 归档表的列（与 propertyguru 相同，另有 archived_at）
+    ARCHIVE_COLUMNS = listing_schema.COLUMNS
+
+    def record_full_pass(self, category, crawl_keys=None):
+        """
+        记录分类 category 的一次完整遍历，返回移入归档表的记录数
+
+        本轮开始后没有在列表页中出现的房源 missed_passes + 1，连续 DELIST_MISSED_PASSES 次未出现的移入归档表。
+        crawl_keys: 本次遍历的 crawl_progress 分类名（分片爬取时为该分类的所有分片），默认为 category，
+        以其中最早的本轮开始时间为基准；未出现的比例超过 DELIST_MAX_MISSING_RATIO 时视为遍历不完整，不计入
+        """
+        if not self.DELIST_MISSED_PASSES:
+            return 0
+        crawl_keys = crawl_keys or [category]
+        conn = None
+        try:
+            with self.db_lock:
+                conn = self._connect()
+                cursor = conn.cursor()
+                placeholders = ','.join('?' * len(crawl_keys))
+                started_at = cursor.execute(
+                    f"SELECT MIN(run_started_at) FROM crawl_progress WHERE category IN ({placeholders})", crawl_keys
+                ).fetchone()[0]
+                if started_at is None:
+                    return 0
+
+                # 按分类扫描全表，直接读写 listings（buy_rent 按字典 id 比较，不经过视图逐行解码）
+                buy_rent_id = listing_schema.encode_sql('?')
+                total, missing = cursor.execute(f'''
+                    SELECT COUNT(*), SUM(last_seen_at IS NULL OR last_seen_at < ?)
+                    FROM listings WHERE buy_rent_id = {buy_rent_id}
+                ''', (started_at, category)).fetchone()
+                missing = missing or 0
+                if total and missing / total > self.DELIST_MAX_MISSING_RATIO:
+                    logger.warning(
+                        f"{category} 本次遍历有 {missing}/{total} 条房源未出现（超过 {self.DELIST_MAX_MISSING_RATIO:.0%}），"
+                        f"可能遍历不完整，不计入下架检测"
+                    )
+                    return 0
+
+                cursor.execute(f'''
+                    UPDATE listings SET missed_passes = COALESCE(missed_passes, 0) + 1
+                    WHERE buy_rent_id = {buy_rent_id} AND (last_seen_at IS NULL OR last_seen_at < ?)
+                ''', (category, started_at))
+                archived = self._archive_delisted(cursor, category)
+                conn.commit()
+
+            logger.info(
+                f"🔎 {category} 完整遍历: {missing} 条房源未出现，"
+                f"{archived} 条连续 {self.DELIST_MISSED_PASSES} 次未出现，已移入归档表"
+            )
+            return archived
+        except Exception as e:
+            logger.error(f"下架检测失败: {category} - {str(e)}")
+            return 0
+        finally:
+            if conn:
+                conn.close()
+
+    def _archive_delisted(self, cursor, category):
+        """把 missed_passes 达到阈值的房源移入归档表（调用方负责事务），返回归档的记录数"""
+        columns = ', '.join(self.ARCHIVE_COLUMNS)
+        rows = cursor.execute(
+            f"SELECT {columns} FROM propertyguru WHERE buy_rent = ? AND missed_passes >= ?",
+            (category, self.DELIST_MISSED_PASSES)
+        ).fetchall()
+        if not rows:
+            return 0
+
+        now = datetime.now()
+        placeholders = ', '.join('?' * (len(self.ARCHIVE_COLUMNS) + 1))
+        cursor.executemany(
+            f"INSERT OR REPLACE INTO propertyguru_archive ({columns}, archived_at) VALUES ({placeholders})",
+            [row + (now,) for row in rows]
+        )
+        url_paths = [(market_stats.row_url_path(row),) for row in rows]
+        cursor.executemany("DELETE FROM propertyguru WHERE url_path = ?", url_paths)
+        # 已下架的房源不再需要重试、重爬和条件请求
+        for table in ('failed_records', 'recrawl_schedule', 'http_validators'):
+            cursor.executemany(f"DELETE FROM {table} WHERE url_path = ?", url_paths)
+
+        delta = market_stats.MarketStatsDelta()
+        for row in rows:
+            delta.remove(market_stats.row_stats_values(row))
+        delta.apply(cursor, now)
+        return len(rows)
+
     # ==================== Step 2: 详细页爬取（多线程） ====================
 
-    def get_incomplete_records(self):
-        """获取代理信息不完整的记录"""
+    def get_incomplete_records(self, with_meta=False):
+        """
+        获取代理信息不完整的记录
+
+        with_meta=True 时返回 [(url_path, created_at, recency_text, price_pretty, buy_rent), ...]，供优先级调度使用
+        """
+        columns = "url_path, created_at, recency_text, price_pretty, buy_rent" if with_meta else "url_path"
+        conn = None
         try:
             with self.db_lock:
-                conn = sqlite3.connect(self.db_path)
+                conn = self._connect()
                 cursor = conn.cursor()
 
-                cursor.execute('''
-                    SELECT url_path
+                cursor.execute(f'''
+                    SELECT {columns}
                     FROM propertyguru
-                    WHERE (CEA IS NULL OR CEA = '' OR CEA = '无CEA')
-                       OR (mobile IS NULL OR mobile = '' OR mobile = '无手机')
-                       OR (rating IS NULL OR rating = '' OR rating = '无评分')
+                    WHERE (COALESCE(CEA, '') IN ('', '无CEA')
+                       OR COALESCE(mobile, '') IN ('', '无手机')
+                       OR COALESCE(rating, '') IN ('', '无评分'))
+                      AND url_path NOT IN (SELECT url_path FROM dead_letters)
                 ''')
 
                 results = cursor.fetchall()
-                url_paths = [row[0] for row in results]
-                logger.info(f"找到 {len(url_paths)} 条代理信息不完整的记录")
-                return url_paths
+
+            logger.info(f"找到 {len(results)} 条代理信息不完整的记录")
+            if with_meta:
+                return results
+            return [row[0] for row in results]
 
         except Exception as e:
             logger.error(f"获取不完整记录失败: {str(e)}")
@@ -645,9 +1716,10 @@ class PropertyGuruPipeline:
         if days is None:
             days = self.AGENT_INFO_EXPIRY_DAYS
 
+        conn = None
         try:
             with self.db_lock:
-                conn = sqlite3.connect(self.db_path)
+                conn = self._connect()
                 cursor = conn.cursor()
 
                 expiry_date = datetime.now() - timedelta(days=days)
@@ -656,20 +1728,20 @@ class PropertyGuruPipeline:
                     SELECT url_path, updated_at
                     FROM propertyguru
                     WHERE updated_at < ?
-                      AND CEA IS NOT NULL AND CEA != '' AND CEA != '无CEA'
-                      AND mobile IS NOT NULL AND mobile != '' AND mobile != '无手机'
-                      AND rating IS NOT NULL AND rating != '' AND rating != '无评分'
+                      AND COALESCE(CEA, '') NOT IN ('', '无CEA')
+                      AND COALESCE(mobile, '') NOT IN ('', '无手机')
+                      AND COALESCE(rating, '') NOT IN ('', '无评分')
                 ''', (expiry_date,))
 
                 results = cursor.fetchall()
                 url_paths = [row[0] for row in results]
 
-                if url_paths:
-                    logger.info(f"找到 {len(url_paths)} 条代理信息已过期的记录（超过{days}天未更新）")
-                else:
-                    logger.info(f"没有过期的代理信息（阈值: {days}天）")
+            if url_paths:
+                logger.info(f"找到 {len(url_paths)} 条代理信息已过期的记录（超过{days}天未更新）")
+            else:
+                logger.info(f"没有过期的代理信息（阈值: {days}天）")
 
-                return url_paths
+            return url_paths
 
         except Exception as e:
             logger.error(f"获取过期记录失败: {str(e)}")
@@ -678,33 +1750,245 @@ class PropertyGuruPipeline:
             if conn:
                 conn.close()
 
-    def add_failed_record(self, url_path, error_msg):
-        """添加失败记录"""
+    def get_due_records(self, initial_days=None, budget=None):
+        """
+        自适应重爬：获取已到期的记录（按到期时间排序，按每日预算截断）
+
+        尚未纳入调度的完整记录会先写入重爬计划，到期时间按哈希均匀分散到
+        [现在, 现在 + initial_days) 区间，避免大量记录同一天过期。
+        """
+        initial_days = initial_days or self.AGENT_INFO_EXPIRY_DAYS
+        now = datetime.now()
+        conn = None
         try:
             with self.db_lock:
-                conn = sqlite3.connect(self.db_path)
+                conn = self._connect()
                 cursor = conn.cursor()
 
-                cursor.execute("SELECT retry_count FROM failed_records WHERE url_path = ?", (url_path,))
-                result = cursor.fetchone()
-                retry_count = result[0] + 1 if result else 1
+                cursor.execute('''
+                    SELECT p.url_path, p.agent_id, p.CEA, p.mobile, p.rating
+                    FROM propertyguru p
+                    LEFT JOIN recrawl_schedule r ON r.url_path = p.url_path
+                    WHERE r.url_path IS NULL
+                      AND COALESCE(p.CEA, '') NOT IN ('', '无CEA')
+                      AND COALESCE(p.mobile, '') NOT IN ('', '无手机')
+                      AND COALESCE(p.rating, '') NOT IN ('', '无评分')
+                ''')
+                new_rows = [
+                    (url_path, agent_id, agent_content_hash(cea, mobile, rating), initial_days,
+                     spread_due_time(url_path, initial_days, now))
+                    for url_path, agent_id, cea, mobile, rating in cursor.fetchall()
+                ]
+                cursor.executemany('''
+                    INSERT INTO recrawl_schedule (url_path, agent_id, content_hash, interval_days, next_due_at)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', new_rows)
+                conn.commit()
+
+                if budget is None:
+                    budget = self.RECRAWL_DAILY_BUDGET
+                if budget is None:
+                    tracked, mean_interval = cursor.execute(
+                        "SELECT COUNT(*), AVG(interval_days) FROM recrawl_schedule"
+                    ).fetchone()
+                    budget = daily_budget(tracked, mean_interval or initial_days)
 
                 cursor.execute('''
-                    INSERT OR REPLACE INTO failed_records 
-                    (url_path, error_message, retry_count, last_attempt) 
-                    VALUES (?, ?, ?, ?)
-                ''', (url_path, error_msg, retry_count, datetime.now()))
+                    SELECT r.url_path
+                    FROM recrawl_schedule r
+                    JOIN propertyguru p ON p.url_path = r.url_path
+                    WHERE r.next_due_at <= ?
+                    ORDER BY r.next_due_at
+                    LIMIT ?
+                ''', (now, budget))
+                url_paths = [row[0] for row in cursor.fetchall()]
+                due_total = cursor.execute(
+                    "SELECT COUNT(*) FROM recrawl_schedule WHERE next_due_at <= ?", (now,)
+                ).fetchone()[0]
+
+            if new_rows:
+                logger.info(f"📅 {len(new_rows)} 条记录纳入重爬计划，到期时间分散到 {initial_days} 天内")
+            logger.info(f"⏰ 到期记录 {due_total} 条，本次刷新 {len(url_paths)} 条（每日预算: {budget}）")
+            return url_paths
 
-                conn.commit()
-                logger.warning(f"添加失败记录: {url_path}, 重试次数: {retry_count}")
         except Exception as e:
-            logger.error(f"添加失败记录失败: {str(e)}")
+            logger.error(f"获取到期记录失败: {str(e)}")
+            return []
+        finally:
+            if conn:
+                conn.close()
+
+    def update_recrawl_schedule(self, results):
+        """
+        根据 Step 2 抓取结果更新重爬计划
+
+        results: [(url_path, CEA, mobile, rating), ...]
+        代理信息变化的记录缩短重爬间隔，同一代理的其他房源也提前到期。
+        """
+        if not results:
+            return
+
+        now = datetime.now()
+        conn = None
+        try:
+            with self.db_lock:
+                conn = self._connect()
+                cursor = conn.cursor()
+
+                existing = {}
+                url_paths = [row[0] for row in results]
+                for i in range(0, len(url_paths), 500):
+                    chunk = url_paths[i:i + 500]
+                    placeholders = ','.join('?' * len(chunk))
+                    cursor.execute(f'''
+                        SELECT p.url_path, p.agent_id, r.content_hash, r.interval_days, r.check_count, r.change_count
+                        FROM propertyguru p
+                        LEFT JOIN recrawl_schedule r ON r.url_path = p.url_path
+                        WHERE p.url_path IN ({placeholders})
+                    ''', chunk)
+                    for row in cursor.fetchall():
+                        existing[row[0]] = row[1:]
+
+                upserts = []
+                changed_agents = set()
+                for url_path, cea, mobile, rating in results:
+                    agent_id, old_hash, interval, check_count, change_count = existing.get(
+                        url_path, (None, None, None, 0, 0))
+                    new_hash = agent_content_hash(cea, mobile, rating)
+                    changed = old_hash is not None and old_hash != new_hash
+                    if interval is None:
+                        interval = self.AGENT_INFO_EXPIRY_DAYS
+                    else:
+                        interval = next_interval(interval, changed, self.RECRAWL_MIN_DAYS, self.RECRAWL_MAX_DAYS)
+                    if changed and agent_id:
+                        changed_agents.add(agent_id)
+                    upserts.append((
+                        url_path, agent_id, new_hash, (check_count or 0) + 1,
+                        (change_count or 0) + (1 if changed else 0), interval, now, now + timedelta(days=interval)
+                    ))
+
+                cursor.executemany('''
+                    INSERT OR REPLACE INTO recrawl_schedule
+                    (url_path, agent_id, content_hash, check_count, change_count, interval_days, last_checked_at, next_due_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', upserts)
+
+                if changed_agents:
+                    pull_forward = now + timedelta(days=self.RECRAWL_MIN_DAYS)
+                    cursor.executemany(
+                        "UPDATE recrawl_schedule SET next_due_at = ? WHERE agent_id = ? AND next_due_at > ?",
+                        [(pull_forward, agent_id, pull_forward) for agent_id in changed_agents]
+                    )
+                conn.commit()
+
+            if changed_agents:
+                logger.info(f"🔁 {len(changed_agents)} 个代理信息发生变化，其名下房源提前到期")
+
+        except Exception as e:
+            logger.error(f"更新重爬计划失败: {str(e)}")
         finally:
             if conn:
                 conn.close()
 
+    def get_step2_backlog(self):
+        """获取 Step 2 待处理记录：按优先级排序，并按请求数/费用预算截断"""
+        if not self.STEP2_PRIORITIZE:
+            url_paths = self.get_incomplete_records()
+            budget = request_budget(self.STEP2_MAX_REQUESTS, self.STEP2_MAX_SPEND, self.API_COST_PER_REQUEST)
+            return url_paths if budget is None else url_paths[:budget]
+
+        rows = self.get_incomplete_records(with_meta=True)
+        budget = request_budget(self.STEP2_MAX_REQUESTS, self.STEP2_MAX_SPEND, self.API_COST_PER_REQUEST)
+        url_paths = prioritize_records(rows, self.STEP2_PRIORITY_WEIGHTS, budget)
+
+        if budget is not None and len(rows) > budget:
+            logger.info(
+                f"🎯 按优先级选取 {len(url_paths)}/{len(rows)} 条记录"
+                f"（预算: {budget} 次请求，预计费用: {len(url_paths) * self.API_COST_PER_REQUEST:.2f}）"
+            )
+        return url_paths
+
+    def add_failed_record(self, url_path, error_msg):
+        """添加失败记录（失败次数超过 MAX_RETRIES 或永久性错误时转入死信表）"""
+        self.record_failures([(url_path, error_msg, url_path in self._permanent_failures)])
+
+    def record_failures(self, failures):
+        """批量写入失败记录（单个事务），failures: [(url_path, error_msg, permanent), ...]"""
+        if not failures:
+            return
+        conn = None
+        try:
+            with self.db_lock:
+                conn = self._connect()
+                cursor = conn.cursor()
+                dead = self._write_failures(cursor, failures, datetime.now())
+                conn.commit()
+            self._log_failures(failures, dead)
+        except Exception as e:
+            logger.error(f"添加失败记录失败: {str(e)}")
+        finally:
+            if conn:
+                conn.close()
+
+    def _write_failures(self, cursor, failures, now):
+        """
+        在调用方的事务中写入失败记录，返回转入死信表的记录 [(url_path, error_msg, retry_count, ...), ...]
+
+        retry_count 为累计失败次数，下次重试时间按失败次数分级（scheduling.next_attempt_time）；
+        失败次数超过 MAX_RETRIES 或永久性错误的记录移入 dead_letters
+        """
+        previous = {}
+        url_paths = list({row[0] for row in failures})
+        for start in range(0, len(url_paths), 500):
+            chunk = url_paths[start:start + 500]
+            cursor.execute(
+                f"SELECT url_path, retry_count, first_failed_at FROM failed_records "
+                f"WHERE url_path IN ({','.join('?' * len(chunk))})", chunk)
+            for url_path, retry_count, first_failed_at in cursor.fetchall():
+                previous[url_path] = (retry_count or 0, first_failed_at)
+
+        pending = {}
+        dead = {}
+        for url_path, error_msg, permanent in failures:
+            retry_count, first_failed_at = previous.get(url_path, (0, None))
+            retry_count += 1
+            first_failed_at = first_failed_at or now
+            previous[url_path] = (retry_count, first_failed_at)
+            if permanent or retry_count > self.MAX_RETRIES:
+                pending.pop(url_path, None)
+                dead[url_path] = (url_path, error_msg, retry_count, first_failed_at, now)
+            else:
+                next_at = next_attempt_time(url_path, retry_count, self.RETRY_TIER_BASE_SECONDS,
+                                            self.RETRY_TIER_MAX_SECONDS, now)
+                pending[url_path] = (url_path, error_msg, retry_count, now, next_at, first_failed_at)
+
+        cursor.executemany('''
+            INSERT OR REPLACE INTO failed_records
+            (url_path, error_message, retry_count, last_attempt, next_attempt_at, first_failed_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', list(pending.values()))
+        cursor.executemany('''
+            INSERT OR REPLACE INTO dead_letters (url_path, error_message, retry_count, first_failed_at, dead_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', list(dead.values()))
+        cursor.executemany("DELETE FROM failed_records WHERE url_path = ?", [(url_path,) for url_path in dead])
+        return list(dead.values())
+
+    def _log_failures(self, failures, dead):
+        if dead:
+            self.count_stat('dead_letters', len(dead))
+            for url_path, error_msg, retry_count, _, _ in dead:
+                logger.error(f"☠️  转入死信表（失败 {retry_count} 次，不再自动重试）: {url_path} - {error_msg}")
+        dead_urls = {row[0] for row in dead}
+        for url_path, error_msg, _ in failures:
+            if url_path not in dead_urls:
+                logger.warning(f"添加失败记录: {url_path} - {error_msg}")
+
     def get_property_detail(self, url_path):
         """获取详细页代理信息"""
+        if self.DETAIL_FETCH_MODE == 'light':
+            return self.get_property_detail_light(url_path)
+
         try:
             response = self.fetch(url_path, max_try=2)
             if not response:
@@ -712,78 +1996,350 @@ class PropertyGuruPipeline:
                 return None
 
             file_name = url_path.replace('/', '_')
-            with open(os.path.join(self.html_dir, f'detail_{file_name}.html'), 'w', encoding='utf-8') as f:
-                f.write(response.text)
+            if self.SAVE_DETAIL_FILES:
+                with open(os.path.join(self.html_dir, f'detail_{file_name}.html'), 'w', encoding='utf-8') as f:
+                    f.write(response.text)
 
-            data_json = re.findall('<script id="__NEXT_DATA__" type="application/json".*?>(.*?)</script>',
-                                   response.text, re.S)
-            if not data_json:
+            span = next_data.locate(response.text)
+            if span is None:
                 logger.error(f"data_json 获取失败：{url_path}")
                 return None
 
-            data_json = json.loads(data_json[0])
+            if self.SAVE_DETAIL_FILES:
+                with open(os.path.join(self.json_dir, f'detail_{file_name}.json'), 'w', encoding='utf-8') as f:
+                    f.write(response.text[span[0]:span[1]])
 
-            with open(os.path.join(self.json_dir, f'detail_{file_name}.json'), 'w', encoding='utf-8') as f:
-                json.dump(data_json, f, ensure_ascii=False, indent=4)
+            agentInfoProps, build_id = next_data.parse_agent_info_props(response.text)
+            self.next_build_id = build_id or self.next_build_id
 
-            agentInfoProps = data_json.get('props', {}).get('pageProps', {}).get('pageData', {}).get('data', {}).get(
-                'contactAgentData', {}).get('contactAgentCard', {}).get("agentInfoProps", {})
+            return self.parse_agent_info(agentInfoProps, url_path)
 
-            if not agentInfoProps:
-                logger.warning(f"未找到代理信息: {url_path}")
-                return {}
+        except PipelineAbortError:
+            raise
+        except Exception as e:
+            logger.error(f"获取详细页失败: {url_path} - {str(e)}")
+            return None
 
-            agent = agentInfoProps.get('agent', {})
-            description = re.sub(r'<[^>]*>', '', agent.get('description', '无描述'))
-            mobile = agent.get('mobile', '无手机')
+    def parse_agent_info(self, agentInfoProps, url_path):
+        """从 agentInfoProps 中提取 CEA / 手机 / 评分，返回 AgentInfo；没有代理信息时返回 None"""
+        if not agentInfoProps:
+            logger.warning(f"未找到代理信息: {url_path}")
+            return None
 
-            rating = '无评分'
-            rating_dic = agentInfoProps.get('rating', {})
-            if rating_dic:
-                rating = rating_dic.get('score', '无评分')
+        agent = agentInfoProps.get('agent', {})
+        description = re.sub(r'<[^>]*>', '', agent.get('description', '无描述'))
+        mobile = agent.get('mobile', '无手机')
 
-            dic = {
-                "CEA": description,
-                "mobile": mobile,
-                "rating": rating
-            }
+        rating = '无评分'
+        rating_dic = agentInfoProps.get('rating', {})
+        if rating_dic:
+            rating = rating_dic.get('score', '无评分')
 
+        if self.log_sampler.sample('agent_info'):
             logger.info(f"成功获取代理信息: {url_path}")
-            return dic
+        return AgentInfo(description, mobile, rating, url_path)
+
+    # ---------- 轻量请求（DETAIL_FETCH_MODE = 'light'） ----------
+
+    def get_property_detail_light(self, url_path):
+        """
+        轻量获取详细页代理信息，按以下顺序尝试更省流量的方式：
+        1. Next.js JSON 路由（_next/data/{buildId}/{url_path}.json），只返回页面数据
+        2. 条件请求（If-None-Match / If-Modified-Since），未变化时返回 304，直接使用数据库中的代理信息
+        3. 压缩传输 + 流式读取，读到 __NEXT_DATA__ 的结束标签后立即断开，不下载页面剩余部分
+        响应缓存中有未过期的页面时直接解析缓存，不发请求。
+        """
+        try:
+            cached = self.get_cached_response(url_path)
+            if cached is not None:
+                agentInfoProps, _ = next_data.parse_agent_info_props(cached.text)
+                return self.parse_agent_info(agentInfoProps, url_path)
+
+            if self.next_build_id:
+                routed, agent_info = self._fetch_next_data_route(url_path)
+                if routed:
+                    return agent_info
+
+            validators = self.get_http_validators(url_path)
+            headers = {"Accept-Encoding": "gzip, deflate, br"}
+            if validators:
+                etag, last_modified, body_bytes = validators
+                if etag:
+                    headers["If-None-Match"] = etag
+                if last_modified:
+                    headers["If-Modified-Since"] = last_modified
+
+            response = self.fetch(url_path, max_try=2, extra_headers=headers, stream=True)
+            if not response:
+                logger.error(f"请求失败：{url_path}")
+                return None
 
+            if response.status_code == 304:
+                response.close()
+                self.count_stat('not_modified')
+                self.count_stat('bytes_saved', (validators[2] or 0) if validators else 0)
+                if self.log_sampler.sample('not_modified'):
+                    logger.info(f"代理信息未变化(304): {url_path}")
+                return self.get_stored_agent_info(url_path)
+
+            text, wire_bytes, stopped_early = self._read_until_next_data(response)
+            content_length = int(response.headers.get('Content-Length') or 0)
+            self.count_stat('bytes_downloaded', wire_bytes)
+            if stopped_early:
+                self.count_stat('stream_early_stop')
+                if content_length > wire_bytes:
+                    self.count_stat('bytes_saved', content_length - wire_bytes)
+
+            self.save_http_validators(
+                url_path, response.headers.get('ETag'), response.headers.get('Last-Modified'),
+                content_length or wire_bytes
+            )
+
+            if next_data.locate(text) is None:
+                logger.error(f"data_json 获取失败：{url_path}")
+                return None
+            # 提前断开时缓存的是到 __NEXT_DATA__ 为止的部分页面，解析所需的数据都在其中
+            self.store_cached_response(url_path, text)
+
+            agentInfoProps, build_id = next_data.parse_agent_info_props(text)
+            self.next_build_id = build_id or self.next_build_id
+            self._save_agent_info_file(url_path, agentInfoProps)
+            return self.parse_agent_info(agentInfoProps, url_path)
+
+        except PipelineAbortError:
+            raise
         except Exception as e:
             logger.error(f"获取详细页失败: {url_path} - {str(e)}")
             return None
 
-    def process_single_record(self, url_path, force_update=False):
-        """处理单条记录（线程安全）"""
+    def _fetch_next_data_route(self, url_path):
+        """通过 Next.js JSON 路由获取页面数据，返回 (是否成功, AgentInfo)；buildId 失效时由调用方回退到 HTML"""
+        route = f"_next/data/{self.next_build_id}/{url_path.split('?')[0]}.json"
+        response = self.fetch(route, max_try=1, extra_headers={"Accept-Encoding": "gzip, deflate, br"})
+        if not response:
+            logger.warning(f"Next.js JSON 路由不可用（buildId 可能已更新），回退到页面请求: {url_path}")
+            self.next_build_id = None
+            return False, None
+
+        try:
+            agentInfoProps, _ = next_data.parse_agent_info_props(response.text)
+        except ValueError:
+            self.next_build_id = None
+            return False, None
+
+        if not getattr(response, 'from_cache', False):
+            self.count_stat('next_data_route')
+            self.count_stat('bytes_downloaded', len(response.content))
+        self._save_agent_info_file(url_path, agentInfoProps)
+        return True, self.parse_agent_info(agentInfoProps, url_path)
+
+    def _read_until_next_data(self, response):
+        """流式读取响应，读到 __NEXT_DATA__ 的结束标签后停止，返回 (文本, 实际下载字节数, 是否提前停止)"""
+        marker = b'id="__NEXT_DATA__"'
+        buffer = bytearray()
+        marker_pos = -1
+        stopped_early = False
+
+        try:
+            for chunk in response.iter_content(chunk_size=self.STREAM_CHUNK_SIZE):
+                search_from = max(0, len(buffer) - len(marker))
+                buffer += chunk
+                if marker_pos < 0:
+                    marker_pos = buffer.find(marker, search_from)
+                if marker_pos >= 0 and buffer.find(b'</script>', marker_pos) >= 0:
+                    stopped_early = True
+                    break
+        finally:
+            response.close()
+
+        # 压缩传输时 raw.tell() 为网络上实际传输的字节数
+        raw_tell = getattr(getattr(response, 'raw', None), 'tell', None)
+        wire_bytes = raw_tell() if callable(raw_tell) else len(buffer)
+        return buffer.decode(response.encoding or 'utf-8', errors='replace'), wire_bytes, stopped_early
+
+    def _save_agent_info_file(self, url_path, agentInfoProps):
+        if not self.SAVE_DETAIL_FILES:
+            return
+        file_name = url_path.replace('/', '_')
+        with open(os.path.join(self.json_dir, f'detail_{file_name}.json'), 'w', encoding='utf-8') as f:
+            json.dump(agentInfoProps, f, ensure_ascii=False, indent=4)
+
+    def get_http_validators(self, url_path):
+        """读取详情页的 ETag / Last-Modified，返回 (etag, last_modified, body_bytes) 或 None"""
+        conn = None
+        try:
+            with self.db_lock:
+                conn = self._connect()
+                cursor = conn.cursor()
+                cursor.execute(
+                    "SELECT etag, last_modified, body_bytes FROM http_validators WHERE url_path = ?", (url_path,)
+                )
+                return cursor.fetchone()
+        except Exception as e:
+            logger.error(f"读取缓存校验信息失败: {url_path}, 错误: {str(e)}")
+            return None
+        finally:
+            if conn:
+                conn.close()
+
+    def save_http_validators(self, url_path, etag, last_modified, body_bytes):
+        """保存详情页的 ETag / Last-Modified（没有校验信息时不保存）"""
+        if not etag and not last_modified:
+            return
+        conn = None
+        try:
+            with self.db_lock:
+                conn = self._connect()
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT OR REPLACE INTO http_validators (url_path, etag, last_modified, body_bytes, updated_at)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (url_path, etag, last_modified, body_bytes, datetime.now()))
+                conn.commit()
+        except Exception as e:
+            logger.error(f"保存缓存校验信息失败: {url_path}, 错误: {str(e)}")
+        finally:
+            if conn:
+                conn.close()
+
+    def get_stored_agent_info(self, url_path):
+        """读取数据库中已有的代理信息（304 未变化时使用）"""
+        conn = None
+        try:
+            with self.db_lock:
+                conn = self._connect()
+                cursor = conn.cursor()
+                cursor.execute("SELECT CEA, mobile, rating FROM propertyguru WHERE url_path = ?", (url_path,))
+                result = cursor.fetchone()
+                if not result or not result[0]:
+                    return None
+                return AgentInfo(result[0], result[1], result[2], url_path)
+        except Exception as e:
+            logger.error(f"读取代理信息失败: {url_path}, 错误: {str(e)}")
+            return None
+        finally:
+            if conn:
+                conn.close()
+
+    def log_fetch_stats(self):
+        """输出请求统计（light 模式下包括节省的流量）"""
+        stats = dict(self.fetch_stats)
+        logger.info(
+            f"📉 请求统计: 请求 {stats['requests']} 次 | 下载 {stats['bytes_downloaded'] / 1024 / 1024:.2f} MB | "
+            f"节省约 {stats['bytes_saved'] / 1024 / 1024:.2f} MB | 304 未变化 {stats['not_modified']} 次 | "
+            f"JSON 路由 {stats['next_data_route']} 次 | 提前断开 {stats['stream_early_stop']} 次 | "
+            f"缓存命中 {stats['cache_hits']} 次"
+        )
+        p50, p95, p99 = self.detail_completion.percentiles(50, 95, 99)
+        if p50 is not None:
+            logger.info(
+                f"⏱️  详情页耗时（最近 {len(self.detail_completion)} 条）: p50 {p50:.2f}s | p95 {p95:.2f}s | "
+                f"p99 {p99:.2f}s | 对冲请求 {stats['hedged']} 次，其中 {stats['hedge_wins']} 次先返回"
+            )
+        self.log_endpoint_stats()
+        return stats
+
+    def fetch_agent_detail(self, url_path, force_update=False):
+        """获取单条记录的代理信息（不写数据库，供多进程工作进程使用）"""
         # 检查是否已成功爬取
         if not force_update and self.check_spider_record(url_path):
             return {'status': 'skipped', 'url_path': url_path}
 
-        # 获取代理信息
         agent_detail = self.get_property_detail(url_path)
-
         if not agent_detail:
-            self.add_failed_record(url_path, "获取代理信息失败")
+            return {'status': 'failed', 'url_path': url_path, 'error': "获取代理信息失败",
+                    'permanent': url_path in self._permanent_failures}
+
+        agent_detail.url_path = url_path
+        return {'status': 'success', 'url_path': url_path, 'agent_detail': agent_detail}
+
+    def process_single_record(self, url_path, force_update=False, record_failure=True):
+        """
+        处理单条记录（线程安全）
+
+        record_failure=False 时失败不写入失败记录（任务队列自己负责重试，见 run_queue_worker）
+        """
+        result = self.fetch_agent_detail(url_path, force_update)
+
+        if result['status'] == 'skipped':
+            return result
+
+        if result['status'] == 'failed':
+            if record_failure:
+                self.add_failed_record(url_path, "获取代理信息失败")
             self.insert_spider_record(url_path, '失败', "获取代理信息失败")
-            return {'status': 'failed', 'url_path': url_path}
+            return result
 
         # 更新记录
-        dic = {
-            "url_path": url_path,
-            "CEA": agent_detail.get("CEA", ''),
-            "mobile": agent_detail.get("mobile", ''),
-            "rating": agent_detail.get("rating", '')
-        }
+        agent = result['agent_detail']
 
-        if self.insert_record(dic, update_agent_only=True):
+        if self.insert_record(agent, update_agent_only=True):
             self.insert_spider_record(url_path, '已爬取')
+            self.update_recrawl_schedule([(url_path, *agent.values())])
             return {'status': 'success', 'url_path': url_path}
         else:
-            self.add_failed_record(url_path, "数据库更新失败")
+            if record_failure:
+                self.add_failed_record(url_path, "数据库更新失败")
             return {'status': 'failed', 'url_path': url_path}
 
+    def save_agent_results(self, results):
+        """
+        批量写入 Step 2 / Step 3 结果（单个事务），返回写库失败的 url_path 列表
+
+        成功的记录同时从失败记录表中移除；列表页（重试）不写爬虫记录，页面状态由 _retry_list_page 写入 crawl_pages
+        """
+        now = datetime.now()
+        updates = []
+        spider_rows = []
+        failures = []
+        succeeded = []
+
+        for result in results:
+            url_path = result['url_path']
+            is_detail = self.parse_list_url(url_path) is None
+            if result['status'] == 'success':
+                if result.get('agent_detail') is not None:
+                    updates.append(result['agent_detail'].update_params(now, url_path))
+                if is_detail:
+                    spider_rows.append((url_path, '已爬取', None, now))
+                succeeded.append((url_path,))
+            elif result['status'] == 'failed':
+                error_msg = result.get('error') or "获取代理信息失败"
+                if is_detail:
+                    spider_rows.append((url_path, '失败', error_msg, now))
+                failures.append((url_path, error_msg, result.get('permanent', False)))
+
+        if not succeeded and not failures:
+            return []
+
+        conn = None
+        try:
+            with self.db_lock:
+                conn = self._connect()
+                cursor = conn.cursor()
+                cursor.executemany(AgentInfo.UPDATE_SQL, updates)
+                cursor.executemany('''
+                    INSERT INTO propertyguru_spider (url_path, status, retry_count, last_error, crawled_at)
+                    VALUES (?, ?, 0, ?, ?)
+                    ON CONFLICT(url_path) DO UPDATE SET
+                        status = excluded.status, retry_count = retry_count + 1,
+                        last_error = excluded.last_error, crawled_at = excluded.crawled_at
+                ''', spider_rows)
+                cursor.executemany("DELETE FROM failed_records WHERE url_path = ?", succeeded)
+                dead = self._write_failures(cursor, failures, now) if failures else []
+                conn.commit()
+            logger.debug(f"批量写入结果: {len(succeeded)} 条成功, {len(failures)} 条失败")
+            if dead:
+                self._log_failures([], dead)
+            self.update_recrawl_schedule([(row[4], row[0], row[1], row[2]) for row in updates])
+            return []
+        except Exception as e:
+            logger.error(f"批量写入 Step 2 结果失败: {str(e)}")
+            return [row[-1] for row in updates]
+        finally:
+            if conn:
+                conn.close()
+
     def process_records_multithread(self, url_paths, force_update=False):
         """多线程处理记录"""
         if not url_paths:
@@ -796,6 +2352,7 @@ class PropertyGuruPipeline:
         skipped = 0
 
         logger.info(f"开始多线程处理 {total} 条记录，线程数: {self.max_workers}")
+        progress = ProgressReporter("Step 2", total, self.LOG_SUMMARY_INTERVAL)
 
         with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
             # 提交所有任务
@@ -809,66 +2366,234 @@ class PropertyGuruPipeline:
                 url_path = future_to_url[future]
                 try:
                     result = future.result()
-                    
+
                     if result['status'] == 'success':
                         success += 1
-                        logger.success(f"[{index}/{total}] ✅ 成功: {url_path}")
+                        if self.log_sampler.sample('step2_success'):
+                            logger.success(f"[{index}/{total}] ✅ 成功: {url_path}")
                     elif result['status'] == 'failed':
                         failed += 1
                         logger.error(f"[{index}/{total}] ❌ 失败: {url_path}")
                     elif result['status'] == 'skipped':
                         skipped += 1
-                        logger.info(f"[{index}/{total}] ⏭️  跳过: {url_path}")
-                        
-                    # 显示进度
-                    if index % 10 == 0:
-                        logger.info(f"进度: {index}/{total} | 成功: {success} | 失败: {failed} | 跳过: {skipped}")
-                        
+                        if self.log_sampler.sample('step2_skipped'):
+                            logger.info(f"[{index}/{total}] ⏭️  跳过: {url_path}")
+
+                    # 定时输出汇总进度
+                    progress.update(index, success, failed, skipped)
+
+                except PipelineAbortError:
+                    self._cancel_pending(future_to_url)
+                    break
                 except Exception as exc:
                     logger.error(f"[{index}/{total}] 处理异常: {url_path} - {str(exc)}")
                     failed += 1
 
                 time.sleep(0.1)  # 避免请求过快
 
+        if self.breaker.is_aborted:
+            logger.error(f"多线程处理中止！已处理: {success + failed + skipped}/{total}, 成功: {success}, 失败: {failed}, 跳过: {skipped}")
+            raise PipelineAbortError(self.breaker.abort_reason)
+
         logger.success(f"多线程处理完成！总数: {total}, 成功: {success}, 失败: {failed}, 跳过: {skipped}")
 
-    def step2_crawl_agent_info(self, mode='incremental', expiry_days=None):
-        """Step 2: 爬取代理信息（多线程）"""
+    @staticmethod
+    def _cancel_pending(futures):
+        """取消尚未开始的任务（致命错误后不再发出新请求）"""
+        cancelled = sum(1 for future in futures if future.cancel())
+        if cancelled:
+            logger.warning(f"已取消 {cancelled} 个未开始的任务")
+
+    def process_records_multiprocess(self, url_paths, force_update=False, processes=None):
+        """
+        多进程处理记录
+
+        按 url_path 的哈希把待处理记录分片到 N 个工作进程，每个进程内部用
+        max_workers 个线程并发请求和解析；结果通过队列汇总到主进程，由主进程
+        单线程批量写库（避免多进程同时写 SQLite）。
+        """
+        if not url_paths:
+            logger.info("没有需要处理的记录")
+            return
+
+        processes = processes or self.STEP2_PROCESSES
+        shards = [[] for _ in range(processes)]
+        for url_path in url_paths:
+            shards[zlib.crc32(url_path.encode('utf-8')) % processes].append(url_path)
+
+        total = len(url_paths)
+        success = 0
+        failed = 0
+        skipped = 0
+
+        logger.info(f"开始多进程处理 {total} 条记录，进程数: {processes}，每进程线程数: {self.max_workers}")
+        progress = ProgressReporter("Step 2", total, self.LOG_SUMMARY_INTERVAL)
+
+        ctx = multiprocessing.get_context('spawn')
+        result_queue = ctx.Queue()
+        settings = self.get_worker_settings()
+        # 限速是全局的：每个进程按 1/进程数 的速率请求
+        settings['REQUEST_DELAY'] = self.REQUEST_DELAY * sum(1 for shard in shards if shard)
+        workers = []
+        for shard_index, shard in enumerate(shards):
+            if not shard:
+                continue
+            process = ctx.Process(
+                target=_step2_shard_worker,
+                args=(shard_index, shard, settings, force_update, result_queue),
+                name=f"step2-shard-{shard_index}",
+                daemon=True
+            )
+            process.start()
+            workers.append(process)
+
+        running = len(workers)
+        index = 0
+        buffer = []
+
+        while running:
+            try:
+                message = result_queue.get(timeout=1)
+            except queue.Empty:
+                alive = sum(1 for process in workers if process.is_alive())
+                if alive < running:
+                    logger.error(f"有 {running - alive} 个工作进程异常退出，其分片中未完成的记录将在下次运行时处理")
+                    running = alive
+                continue
+
+            if message[0] == 'done':
+                running -= 1
+                for key, value in message[2].items():
+                    self.count_stat(key, value)
+                logger.info(f"分片 {message[1]} 处理完成")
+                continue
+
+            if message[0] == 'abort':
+                # 工作进程遇到致命错误：继续接收其他进程已完成的结果，等待全部退出
+                self.breaker.abort(message[2])
+                continue
+
+            result = message[1]
+            index += 1
+            url_path = result['url_path']
+            if result['status'] == 'success':
+                success += 1
+                if self.log_sampler.sample('step2_success'):
+                    logger.success(f"[{index}/{total}] ✅ 成功: {url_path}")
+            elif result['status'] == 'failed':
+                failed += 1
+                logger.error(f"[{index}/{total}] ❌ 失败: {url_path}")
+            else:
+                skipped += 1
+                if self.log_sampler.sample('step2_skipped'):
+                    logger.info(f"[{index}/{total}] ⏭️  跳过: {url_path}")
+
+            buffer.append(result)
+            if len(buffer) >= self.STEP2_WRITE_BATCH:
+                failed += self._flush_agent_results(buffer)
+                buffer = []
+
+            progress.update(index, success, failed, skipped)
+
+        if buffer:
+            failed += self._flush_agent_results(buffer)
+
+        for process in workers:
+            process.join(timeout=5)
+
+        if self.breaker.is_aborted:
+            logger.error(f"多进程处理中止！已处理: {index}/{total}, 成功: {success}, 失败: {failed}, 跳过: {skipped}")
+            raise PipelineAbortError(self.breaker.abort_reason)
+
+        logger.success(f"多进程处理完成！总数: {total}, 成功: {success}, 失败: {failed}, 跳过: {skipped}")
+
+    def _flush_agent_results(self, results):
+        """批量写库；写库失败的记录转为失败记录，返回写库失败数"""
+        write_failed = self.save_agent_results(results)
+        self.record_failures([(url_path, "数据库更新失败", False) for url_path in write_failed])
+        return len(write_failed)
+
+    def get_worker_settings(self):
+        """工作进程需要继承的设置"""
+        return {
+            'config': self.config,
+            'apikey': self.apikey,
+            'proxy': self.proxy,
+            'db_path': self.db_path,
+            'max_workers': self.max_workers,
+            'DETAIL_FETCH_MODE': self.DETAIL_FETCH_MODE,
+            'SAVE_DETAIL_FILES': self.SAVE_DETAIL_FILES,
+            'next_build_id': self.next_build_id,
+            'RESPONSE_CACHE_BYPASS': self.RESPONSE_CACHE_BYPASS,
+        }
+
+    def step2_crawl_agent_info(self, mode='incremental', expiry_days=None, processes=None):
+        """Step 2: 爬取代理信息（多线程 / 多进程）"""
         logger.info("=" * 60)
         logger.info("Step 2: 开始爬取代理信息（多线程）")
         logger.info("=" * 60)
 
         if mode == 'incremental':
             logger.info("⚡ 差量更新：补充缺失的代理信息")
-            url_paths = self.get_incomplete_records()
-            self.process_records_multithread(url_paths, force_update=False)
+            url_paths = self.get_step2_backlog()
+            self._process_step2_records(url_paths, force_update=False, processes=processes)
 
         elif mode == 'expired':
             days = expiry_days if expiry_days else self.AGENT_INFO_EXPIRY_DAYS
-            logger.info(f"⏰ 过期更新：更新超过{days}天的代理信息")
-            url_paths = self.get_expired_records(days)
-            self.process_records_multithread(url_paths, force_update=True)
+            if self.ADAPTIVE_RECRAWL:
+                logger.info("⏰ 过期更新：按自适应重爬计划刷新到期的代理信息")
+                url_paths = self.get_due_records(days)
+            else:
+                logger.info(f"⏰ 过期更新：更新超过{days}天的代理信息")
+                url_paths = self.get_expired_records(days)
+            budget = request_budget(self.STEP2_MAX_REQUESTS, self.STEP2_MAX_SPEND, self.API_COST_PER_REQUEST)
+            if budget is not None and len(url_paths) > budget:
+                logger.info(f"🎯 按请求预算刷新 {budget}/{len(url_paths)} 条，其余留待下次运行")
+                url_paths = url_paths[:budget]
+            # 过期更新需要最新的代理信息，不使用缓存
+            with self.cache_bypassed():
+                self._process_step2_records(url_paths, force_update=True, processes=processes)
 
         else:
             logger.error(f"未知的模式: {mode}")
             return
 
+        self.log_fetch_stats()
+        self.log_cache_stats()
         logger.success("Step 2 完成：代理信息爬取完成")
 
+    def _process_step2_records(self, url_paths, force_update, processes=None):
+        processes = processes or self.STEP2_PROCESSES
+        if processes > 1:
+            self.process_records_multiprocess(url_paths, force_update=force_update, processes=processes)
+        else:
+            self.process_records_multithread(url_paths, force_update=force_update)
+
     # ==================== Step 3: 重试失败记录 ====================
 
-    def get_failed_records(self):
-        """获取所有失败的记录"""
+    def get_failed_records(self, due_only=False):
+        """
+        获取失败的记录（失败次数少的优先）
+
+        due_only=True 时只返回已到下次重试时间的记录（next_attempt_at 为空视为已到期）
+        """
+        where = "WHERE next_attempt_at IS NULL OR next_attempt_at <= ?" if due_only else ""
+        conn = None
         try:
             with self.db_lock:
-                conn = sqlite3.connect(self.db_path)
+                conn = self._connect()
                 cursor = conn.cursor()
-                cursor.execute('SELECT url_path FROM failed_records')
-                results = cursor.fetchall()
-                url_paths = [row[0] for row in results]
-                if url_paths:
-                    logger.info(f"找到 {len(url_paths)} 条失败的记录需要重试")
-                return url_paths
+                cursor.execute(
+                    f"SELECT url_path FROM failed_records {where} ORDER BY retry_count, next_attempt_at",
+                    (datetime.now(),) if due_only else ()
+                )
+                url_paths = [row[0] for row in cursor.fetchall()]
+                total = cursor.execute("SELECT COUNT(*) FROM failed_records").fetchone()[0]
+            if url_paths:
+                logger.info(f"找到 {len(url_paths)} 条失败的记录需要重试")
+            if len(url_paths) < total:
+                logger.info(f"另有 {total - len(url_paths)} 条失败记录未到下次重试时间")
+            return url_paths
         except Exception as e:
             logger.error(f"获取失败记录失败: {str(e)}")
             return []
@@ -878,12 +2603,14 @@ class PropertyGuruPipeline:
 
     def remove_failed_record(self, url_path):
         """移除成功的失败记录"""
+        conn = None
         try:
             with self.db_lock:
-                conn = sqlite3.connect(self.db_path)
+                conn = self._connect()
                 cursor = conn.cursor()
                 cursor.execute("DELETE FROM failed_records WHERE url_path = ?", (url_path,))
                 conn.commit()
+            if self.log_sampler.sample('remove_failed_record'):
                 logger.success(f"已从失败列表移除: {url_path}")
         except Exception as e:
             logger.error(f"移除失败记录失败: {url_path}, {str(e)}")
@@ -891,99 +2618,611 @@ class PropertyGuruPipeline:
             if conn:
                 conn.close()
 
-    def retry_failed_records(self):
-        """Step 3: 重试之前失败的记录"""
+    def get_dead_letters(self):
+        """获取死信表中的记录 [(url_path, error_message, retry_count, first_failed_at, dead_at), ...]"""
+        conn = None
+        try:
+            with self.db_lock:
+                conn = self._connect()
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT url_path, error_message, retry_count, first_failed_at, dead_at
+                    FROM dead_letters ORDER BY dead_at
+                ''')
+                return cursor.fetchall()
+        except Exception as e:
+            logger.error(f"获取死信记录失败: {str(e)}")
+            return []
+        finally:
+            if conn:
+                conn.close()
+
+    def requeue_dead_letters(self, url_paths=None):
+        """把死信记录（默认全部）放回失败记录表，失败次数清零，下次 Step 3 立即重试；返回放回的条数"""
+        conn = None
+        try:
+            with self.db_lock:
+                conn = self._connect()
+                cursor = conn.cursor()
+                if url_paths is None:
+                    url_paths = [row[0] for row in cursor.execute("SELECT url_path FROM dead_letters")]
+                params = [(url_path,) for url_path in url_paths]
+                cursor.executemany('''
+                    INSERT OR REPLACE INTO failed_records
+                    (url_path, error_message, retry_count, last_attempt, next_attempt_at, first_failed_at)
+                    SELECT url_path, error_message, 0, dead_at, NULL, first_failed_at
+                    FROM dead_letters WHERE url_path = ?
+                ''', params)
+                cursor.executemany("DELETE FROM dead_letters WHERE url_path = ?", params)
+                conn.commit()
+            self._permanent_failures.difference_update(url_paths)
+            logger.info(f"已将 {len(url_paths)} 条死信记录放回失败列表")
+            return len(url_paths)
+        except Exception as e:
+            logger.error(f"放回死信记录失败: {str(e)}")
+            return 0
+        finally:
+            if conn:
+                conn.close()
+
+    def _retry_list_page(self, url_path):
+        """重试单个列表页（写入房源和页面状态；失败记录由 save_agent_results 批量更新）"""
+        category, page, params = self.parse_list_url(url_path)
+        logger.debug(f"开始请求：{url_path}")
+        response = self.fetch(url_path)
+        if not response:
+            return {'status': 'failed', 'url_path': url_path, 'error': "请求失败",
+                    'permanent': url_path in self._permanent_failures}
+        key = self.shard_key(category, params)
+        page_info = {}
+        self.analysis_list_page(response, page, key, force_update=True, page_info=page_info, buy_rent=category)
+        self.record_page_states(key, [self._page_state(page, page_info)])
+        return {'status': 'success', 'url_path': url_path}
+
+    def _retry_record(self, url_path):
+        if self.parse_list_url(url_path):
+            return self._retry_list_page(url_path)
+        return self.fetch_agent_detail(url_path, force_update=True)
+
+    def retry_failed_records(self, include_pending=False):
+        """
+        Step 3: 重试之前失败的记录
+
+        - 只重试已到下次重试时间的记录；include_pending=True 时忽略重试时间，重试全部失败记录
+        - 列表页和详细页在同一个线程池中并发重试，共用请求限速（REQUEST_DELAY）
+        - 结果按 STEP2_WRITE_BATCH 条批量写库：成功的移出失败记录表，失败的按失败次数推迟下次重试时间，
+          失败次数超过 MAX_RETRIES 或永久性错误（404 / 410 等）的转入死信表
+        """
         logger.info("=" * 60)
         logger.info("Step 3: 开始重试失败的记录")
         logger.info("=" * 60)
 
-        failed_urls = self.get_failed_records()
+        failed_urls = self.get_failed_records(due_only=not include_pending)
         if not failed_urls:
             logger.info("没有失败的记录需要重试")
             return
 
-        list_page_urls = []
-        detail_page_urls = []
-        for url in failed_urls:
-            if re.match(r'(property-for-rent|property-for-sale)/\d+', url):
-                list_page_urls.append(url)
-            else:
-                detail_page_urls.append(url)
-
-        # 1. 处理列表页
-        if list_page_urls:
-            logger.info(f"开始重试 {len(list_page_urls)} 个列表页...")
-            for url_path in list_page_urls:
-                page = url_path.split('/')[-1]
-                category = url_path.split('/')[0]
-                logger.info(f"开始请求：{url_path}")
-                response = self.fetch(url_path)
-                if response:
-                    logger.info(f"请求成功：{url_path}")
-                    self.analysis_list_page(response, page, category, force_update=True)
-                    self.insert_spider_record(url_path, '已爬取')
-                    self.remove_failed_record(url_path)
+        total = len(failed_urls)
+        list_count = sum(1 for url_path in failed_urls if self.parse_list_url(url_path))
+        logger.info(f"开始重试 {total} 条失败记录（列表页 {list_count} 个，详细页 {total - list_count} 个）...")
+        success = 0
+        failed = 0
+        buffer = []
+        dead_before = self.fetch_stats.get('dead_letters', 0)
+        progress = ProgressReporter("重试失败记录", total, self.LOG_SUMMARY_INTERVAL)
+
+        # 重试时不使用缓存：失败记录的页面需要重新请求
+        with self.cache_bypassed(), ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            future_to_url = {executor.submit(self._retry_record, url_path): url_path for url_path in failed_urls}
+
+            for index, future in enumerate(as_completed(future_to_url), 1):
+                url_path = future_to_url[future]
+                try:
+                    result = future.result()
+                except PipelineAbortError:
+                    self._cancel_pending(future_to_url)
+                    break
+                except Exception as exc:
+                    logger.error(f"[{index}/{total}] 处理异常: {url_path} - {str(exc)}")
+                    result = {'status': 'failed', 'url_path': url_path, 'error': str(exc)}
+
+                buffer.append(result)
+                if result['status'] == 'failed':
+                    failed += 1
+                    logger.error(f"[{index}/{total}] ❌ 重试失败: {url_path}")
                 else:
-                    logger.error(f"重试失败：{url_path}")
-                time.sleep(1)
-            logger.success("列表页重试完成")
+                    success += 1
+                    if self.log_sampler.sample('retry_success'):
+                        logger.success(f"[{index}/{total}] ✅ 重试成功: {url_path}")
+
+                if len(buffer) >= self.STEP2_WRITE_BATCH:
+                    write_failed = self._flush_agent_results(buffer)
+                    success -= write_failed
+                    failed += write_failed
+                    buffer = []
+                progress.update(index, success, failed)
+
+        if buffer:
+            write_failed = self._flush_agent_results(buffer)
+            success -= write_failed
+            failed += write_failed
+
+        if self.breaker.is_aborted:
+            raise PipelineAbortError(self.breaker.abort_reason)
+
+        self.log_endpoint_stats()
+        dead = self.fetch_stats.get('dead_letters', 0) - dead_before
+        logger.success(f"失败记录重试完成！总数: {total}, 成功: {success}, 失败: {failed}, 转入死信表: {dead}")
+        logger.success("Step 3 完成：失败记录重试完成")
+
+
+    # ==================== 分布式任务队列 ====================
+
+    def get_work_queue(self):
+        """获取任务队列（首次使用时创建）"""
+        if self.work_queue is None:
+            self.work_queue = WorkQueue(
+                self.db_path,
+                lease_seconds=self.QUEUE_LEASE_SECONDS,
+                max_attempts=self.MAX_RETRIES
+            )
+        return self.work_queue
+
+    def enqueue_list_pages(self, category, start_page, end_page):
+        """把列表页写入任务队列（已完成的页面会被重置，开始新一轮爬取）"""
+        tasks = [
+            (f'{category}/{page}', WorkQueue.TASK_LIST, category, page, -page)
+            for page in range(start_page, end_page)
+        ]
+        return self.get_work_queue().enqueue(tasks, reset_done=True)
+
+    def enqueue_detail_backlog(self, mode='incremental', expiry_days=None):
+        """把 Step 2 待处理的详情页写入任务队列"""
+        if mode == 'incremental':
+            url_paths = self.get_step2_backlog()
+        elif mode == 'expired':
+            if self.ADAPTIVE_RECRAWL:
+                url_paths = self.get_due_records(expiry_days)
+            else:
+                url_paths = self.get_expired_records(expiry_days)
         else:
-            logger.info("没有失败的列表页需要重试")
+            logger.error(f"未知的模式: {mode}")
+            return 0
 
-        # 2. 处理详细页
-        if detail_page_urls:
-            logger.info(f"开始重试 {len(detail_page_urls)} 个详细页（多线程）...")
-            total = len(detail_page_urls)
-            success = 0
-            failed = 0
+        # 按调度顺序设置队列优先级，高优先级的记录先被领取
+        tasks = [
+            (url_path, WorkQueue.TASK_DETAIL, None, None, len(url_paths) - rank)
+            for rank, url_path in enumerate(url_paths)
+        ]
+        return self.get_work_queue().enqueue(tasks, reset_done=True)
 
+    def process_queue_task(self, task_type, task, force_update=False):
+        """
+        处理单个队列任务，返回 (是否成功, 错误信息)
+
+        失败时不写失败记录：任务由队列重新分配重试，达到最大次数后才由 run_queue_worker 写入
+        """
+        task_key, category, page = task
+
+        if task_type == WorkQueue.TASK_LIST:
+            logger.debug(f"开始请求：{task_key}")
+            response = self.fetch(task_key)
+            if not response:
+                return False, "请求失败"
+            page_info = {}
+            self.analysis_list_page(response, page, category, force_update, page_info=page_info)
+            self.record_page_states(category, [self._page_state(page, page_info)])
+            return True, None
+
+        result = self.process_single_record(task_key, force_update, record_failure=False)
+        if result['status'] == 'failed':
+            return False, "获取代理信息失败"
+        return True, None
+
+    def run_queue_worker(self, task_type, force_update=False, exit_when_idle=True):
+        """
+        作为队列消费者运行：循环领取任务 → 多线程处理 → ack/nack
+
+        可以在多个进程/机器上同时运行，租约保证同一任务不会被重复请求。
+        失败的任务由队列重试，达到最大次数（状态变为 failed）后才写入失败记录，交给 Step 3 / 死信表。
+        exit_when_idle=True 时，队列中没有待处理和处理中的任务后退出。
+        """
+        queue = self.get_work_queue()
+        logger.info(f"队列消费者启动: {queue.worker_id}, 任务类型: {task_type}, 线程数: {self.max_workers}")
+
+        total = 0
+        success = 0
+        failed = 0
+        progress = ProgressReporter("队列", interval=self.LOG_SUMMARY_INTERVAL)
+
+        queue.start_heartbeat()
+        try:
             with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-                future_to_url = {
-                    executor.submit(self.process_single_record, url_path, force_update=True): url_path
-                    for url_path in detail_page_urls
-                }
-
-                for index, future in enumerate(as_completed(future_to_url), 1):
-                    url_path = future_to_url[future]
-                    try:
-                        result = future.result()
-                        if result['status'] == 'success':
+                while True:
+                    tasks = queue.claim(task_type, limit=self.QUEUE_BATCH_SIZE)
+                    if not tasks:
+                        if exit_when_idle and not queue.has_unfinished(task_type):
+                            break
+                        # 其他进程仍持有租约（可能稍后过期被回收），等待后重试
+                        time.sleep(self.QUEUE_IDLE_WAIT)
+                        continue
+
+                    future_to_task = {
+                        executor.submit(self.process_queue_task, task_type, task, force_update): task
+                        for task in tasks
+                    }
+
+                    done_keys = []
+                    for future in as_completed(future_to_task):
+                        task_key = future_to_task[future][0]
+                        total += 1
+                        try:
+                            ok, error_msg = future.result()
+                        except PipelineAbortError as exc:
+                            self._cancel_pending(future_to_task)
+                            ok, error_msg = False, f"中止: {str(exc)}"
+                        except Exception as exc:
+                            ok, error_msg = False, str(exc)
+
+                        if ok:
                             success += 1
-                            self.remove_failed_record(url_path)
-                            logger.success(f"[{index}/{total}] ✅ 重试成功: {url_path}")
+                            done_keys.append(task_key)
+                            if self.log_sampler.sample('queue_success'):
+                                logger.success(f"[{total}] ✅ 成功: {task_key}")
                         else:
                             failed += 1
-                            logger.error(f"[{index}/{total}] ❌ 重试失败: {url_path}")
+                            queue.nack(task_key, error_msg)
+                            logger.error(f"[{total}] ❌ 失败: {task_key} - {error_msg}")
+
+                    queue.ack(done_keys)
+                    self._record_queue_failures(queue)
+                    progress.update(total, success, failed,
+                                    extra=lambda: f"队列: {queue.stats().get(task_type, {})}")
+
+                    if self.breaker.is_aborted:
+                        # 已领取但被取消的任务释放租约，交给其他进程
+                        for future, task in future_to_task.items():
+                            if future.cancelled():
+                                queue.nack(task[0], "中止")
+                        raise PipelineAbortError(self.breaker.abort_reason)
+        finally:
+            queue.stop_heartbeat()
+            self._record_queue_failures(queue)
+
+        logger.success(f"队列消费完成！总数: {total}, 成功: {success}, 失败: {failed}")
+
+    def _record_queue_failures(self, queue):
+        """把队列中最终失败的任务写入失败记录（列表页任务的 url_path 为 '{分类}/{页码}'）"""
+        self.record_failures([
+            (task_key, error_msg or "请求失败", task_key in self._permanent_failures)
+            for task_key, error_msg in queue.take_failed()
+        ])
+
+    # ==================== 全文搜索 ====================
+
+    # 全文索引：外部内容 FTS5 表，内容来自视图 listings_search（rowid 为 listings.listing_id），
+    # 由 listings 上的触发器在插入 / 更新 / 删除时同步
+    SEARCH_INDEX_SQL = [
+        f'''
+        CREATE VIEW IF NOT EXISTS listings_search AS
+        SELECT listing_id, localizedTitle, fullAddress, {listing_schema.decode_sql('nearbyText')} AS nearbyText
+        FROM listings
+        ''',
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS listings_fts USING fts5(
+            localizedTitle, fullAddress, nearbyText,
+            content='listings_search', content_rowid='listing_id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS listings_fts_insert AFTER INSERT ON listings BEGIN
+            INSERT INTO listings_fts (rowid, localizedTitle, fullAddress, nearbyText)
+            VALUES (new.listing_id, new.localizedTitle, new.fullAddress, {listing_schema.decode_sql('nearbyText', 'new.')});
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS listings_fts_delete AFTER DELETE ON listings BEGIN
+            INSERT INTO listings_fts (listings_fts, rowid, localizedTitle, fullAddress, nearbyText)
+            VALUES ('delete', old.listing_id, old.localizedTitle, old.fullAddress,
+                    {listing_schema.decode_sql('nearbyText', 'old.')});
+        END
+        ''',
+        # 只有这三列的值实际变化时才更新索引（更新代理信息、重复写入相同的列表页数据不触发）
+        f'''
+        CREATE TRIGGER IF NOT EXISTS listings_fts_update
+        AFTER UPDATE OF localizedTitle, fullAddress, nearbyText_id ON listings
+        WHEN old.localizedTitle IS NOT new.localizedTitle OR old.fullAddress IS NOT new.fullAddress
+             OR old.nearbyText_id IS NOT new.nearbyText_id
+        BEGIN
+            INSERT INTO listings_fts (listings_fts, rowid, localizedTitle, fullAddress, nearbyText)
+            VALUES ('delete', old.listing_id, old.localizedTitle, old.fullAddress,
+                    {listing_schema.decode_sql('nearbyText', 'old.')});
+            INSERT INTO listings_fts (rowid, localizedTitle, fullAddress, nearbyText)
+            VALUES (new.listing_id, new.localizedTitle, new.fullAddress, {listing_schema.decode_sql('nearbyText', 'new.')});
+        END
+        ''',
+    ]
+    SEARCH_COLUMN_WEIGHTS = (3.0, 2.0, 1.0)  # bm25 权重：标题、地址、地铁信息
+
+    def _create_search_index(self, cursor):
+        """
+        创建全文索引和同步触发器（在 init_database 中调用），返回是否需要为已有数据建立索引
 
-                        if index % 10 == 0:
-                            logger.info(f"进度: {index}/{total} | 成功: {success} | 失败: {failed}")
+        SQLite 未编译 FTS5 时只记录警告，search_listings 退回 LIKE 查询
+        """
+        exists = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'listings_fts'"
+        ).fetchone() is not None
+        try:
+            for sql in self.SEARCH_INDEX_SQL:
+                cursor.execute(sql)
+        except sqlite3.OperationalError as e:
+            logger.warning(f"SQLite 不支持 FTS5，全文搜索将使用 LIKE 查询: {str(e)}")
+            return False
+        return not exists and cursor.execute("SELECT 1 FROM propertyguru LIMIT 1").fetchone() is not None
 
-                    except Exception as exc:
-                        logger.error(f"[{index}/{total}] 处理异常: {url_path} - {str(exc)}")
-                        failed += 1
-            
-            logger.success(f"详细页重试完成！总数: {total}, 成功: {success}, 失败: {failed}")
-        else:
-            logger.info("没有失败的详细页需要重试")
+    def rebuild_search_index(self):
+        """
+        根据 propertyguru 重建全文索引并合并索引段，返回索引的记录数（失败时返回 None）
 
-        logger.success("Step 3 完成：失败记录重试完成")
+        已有数据库升级时自动执行一次；怀疑索引与数据不一致时手动执行（listing_id 不受 VACUUM 影响）
+        """
+        start_time = time.time()
+        conn = None
+        try:
+            with self.db_lock:
+                conn = self._connect()
+                cursor = conn.cursor()
+                cursor.execute("INSERT INTO listings_fts (listings_fts) VALUES ('rebuild')")
+                cursor.execute("INSERT INTO listings_fts (listings_fts) VALUES ('optimize')")
+                conn.commit()
+                count = cursor.execute("SELECT COUNT(*) FROM propertyguru").fetchone()[0]
+            logger.success(f"全文索引重建完成: {count} 条记录，耗时 {time.time() - start_time:.2f} 秒")
+            return count
+        except Exception as e:
+            logger.error(f"重建全文索引失败: {str(e)}")
+            return None
+        finally:
+            if conn:
+                conn.close()
+
+    @staticmethod
+    def build_search_query(text, prefix=False):
+        """把关键词转为 FTS5 查询：每个词加引号（避免被解析为查询语法），全部匹配；prefix=True 时最后一个词按前缀匹配"""
+        terms = re.findall(r'\w+', text or '')
+        if not terms:
+            return None
+        query = ' '.join(f'"{term}"' for term in terms)
+        return query + '*' if prefix else query
+
+    def search_listings(self, text, limit=20, buy_rent=None, prefix=False, raw=False):
+        """
+        全文搜索房源标题 / 地址 / 地铁信息，按相关度（bm25）排序
+
+        - text: 关键词（空格分隔，全部匹配，不区分大小写）；raw=True 时直接作为 FTS5 查询语法（如 'orchard OR novena'）
+        - buy_rent: 只返回租 / 售类型为该值的房源
+        - prefix: 最后一个词按前缀匹配（输入联想）
+
+        返回 [{'url_path', 'localizedTitle', 'fullAddress', 'nearbyText', 'price_pretty', 'buy_rent', 'rank'}, ...]；
+        没有全文索引时退回 LIKE 查询（rank 为 None）
+        """
+        query = text if raw else self.build_search_query(text, prefix)
+        if not query:
+            return []
+        columns = ['url_path', 'localizedTitle', 'fullAddress', 'nearbyText', 'price_pretty', 'buy_rent']
+        select = ', '.join(f'p.{column}' for column in columns)
+        weights = ', '.join(str(weight) for weight in self.SEARCH_COLUMN_WEIGHTS)
+        where = " AND p.buy_rent = ?" if buy_rent else ""
+        params = [query] + ([buy_rent] if buy_rent else []) + [limit]
+
+        conn = None
+        try:
+            with self.db_lock:
+                conn = self._connect()
+                cursor = conn.cursor()
+                try:
+                    cursor.execute(f'''
+                        SELECT {select}, bm25(listings_fts, {weights}) AS rank
+                        FROM listings_fts
+                        JOIN listings l ON l.listing_id = listings_fts.rowid
+                        JOIN propertyguru p ON p.url_path = l.url_path
+                        WHERE listings_fts MATCH ?{where}
+                        ORDER BY rank LIMIT ?
+                    ''', params)
+                except sqlite3.OperationalError as e:
+                    if 'no such table' not in str(e):
+                        raise
+                    # 没有全文索引（SQLite 不支持 FTS5）：逐词 LIKE 匹配
+                    terms = re.findall(r'\w+', text or '')
+                    like = ' AND '.join(
+                        "(p.localizedTitle LIKE ? OR p.fullAddress LIKE ? OR p.nearbyText LIKE ?)" for _ in terms)
+                    cursor.execute(
+                        f"SELECT {select}, NULL FROM propertyguru p WHERE {like or '1'}{where} LIMIT ?",
+                        [f'%{term}%' for term in terms for _ in range(3)] + params[1:]
+                    )
+                rows = cursor.fetchall()
+            return [dict(zip(columns + ['rank'], row)) for row in rows]
+        except Exception as e:
+            logger.error(f"全文搜索失败: {text!r} - {str(e)}")
+            return []
+        finally:
+            if conn:
+                conn.close()
+
+    # ==================== 市场统计 ====================
+
+    def _market_stats_values(self, cursor, rows):
+        """写入前查出 rows（按 Listing.FIELDS 顺序）中已存在的记录：{url_path: 按 market_stats.STATS_COLUMNS 顺序的旧值}"""
+        url_paths = list({market_stats.row_url_path(row) for row in rows})
+        columns = ', '.join(market_stats.STATS_COLUMNS)
+        existing = {}
+        for i in range(0, len(url_paths), 500):
+            chunk = url_paths[i:i + 500]
+            placeholders = ','.join('?' * len(chunk))
+            cursor.execute(f"SELECT url_path, {columns} FROM propertyguru WHERE url_path IN ({placeholders})", chunk)
+            existing.update((row[0], row[1:]) for row in cursor.fetchall())
+        return existing
+
+    def _update_market_stats(self, cursor, rows, old_stats, now, force_update=True):
+        """
+        按本次写入的 rows 增量更新市场统计（调用方负责事务，与房源写入一起提交）
 
+        old_stats 为写入前已存在的记录（见 _market_stats_values），更新时先减去旧值；
+        force_update=False 时已存在的记录未被修改（INSERT OR IGNORE），不计入。
+        同一批中重复的 url_path：新记录以第一条为准（INSERT OR IGNORE），更新以最后一条为准
+        """
+        written = {}
+        for row in rows:
+            url_path = market_stats.row_url_path(row)
+            if url_path not in old_stats:
+                written.setdefault(url_path, row)
+            elif force_update:
+                written[url_path] = row
+
+        delta = market_stats.MarketStatsDelta()
+        for url_path, row in written.items():
+            old = old_stats.get(url_path)
+            if old is not None:
+                delta.remove(old)
+            delta.add(market_stats.row_stats_values(row))
+        if delta:
+            delta.apply(cursor, now)
+
+    def rebuild_market_stats(self):
+        """
+        根据 propertyguru 全表重新计算市场统计，返回统计的记录数（失败时返回 None）
+
+        已有数据库升级时自动执行一次；汇总表平时随房源写入增量更新，不需要定期重算
+        """
+        start_time = time.time()
+        columns = ', '.join(market_stats.STATS_COLUMNS)
+        conn = None
+        try:
+            with self.db_lock:
+                conn = self._connect()
+                cursor = conn.cursor()
+                delta = market_stats.MarketStatsDelta()
+                count = 0
+                for row in cursor.execute(f"SELECT {columns} FROM propertyguru"):
+                    delta.add(row)
+                    count += 1
+                cursor.execute("DELETE FROM market_stats")
+                delta.apply(cursor, datetime.now())
+                conn.commit()
+            logger.success(
+                f"市场统计重建完成: {count} 条记录，{len(delta.groups)} 个分组，耗时 {time.time() - start_time:.2f} 秒"
+            )
+            return count
+        except Exception as e:
+            logger.error(f"重建市场统计失败: {str(e)}")
+            return None
+        finally:
+            if conn:
+                conn.close()
+
+    def get_market_stats(self, buy_rent, property_type=market_stats.ALL, tenure=market_stats.ALL,
+                         mrt=market_stats.ALL):
+        """
+        读取一个分组的市场统计（只读汇总表中的一行，不扫描 propertyguru）
+
+        各维度默认 '*'（不区分）；mrt 为车站名，如 'Pasir Ris MRT'（见 market_stats.nearest_mrt）。
+        返回 {'listing_count', 'price_count', 'price_mean', 'price_median', 'price_p25', 'price_p75', 'psf_...'}，
+        没有该分组时返回 None。分位数为近似值（相对误差不超过 market_stats.RELATIVE_ACCURACY）
+        """
+        rows = self._query_market_stats(buy_rent, {'property_type': property_type, 'tenure': tenure, 'mrt': mrt})
+        return rows[0] if rows else None
+
+    def list_market_stats(self, buy_rent, by='property_type', limit=None, **filters):
+        """
+        按一个维度（property_type / tenure / mrt）列出各取值的市场统计，按房源数降序
+
+        filters 固定其余维度，如 list_market_stats('property-for-sale', by='mrt', property_type='Condominium')
+        """
+        if by not in market_stats.DIMENSIONS:
+            raise ValueError(f"by 必须是 {market_stats.DIMENSIONS} 之一: {by!r}")
+        dimensions = {name: filters.get(name, market_stats.ALL) for name in market_stats.DIMENSIONS}
+        dimensions[by] = None
+        rows = self._query_market_stats(buy_rent, dimensions)
+        rows.sort(key=lambda stats: stats['listing_count'], reverse=True)
+        return rows[:limit] if limit else rows
+
+    def _query_market_stats(self, buy_rent, dimensions):
+        """dimensions: {维度: 取值}，取值为 None 表示列出该维度的所有具体取值（不含 '*'）"""
+        conditions = ["buy_rent = ?"]
+        params = [buy_rent]
+        for name in market_stats.DIMENSIONS:
+            value = dimensions[name]
+            conditions.append(f"{name} != ?" if value is None else f"{name} = ?")
+            params.append(market_stats.ALL if value is None else value)
+        where = ' AND '.join(conditions)
+
+        conn = None
+        try:
+            with self.db_lock:
+                conn = self._connect()
+                cursor = conn.cursor()
+                rows = cursor.execute(f"{market_stats.SELECT_GROUPS_SQL} WHERE {where}", params).fetchall()
+            return [market_stats.summarize(row) for row in rows]
+        except Exception as e:
+            logger.error(f"读取市场统计失败: {str(e)}")
+            return []
+        finally:
+            if conn:
+                conn.close()
+
+    # ==================== 数据库维护 ====================
+
+    def compact_database(self):
+        """
+        删除字典表中不再被引用的值并 VACUUM，返回 (压缩前, 压缩后) 的文件大小（字节，失败时返回 None）
+
+        迁移为字典编码后自动执行一次（删除旧表释放的页在 VACUUM 之后才还给文件系统）；
+        VACUUM 需要与数据库大小相当的临时磁盘空间，执行期间其他连接不能写入
+        """
+        start_time = time.time()
+        conn = None
+        try:
+            with self.db_lock:
+                before = os.path.getsize(self.db_path)
+                conn = self._connect()
+                cursor = conn.cursor()
+                pruned = listing_schema.prune_text_values(cursor)
+                conn.commit()
+                cursor.execute("VACUUM")
+                # WAL 模式下 VACUUM 的结果先写入 -wal 文件，检查点之后主文件才变小
+                cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                after = os.path.getsize(self.db_path)
+            logger.success(
+                f"数据库压缩完成: {before / 1024 / 1024:.1f} MB -> {after / 1024 / 1024:.1f} MB，"
+                f"清理字典值 {pruned} 个，耗时 {time.time() - start_time:.2f} 秒"
+            )
+            return before, after
+        except Exception as e:
+            logger.error(f"数据库压缩失败: {str(e)}")
+            return None
+        finally:
+            if conn:
+                conn.close()
 
     # ==================== 导出功能 ====================
 
     def export_csv(self):
         """导出数据库数据到CSV文件"""
+        conn = None
         try:
-            export_dir = os.path.join(self.data_dir, "export")
+            import pandas as pd
+
+            export_dir = self.export_dir
             os.makedirs(export_dir, exist_ok=True)
 
-            conn = sqlite3.connect(self.db_path)
+            conn = self._connect()
             query = "SELECT * FROM propertyguru"
             df = pd.read_sql_query(query, conn)
 
             timestamp = time.strftime("%Y%m%d_%H%M%S")
             csv_path = os.path.join(export_dir, f"propertyguru_export_{timestamp}.csv")
-            df.to_csv(csv_path, index=False, encoding='utf-8-sig')
+            df.to_csv(csv_path, index=False, encoding=self.EXPORT_ENCODING)
 
             rent_df = df[df['buy_rent'] == 'property-for-rent']
             sale_df = df[df['buy_rent'] == 'property-for-sale']
@@ -991,8 +3230,8 @@ class PropertyGuruPipeline:
             rent_csv_path = os.path.join(export_dir, f"propertyguru_rent_{timestamp}.csv")
             sale_csv_path = os.path.join(export_dir, f"propertyguru_sale_{timestamp}.csv")
 
-            rent_df.to_csv(rent_csv_path, index=False, encoding='utf-8-sig')
-            sale_df.to_csv(sale_csv_path, index=False, encoding='utf-8-sig')
+            rent_df.to_csv(rent_csv_path, index=False, encoding=self.EXPORT_ENCODING)
+            sale_df.to_csv(sale_csv_path, index=False, encoding=self.EXPORT_ENCODING)
 
             # 统计完整度
             complete_records = len(df[
@@ -1007,7 +3246,11 @@ class PropertyGuruPipeline:
                 "sale_records": len(sale_df),
                 "complete_records": complete_records,
                 "completion_rate": f"{complete_records / len(df) * 100:.2f}%" if len(df) > 0 else "0%",
-                "export_time": timestamp
+                "export_time": timestamp,
+                # 价格 / 尺价统计直接读汇总表（见 get_market_stats）
+                "market": {buy_rent: self.get_market_stats(buy_rent)
+                           for buy_rent in ('property-for-rent', 'property-for-sale')},
+                "archived_records": conn.execute("SELECT COUNT(*) FROM propertyguru_archive").fetchone()[0],
             }
 
             stats_path = os.path.join(export_dir, f"propertyguru_stats_{timestamp}.json")
@@ -1030,8 +3273,137 @@ class PropertyGuruPipeline:
 
     # ==================== 主流程 ====================
 
+    def run_overlapped(self, step1_mode='smart_incremental', step1_shards=None):
+        """
+        Step 1 与 Step 2 重叠执行（流水线）
+
+        Step 1 在后台线程中爬取列表页，analysis_list_page 新写入的房源直接推入详情队列；
+        主线程把队列中的记录交给详情线程池（先处理爬取前已有的待补充记录），
+        两个阶段共用同一个请求限速器和熔断器，总耗时约为 max(Step 1, Step 2)。
+        结果按 STEP2_WRITE_BATCH 条批量写库；STEP2_MAX_REQUESTS / STEP2_MAX_SPEND 预算对整个运行生效。
+        """
+        logger.info("=" * 60)
+        logger.info("Step 1 + Step 2: 流水线模式（列表页与详情页同时爬取）")
+        logger.info("=" * 60)
+
+        detail_queue = queue.Queue()
+        step1_done = Event()
+        step1_errors = []
+
+        def _run_step1():
+            try:
+                self.step1_crawl_listings(mode=step1_mode, shards=step1_shards)
+            except BaseException as e:
+                step1_errors.append(e)
+            finally:
+                step1_done.set()
+
+        budget = request_budget(self.STEP2_MAX_REQUESTS, self.STEP2_MAX_SPEND, self.API_COST_PER_REQUEST)
+        backlog = self.get_step2_backlog()
+        if backlog:
+            detail_queue.put(backlog)
+
+        seen = set()
+        future_to_url = {}
+        pending = set()
+        buffer = []
+        counts = {'success': 0, 'failed': 0, 'skipped': 0}
+        progress = ProgressReporter("Step 2（流水线）", None, self.LOG_SUMMARY_INTERVAL)
+
+        self._detail_sink = detail_queue.put
+        producer = Thread(target=_run_step1, name="step1-producer", daemon=True)
+        producer.start()
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                while not self.breaker.is_aborted:
+                    # 把 Step 1 推入的记录交给详情线程池（去重，超出预算的丢弃，由下次运行处理）；
+                    # 详情线程空闲时阻塞等待新房源
+                    batches = []
+                    if not pending and not step1_done.is_set():
+                        try:
+                            batches.append(detail_queue.get(timeout=0.5))
+                        except queue.Empty:
+                            pass
+                    while True:
+                        try:
+                            batches.append(detail_queue.get_nowait())
+                        except queue.Empty:
+                            break
+                    for url_paths in batches:
+                        for url_path in url_paths:
+                            if url_path in seen or (budget is not None and len(seen) >= budget):
+                                continue
+                            seen.add(url_path)
+                            future = executor.submit(self.fetch_agent_detail, url_path)
+                            future_to_url[future] = url_path
+                            pending.add(future)
+
+                    if pending:
+                        done, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                        self._collect_overlapped(done, future_to_url, buffer, counts)
+                        if len(buffer) >= self.STEP2_WRITE_BATCH:
+                            self._flush_overlapped(buffer, counts)
+                        progress.update(sum(counts.values()), counts['success'], counts['failed'], counts['skipped'],
+                                        extra=lambda: f"待处理: {len(pending) + detail_queue.qsize()}")
+                    elif step1_done.is_set() and detail_queue.empty():
+                        break
+
+                if self.breaker.is_aborted:
+                    self._cancel_pending(pending)
+        finally:
+            self._detail_sink = None
+            self._flush_overlapped(buffer, counts)
+            producer.join()
+
+        if self.breaker.is_aborted:
+            raise PipelineAbortError(self.breaker.abort_reason)
+        if step1_errors:
+            raise step1_errors[0]
+
+        if budget is not None and len(seen) >= budget:
+            logger.info(f"🎯 已达到请求预算（{budget} 条），其余记录留待下次运行")
+        self.log_fetch_stats()
+        self.log_cache_stats()
+        logger.success(f"流水线完成！详情页总数: {len(seen)}, 成功: {counts['success']}, "
+                       f"失败: {counts['failed']}, 跳过: {counts['skipped']}")
+
+    def _collect_overlapped(self, futures, future_to_url, buffer, counts):
+        """汇总流水线模式中已完成的详情任务"""
+        for future in futures:
+            url_path = future_to_url.pop(future)
+            try:
+                result = future.result()
+            except PipelineAbortError:
+                continue
+            except Exception as exc:
+                logger.error(f"处理异常: {url_path} - {str(exc)}")
+                result = {'status': 'failed', 'url_path': url_path, 'error': str(exc)}
+
+            if result['status'] == 'success':
+                counts['success'] += 1
+                if self.log_sampler.sample('step2_success'):
+                    logger.success(f"✅ 成功: {url_path}")
+            elif result['status'] == 'failed':
+                counts['failed'] += 1
+                logger.error(f"❌ 失败: {url_path}")
+            else:
+                counts['skipped'] += 1
+                if self.log_sampler.sample('step2_skipped'):
+                    logger.info(f"⏭️  跳过: {url_path}")
+            buffer.append(result)
+
+    def _flush_overlapped(self, buffer, counts):
+        if not buffer:
+            return
+        write_failed = self._flush_agent_results(buffer)
+        counts['success'] -= write_failed
+        counts['failed'] += write_failed
+        buffer.clear()
+
+
     def run_pipeline(self, step1_mode='smart_incremental', step2_mode='incremental', 
-                    step2_expiry_days=None, skip_step1=False, skip_step2=False):
+                    step2_expiry_days=None, skip_step1=False, skip_step2=False, step2_processes=None,
+                    step1_shards=None, overlap=None):
         """
         运行完整的Pipeline
         
@@ -1041,6 +3413,10 @@ class PropertyGuruPipeline:
         - step2_expiry_days: Step 2过期天数（仅当mode='expired'时使用）
         - skip_step1: 是否跳过Step 1
         - skip_step2: 是否跳过Step 2
+        - step2_processes: Step 2工作进程数（None 使用 STEP2_PROCESSES，>1 启用多进程）
+        - step1_shards: Step 1分片列表（None 使用 SEARCH_SHARDS，为空时爬取完整列表）
+        - overlap: 是否以流水线模式同时运行 Step 1 和 Step 2（None 使用 PIPELINE_OVERLAP；
+          仅 incremental 模式的多线程 Step 2 支持，其他情况按顺序执行）
         """
         start_time = time.time()
         
@@ -1048,18 +3424,29 @@ class PropertyGuruPipeline:
         logger.info("PropertyGuru Pipeline 启动")
         logger.info("🚀" * 30)
 
+        overlap = self.PIPELINE_OVERLAP if overlap is None else overlap
+        if overlap and (skip_step1 or skip_step2 or step2_mode != 'incremental'
+                        or (step2_processes or self.STEP2_PROCESSES) > 1):
+            logger.info("流水线模式仅支持同时运行 Step 1 和 incremental 模式的多线程 Step 2，改为顺序执行")
+            overlap = False
+
         try:
-            # Step 1: 爬取列表页
-            if not skip_step1:
-                self.step1_crawl_listings(mode=step1_mode)
+            if overlap:
+                # Step 1 + Step 2: 流水线模式
+                self.run_overlapped(step1_mode, step1_shards)
             else:
-                logger.info("跳过 Step 1")
+                # Step 1: 爬取列表页
+                if not skip_step1:
+                    self.step1_crawl_listings(mode=step1_mode, shards=step1_shards)
+                else:
+                    logger.info("跳过 Step 1")
 
-            # Step 2: 爬取详细页（多线程）
-            if not skip_step2:
-                self.step2_crawl_agent_info(mode=step2_mode, expiry_days=step2_expiry_days)
-            else:
-                logger.info("跳过 Step 2")
+                # Step 2: 爬取详细页（多线程）
+                if not skip_step2:
+                    self.step2_crawl_agent_info(mode=step2_mode, expiry_days=step2_expiry_days,
+                                                processes=step2_processes)
+                else:
+                    logger.info("跳过 Step 2")
 
             # 导出数据
             logger.info("=" * 60)
@@ -1070,11 +3457,70 @@ class PropertyGuruPipeline:
             elapsed_time = time.time() - start_time
             logger.success(f"🎉 Pipeline 完成！总耗时: {elapsed_time:.2f} 秒")
 
+        except PipelineAbortError as e:
+            # 致命错误：进度已逐页/逐批写入数据库，导出已有数据后再退出
+            logger.error(f"Pipeline 因致命错误中止: {str(e)}，导出已获取的数据")
+            self.export_csv()
+            raise
         except Exception as e:
             logger.error(f"Pipeline 执行失败: {str(e)}")
             raise
 
 
+def _requests():
+    """首次发请求时才导入 requests（同时关闭 verify=False 的警告）"""
+    global _requests_module
+    if _requests_module is None:
+        import requests
+        import urllib3
+        urllib3.disable_warnings()
+        _requests_module = requests
+    return _requests_module
+
+
+_requests_module = None
+
+
+def _step2_shard_worker(shard_index, url_paths, settings, force_update, result_queue):
+    """Step 2 工作进程：多线程获取一个分片的代理信息，结果交给主进程写库"""
+    settings = dict(settings)
+    config = dict(settings.pop('config') or {})
+    # 日志文件由主进程负责轮转，工作进程只追加写入
+    config['log_rotation'] = None
+    pipeline = PropertyGuruPipeline(max_workers=settings['max_workers'], config=config)
+    for key, value in settings.items():
+        setattr(pipeline, key, value)
+    pipeline.rate_limiter = RateLimiter(pipeline.REQUEST_DELAY, pipeline.RATE_LIMIT_BURST)
+
+    logger.info(f"分片 {shard_index} 启动（PID {os.getpid()}），记录数: {len(url_paths)}")
+    abort_reason = None
+    try:
+        with ThreadPoolExecutor(max_workers=pipeline.max_workers) as executor:
+            future_to_url = {
+                executor.submit(pipeline.fetch_agent_detail, url_path, force_update): url_path
+                for url_path in url_paths
+            }
+            for future in as_completed(future_to_url):
+                if future.cancelled():
+                    continue
+                try:
+                    result = future.result()
+                except PipelineAbortError as exc:
+                    # 取消未开始的任务；已经发出的请求继续完成，结果照常交给主进程写库
+                    if abort_reason is None:
+                        abort_reason = str(exc)
+                        PropertyGuruPipeline._cancel_pending(future_to_url)
+                    continue
+                except Exception as exc:
+                    logger.error(f"分片 {shard_index} 处理异常: {future_to_url[future]} - {str(exc)}")
+                    result = {'status': 'failed', 'url_path': future_to_url[future]}
+                result_queue.put(('result', result))
+    finally:
+        if abort_reason is not None:
+            result_queue.put(('abort', shard_index, abort_reason))
+        result_queue.put(('done', shard_index, pipeline.fetch_stats))
+
+
 if __name__ == '__main__':
     # 创建Pipeline实例（设置线程数）
     pipeline = PropertyGuruPipeline(max_workers=10)
@@ -0,0 +1,231 @@
+"""
+响应缓存（基于 SQLite 的磁盘缓存）
+
+短时间内重复运行（重试、Step 1 回溯检查、Step 2 中断后重跑）时，直接复用几分钟前下载的页面，
+不再发出付费的 API 请求：
+
+- 以 url_path 为键，按页面类型（列表页 / 详情页）设置不同的有效期（TTL）
+- 页面内容 zlib 压缩后保存；总大小超过上限时按最近访问时间（LRU）淘汰
+- 统计命中 / 未命中 / 过期 / 写入 / 淘汰次数
+
+缓存放在独立的数据库文件中，不占用主数据库的写锁；多个进程可以共享同一个缓存文件。
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from loguru import logger
+
+
+class CachedResponse:
+    """缓存命中时返回给调用方的响应对象（提供 requests.Response 中用到的属性）"""
+
+    __slots__ = ('url_path', 'status_code', 'content', 'fetched_at', 'headers', '_text')
+
+    from_cache = True
+    encoding = 'utf-8'
+
+    def __init__(self, url_path, content, fetched_at, status_code=200):
+        self.url_path = url_path
+        self.status_code = status_code
+        self.content = content
+        self.fetched_at = fetched_at
+        self.headers = {}
+        self._text = None
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = self.content.decode('utf-8', errors='replace')
+        return self._text
+
+    def json(self):
+        return json.loads(self.text)
+
+    def iter_content(self, chunk_size=1):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+    def close(self):
+        pass
+
+
+class ResponseCache:
+    """按页面类型设置 TTL、按大小做 LRU 淘汰的响应缓存"""
+
+    def __init__(self, db_path, ttls, max_bytes=500 * 1024 * 1024, timeout=30):
+        """
+        - ttls: {页面类型: 有效期（秒）}，未列出的类型不缓存
+        - max_bytes: 缓存内容（压缩后）总大小上限
+        """
+        self.db_path = db_path
+        self.ttls = dict(ttls)
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+
+        self._stats = {'hits': 0, 'misses': 0, 'expired': 0, 'stores': 0, 'evictions': 0}
+        self._stats_lock = threading.Lock()
+        self._evict_lock = threading.Lock()
+        self._total_bytes = 0
+
+        self.init_table()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=self.timeout)
+
+    def _count(self, key, value=1):
+        with self._stats_lock:
+            self._stats[key] += value
+
+    def init_table(self):
+        """创建缓存表，读取当前缓存大小"""
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        conn = None
+        try:
+            conn = self._connect()
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS response_cache (
+                    url_path TEXT PRIMARY KEY,
+                    page_type TEXT,
+                    status_code INTEGER,
+                    body BLOB,
+                    size INTEGER,
+                    fetched_at REAL,
+                    accessed_at REAL
+                )
+            ''')
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_response_cache_accessed ON response_cache(accessed_at)")
+            conn.commit()
+            self._total_bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM response_cache").fetchone()[0]
+        except Exception as e:
+            logger.error(f"响应缓存初始化失败: {str(e)}")
+        finally:
+            if conn:
+                conn.close()
+
+    def get(self, url_path, page_type):
+        """返回未过期的 CachedResponse，未命中 / 已过期 / 该类型不缓存时返回 None"""
+        ttl = self.ttls.get(page_type)
+        if not ttl:
+            return None
+
+        conn = None
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT body, fetched_at, status_code FROM response_cache WHERE url_path = ?", (url_path,)
+            ).fetchone()
+            now = time.time()
+            if row is None:
+                self._count('misses')
+                return None
+            if now - row[1] > ttl:
+                self._count('expired')
+                return None
+
+            conn.execute("UPDATE response_cache SET accessed_at = ? WHERE url_path = ?", (now, url_path))
+            conn.commit()
+            self._count('hits')
+            return CachedResponse(url_path, zlib.decompress(row[0]), row[1], row[2])
+        except Exception as e:
+            logger.warning(f"读取响应缓存失败: {url_path} - {str(e)}")
+            return None
+        finally:
+            if conn:
+                conn.close()
+
+    def put(self, url_path, page_type, content, status_code=200):
+        """写入（覆盖）一条缓存；content 为 bytes 或 str"""
+        if not self.ttls.get(page_type):
+            return
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        body = zlib.compress(content, 1)
+        now = time.time()
+
+        conn = None
+        try:
+            conn = self._connect()
+            old = conn.execute("SELECT size FROM response_cache WHERE url_path = ?", (url_path,)).fetchone()
+            conn.execute('''
+                INSERT OR REPLACE INTO response_cache
+                (url_path, page_type, status_code, body, size, fetched_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (url_path, page_type, status_code, body, len(body), now, now))
+            conn.commit()
+        except Exception as e:
+            logger.warning(f"写入响应缓存失败: {url_path} - {str(e)}")
+            return
+        finally:
+            if conn:
+                conn.close()
+
+        self._count('stores')
+        with self._stats_lock:
+            self._total_bytes += len(body) - (old[0] if old else 0)
+            over = self._total_bytes > self.max_bytes
+        if over:
+            self.evict()
+
+    def evict(self):
+        """按最近访问时间淘汰，直到总大小降到上限的 90% 以下"""
+        if not self._evict_lock.acquire(blocking=False):
+            return  # 其他线程正在淘汰
+        conn = None
+        try:
+            conn = self._connect()
+            # 其他进程也可能写入，以数据库中的实际大小为准
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM response_cache").fetchone()[0]
+            target = self.max_bytes * 0.9
+            victims = []
+            if total > self.max_bytes:
+                for url_path, size in conn.execute("SELECT url_path, size FROM response_cache ORDER BY accessed_at"):
+                    if total <= target:
+                        break
+                    victims.append((url_path,))
+                    total -= size
+                conn.executemany("DELETE FROM response_cache WHERE url_path = ?", victims)
+                conn.commit()
+            with self._stats_lock:
+                self._total_bytes = total
+                self._stats['evictions'] += len(victims)
+            if victims:
+                logger.debug(f"响应缓存淘汰 {len(victims)} 条，当前 {total / 1024 / 1024:.1f} MB")
+        except Exception as e:
+            logger.warning(f"响应缓存淘汰失败: {str(e)}")
+        finally:
+            if conn:
+                conn.close()
+            self._evict_lock.release()
+
+    def clear(self, page_type=None):
+        """清空缓存（或某一类页面的缓存）"""
+        conn = None
+        try:
+            conn = self._connect()
+            if page_type:
+                conn.execute("DELETE FROM response_cache WHERE page_type = ?", (page_type,))
+            else:
+                conn.execute("DELETE FROM response_cache")
+            conn.commit()
+            with self._stats_lock:
+                self._total_bytes = conn.execute(
+                    "SELECT COALESCE(SUM(size), 0) FROM response_cache").fetchone()[0]
+        except Exception as e:
+            logger.error(f"清空响应缓存失败: {str(e)}")
+        finally:
+            if conn:
+                conn.close()
+
+    def stats(self):
+        """本进程的命中统计 + 缓存当前大小"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+            stats['bytes'] = self._total_bytes
+        lookups = stats['hits'] + stats['misses'] + stats['expired']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
@@ -5,22 +5,25 @@
 """
 
 from propertyguru_pipeline import PropertyGuruPipeline
+from config import load_config
 import sys
 
 def main():
     # ==================== 自定义配置 ====================
-    config = {
+    # 这里的配置会覆盖 config.py 默认值、config.ini 和 PROPERTYGURU_* 环境变量
+    # 全部可用配置项见 config.CONFIG_SCHEMA
+    overrides = {
         # API配置（必填）
         'apikey': '',  # 填入你的API密钥
         'proxy': '',   # 填入你的代理
         
         # 数据存储
         'data_dir': 'data',
-        'db_name': 'propertyguru.db',
+        'db_name': 'propertyguru_integrated.db',
         
         # 多线程配置
         'max_workers': 5,              # 线程数（3-10）
-        'request_delay': 0.5,          # 请求间隔（秒）
+        'request_delay': 0,            # 所有线程之间的最小请求间隔（秒），0 不限速
         
         # Stage1配置
         'pages_without_new_threshold': 5,  # 早停阈值
@@ -29,29 +32,24 @@ def main():
         # Stage2配置
         'agent_info_expiry_days': 90,      # 代理信息过期天数
     }
+    config = load_config(ini_path='config.ini', overrides=overrides)
     
     # ==================== 创建Pipeline ====================
-    pipeline = PropertyGuruPipeline(config)
+    pipeline = PropertyGuruPipeline(config=config)
     
     # ==================== 运行Pipeline ====================
     # 根据需要修改以下参数
     
     pipeline.run_pipeline(
-        # 是否运行Stage1（列表页爬取）
-        run_stage1=True,
+        # Step 1模式: 'full', 'smart_incremental'
+        step1_mode='smart_incremental',
         
-        # 是否运行Stage2（详情页爬取）
-        run_stage2=True,
+        # Step 2模式: 'incremental'（补充缺失）, 'expired'（更新过期）
+        step2_mode='incremental',
         
-        # Stage1模式: 'full', 'incremental', 'smart_incremental'
-        stage1_mode='smart_incremental',
-        
-        # Stage2模式: 'incomplete', 'expired', 'all'
-        stage2_mode='incomplete',
-        
-        # 页数范围（可选）
-        rent_pages=(1, 1484),  # 租房页数范围
-        sale_pages=(1, 2663),  # 买房页数范围
+        # 是否跳过Step 1（列表页爬取）/ Step 2（详情页爬取）
+        skip_step1=False,
+        skip_step2=False,
     )
     
     print("\n✅ Pipeline完成！")
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+常驻服务运行脚本
+替代 cron 定时调用 run_daily.py / run_retry.py / run_details_only.py：
+一个进程持续运行，按间隔刷新列表页、补充 / 刷新详情页、重试失败记录（间隔和预算见 config.ini 的 [DAEMON]）
+
+示例：
+    python run_daemon.py
+    python run_daemon.py --config prod.ini --status-port 9000
+
+    kill -HUP <pid>                        # 重新加载配置
+    kill -TERM <pid>                       # 当前任务结束后退出
+    curl http://127.0.0.1:8765/status      # 查看运行状态
+"""
+
+import argparse
+import sys
+
+from config import load_config, ConfigError
+from daemon import PipelineDaemon
+from flow_control import PipelineAbortError
+from propertyguru_pipeline import PropertyGuruPipeline
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PropertyGuru 常驻服务")
+    parser.add_argument('--config', default='config.ini', help="INI 配置文件（不存在时忽略）")
+    parser.add_argument('--status-port', type=int, default=None, help="状态接口端口，0 表示不启动")
+    args = parser.parse_args()
+
+    overrides = {'daemon_status_port': args.status_port}
+    try:
+        pipeline = PropertyGuruPipeline(config=load_config(ini_path=args.config, overrides=overrides))
+    except ConfigError as e:
+        print(f"❌ {e}")
+        return 2
+
+    daemon = PipelineDaemon(pipeline, ini_path=args.config, overrides=overrides)
+    daemon.install_signal_handlers()
+    try:
+        daemon.run()
+    except PipelineAbortError as e:
+        print(f"\n❌ 致命错误: {str(e)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        print("\n❌ 用户中断")
+        sys.exit(1)
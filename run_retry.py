@@ -1,4 +1,5 @@
 from propertyguru_pipeline import PropertyGuruPipeline
+from flow_control import PipelineAbortError
 import time
 from loguru import logger
 
@@ -8,7 +9,10 @@ if __name__ == '__main__':
 
     # 执行失败重试流程
     start_time = time.time()
-    pipeline.retry_failed_records()
+    try:
+        pipeline.retry_failed_records()
+    except PipelineAbortError as e:
+        logger.error(f"重试因致命错误中止: {str(e)}")
     elapsed_time = time.time() - start_time
     
     logger.success(f"失败记录重试完成！总耗时: {elapsed_time:.2f} 秒")
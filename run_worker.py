@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+分布式队列运行脚本
+多个进程/机器共享同一个数据库文件时，通过任务租约分工，不会重复请求
+
+示例：
+    # 1. 生产者：写入列表页任务和详情页任务
+    python run_worker.py produce --type list
+    python run_worker.py produce --type detail --mode incremental
+
+    # 2. 消费者：可以同时启动多个
+    python run_worker.py consume --type list --workers 5
+    python run_worker.py consume --type detail --workers 10
+"""
+
+import argparse
+import sys
+
+from propertyguru_pipeline import PropertyGuruPipeline
+from work_queue import WorkQueue
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PropertyGuru 分布式队列")
+    parser.add_argument('role', choices=['produce', 'consume', 'stats'], help="运行角色")
+    parser.add_argument('--type', choices=[WorkQueue.TASK_LIST, WorkQueue.TASK_DETAIL],
+                        default=WorkQueue.TASK_DETAIL, help="任务类型")
+    parser.add_argument('--mode', choices=['incremental', 'expired'], default='incremental',
+                        help="详情页任务来源（仅 produce --type detail）")
+    parser.add_argument('--expiry-days', type=int, default=None, help="过期天数（仅 expired 模式）")
+    parser.add_argument('--workers', type=int, default=5, help="消费者线程数")
+    parser.add_argument('--force-update', action='store_true', help="强制更新已有记录")
+    parser.add_argument('--apikey', default='', help="CloudBypass API密钥")
+    parser.add_argument('--proxy', default='', help="代理地址")
+    args = parser.parse_args()
+
+    pipeline = PropertyGuruPipeline(max_workers=args.workers)
+    pipeline.apikey = args.apikey
+    pipeline.proxy = args.proxy
+
+    if args.role == 'produce':
+        if args.type == WorkQueue.TASK_LIST:
+            for category in pipeline.STEP1_CATEGORIES:
+                # 获取总页数时已爬取第 1 页
+                total_pages = pipeline.discover_total_pages(category)
+                pipeline.enqueue_list_pages(category, 2, total_pages + 1)
+        else:
+            pipeline.enqueue_detail_backlog(args.mode, args.expiry_days)
+    elif args.role == 'consume':
+        pipeline.run_queue_worker(args.type, force_update=args.force_update)
+
+    print(f"\n队列状态: {pipeline.get_work_queue().stats()}")
+    return 0
+
+
+if __name__ == '__main__':
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        print("\n❌ 用户中断")
+        sys.exit(1)
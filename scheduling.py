@@ -0,0 +1,195 @@
+"""
+Step 2 详情页调度
+
+- 优先级调度：按新鲜度（created_at）、页面显示的更新时间（recency_text）、价格、租/售类型
+  给待补充代理信息的记录打分，高分优先，并按请求数 / API 费用预算截断
+- 自适应重爬：记录每条房源代理信息的实际变化情况，变化频繁的缩短重爬间隔，
+  长期不变的延长间隔；首次纳入调度的记录按哈希均匀分散到整个周期，避免集中过期
+- 失败重试分级：失败次数越多，下次重试等待越久（指数增长并封顶），
+  到期时间按哈希加少量抖动，避免同一批失败记录同时到期
+"""
+
+import hashlib
+import math
+import re
+import zlib
+from datetime import datetime, timedelta
+
+# 默认打分权重，可通过 PropertyGuruPipeline.STEP2_PRIORITY_WEIGHTS 覆盖
+DEFAULT_PRIORITY_WEIGHTS = {
+    'freshness': 1.0,  # 入库时间越近分数越高（半衰期 FRESHNESS_HALF_LIFE_DAYS）
+    'recency': 0.5,  # 列表页显示的更新时间越近分数越高
+    'price': 0.3,  # 价格越高分数越高（取对数）
+    'category': {  # 按租/售类型加分
+        'property-for-sale': 0.2,
+        'property-for-rent': 0.0,
+    },
+}
+
+FRESHNESS_HALF_LIFE_DAYS = 7
+RECENCY_HALF_LIFE_HOURS = 72
+
+_RECENCY_UNITS = {
+    'min': 1 / 60, 'minute': 1 / 60, 'minutes': 1 / 60, 'mins': 1 / 60,
+    'hour': 1, 'hours': 1, 'hr': 1, 'hrs': 1,
+    'day': 24, 'days': 24,
+    'week': 24 * 7, 'weeks': 24 * 7,
+    'month': 24 * 30, 'months': 24 * 30,
+    'year': 24 * 365, 'years': 24 * 365,
+}
+
+
+def parse_recency_hours(text, now=None):
+    """把列表页的 recency 文本（如 '2 hours ago'、'Listed on 12 Jan 2025'）转为距今小时数，无法解析时返回 None"""
+    if not text or not isinstance(text, str):
+        return None
+    lowered = text.lower()
+    if 'just now' in lowered or 'today' in lowered:
+        return 0.0
+    if 'yesterday' in lowered:
+        return 24.0
+
+    match = re.search(r'(\d+)\s*([a-z]+)\s+ago', lowered)
+    if match and match.group(2) in _RECENCY_UNITS:
+        return int(match.group(1)) * _RECENCY_UNITS[match.group(2)]
+
+    match = re.search(r'(\d{1,2}\s+[A-Za-z]{3}\s+\d{4})', text)
+    if match:
+        try:
+            listed = datetime.strptime(match.group(1), '%d %b %Y')
+            return max(0.0, ((now or datetime.now()) - listed).total_seconds() / 3600)
+        except ValueError:
+            return None
+    return None
+
+
+def parse_price(text):
+    """从价格文本（如 'S$ 3,500 /mo'、'S$ 1.2M'）中提取数值，无法解析时返回 None"""
+    if not text or not isinstance(text, str):
+        return None
+    match = re.search(r'([\d,]+(?:\.\d+)?)\s*([kKmM](?![A-Za-z]))?', text)
+    if not match:
+        return None
+    try:
+        value = float(match.group(1).replace(',', ''))
+    except ValueError:
+        return None
+    unit = (match.group(2) or '').lower()
+    if unit == 'k':
+        value *= 1_000
+    elif unit == 'm':
+        value *= 1_000_000
+    return value
+
+
+def _parse_timestamp(value):
+    if isinstance(value, datetime):
+        return value
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+def score_record(created_at, recency_text, price_pretty, buy_rent, weights=None, now=None):
+    """计算一条记录的优先级分数（越大越优先）"""
+    weights = weights or DEFAULT_PRIORITY_WEIGHTS
+    now = now or datetime.now()
+    score = 0.0
+
+    created = _parse_timestamp(created_at)
+    if created is not None:
+        age_days = max(0.0, (now - created).total_seconds() / 86400)
+        score += weights.get('freshness', 0) * 0.5 ** (age_days / FRESHNESS_HALF_LIFE_DAYS)
+
+    hours = parse_recency_hours(recency_text, now)
+    if hours is not None:
+        score += weights.get('recency', 0) * 0.5 ** (hours / RECENCY_HALF_LIFE_HOURS)
+
+    price = parse_price(price_pretty)
+    if price:
+        # 1e7 新币封顶，归一到 0-1
+        score += weights.get('price', 0) * min(1.0, math.log10(price + 1) / 7)
+
+    score += weights.get('category', {}).get(buy_rent, 0)
+    return score
+
+
+def request_budget(max_requests=None, max_spend=None, cost_per_request=1.0):
+    """根据请求数上限和费用上限计算本次最多处理的记录数，不限制时返回 None"""
+    limits = []
+    if max_requests is not None:
+        limits.append(int(max_requests))
+    if max_spend is not None and cost_per_request > 0:
+        limits.append(int(max_spend // cost_per_request))
+    return min(limits) if limits else None
+
+
+def prioritize_records(rows, weights=None, budget=None, now=None):
+    """
+    按优先级排序并截断
+
+    rows: [(url_path, created_at, recency_text, price_pretty, buy_rent), ...]
+    返回排序后的 url_path 列表
+    """
+    now = now or datetime.now()
+    scored = sorted(
+        rows,
+        key=lambda row: score_record(row[1], row[2], row[3], row[4], weights, now),
+        reverse=True
+    )
+    url_paths = [row[0] for row in scored]
+    if budget is not None:
+        url_paths = url_paths[:budget]
+    return url_paths
+
+
+# ==================== 自适应重爬 ====================
+
+def agent_content_hash(cea, mobile, rating):
+    """代理信息指纹，用于判断两次抓取之间是否发生变化"""
+    content = '\x1f'.join(str(value) for value in (cea, mobile, rating))
+    return hashlib.md5(content.encode('utf-8')).hexdigest()
+
+
+def next_interval(interval_days, changed, min_days, max_days):
+    """根据本次是否变化调整重爬间隔：变化则减半，不变则放大 1.5 倍"""
+    if changed:
+        interval_days = interval_days * 0.5
+    else:
+        interval_days = interval_days * 1.5
+    return max(min_days, min(max_days, interval_days))
+
+
+def spread_due_time(url_path, interval_days, now=None):
+    """首次纳入调度的记录：按 url_path 哈希把到期时间均匀分散到 [now, now + interval)"""
+    now = now or datetime.now()
+    fraction = zlib.crc32(url_path.encode('utf-8')) / 0xFFFFFFFF
+    return now + timedelta(days=interval_days * fraction)
+
+
+def daily_budget(tracked_count, mean_interval_days):
+    """平均每天需要刷新的记录数（保证每条记录大约在其间隔内被刷新一次）"""
+    if tracked_count <= 0 or mean_interval_days <= 0:
+        return 0
+    return math.ceil(tracked_count / mean_interval_days)
+
+
+# ==================== 失败重试分级 ====================
+
+RETRY_TIER_FACTOR = 4  # 每多失败一次，等待时间乘以该系数
+
+
+def retry_tier_delay(failures, base_seconds, max_seconds):
+    """第 failures 次失败后到下次重试的等待秒数：base、base*4、base*16 ……，不超过 max_seconds"""
+    return min(max_seconds, base_seconds * RETRY_TIER_FACTOR ** max(0, failures - 1))
+
+
+def next_attempt_time(url_path, failures, base_seconds, max_seconds, now=None):
+    """下次重试时间：分级等待时间再按 url_path 哈希增加 0-10% 的抖动"""
+    now = now or datetime.now()
+    delay = retry_tier_delay(failures, base_seconds, max_seconds)
+    jitter = zlib.crc32(url_path.encode('utf-8')) / 0xFFFFFFFF * 0.1
+    return now + timedelta(seconds=delay * (1 + jitter))
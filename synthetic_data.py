@@ -0,0 +1,251 @@
+"""
+合成测试数据：按接近真实数据的分布生成房源、爬虫记录和失败记录，用于数据库层的规模测试（见 bench_db_scale.py）
+
+- SyntheticListings.listing_data(i) 生成列表页 listingsData[i]['listingData']（字段结构与真实页面一致），
+  经 models.extract_listing 转为写库的行，格式与 analysis_list_page 写入的完全相同
+- 分布：租 / 售约各半；房型以 HDB / 公寓为主；代理池固定大小，少数代理挂大量房源（帕累托分布）；
+  约 70% 的房源已有 Step 2 代理信息；少量房源缺少卧室数 / 面积 / 尺价 / 地铁信息 / 产权
+- 每条记录只由 (seed, 序号) 决定：同一序号总是生成相同的记录，可以分批追加（populate 的 start / count）
+"""
+
+import random
+from datetime import datetime, timedelta
+
+import market_stats
+from models import AgentInfo, Listing, extract_listing
+
+_RENT = 'property-for-rent'
+_SALE = 'property-for-sale'
+
+# (房型, 权重, 卧室数范围, 每间卧室的面积 sqft)
+_PROPERTY_TYPES = (
+    ('HDB Flat', 35, (1, 5), 330),
+    ('Condominium', 33, (0, 4), 380),
+    ('Apartment', 10, (0, 4), 360),
+    ('Executive Condominium', 6, (2, 5), 300),
+    ('Terraced House', 5, (3, 6), 600),
+    ('Semi-Detached House', 4, (4, 6), 700),
+    ('Detached House', 2, (4, 7), 900),
+    ('Cluster House', 2, (3, 5), 550),
+    ('Walk-up', 3, (1, 4), 400),
+)
+_TENURES = (('99-year Leasehold', 55), ('Freehold', 33), ('999-year Leasehold', 5), ('103-year Leasehold', 2), (None, 5))
+_STATIONS = (
+    'EW1 Pasir Ris', 'EW2 / DT32 Tampines', 'EW4 Tanah Merah', 'EW5 Bedok', 'EW8 / CC9 Paya Lebar',
+    'EW11 Lavender', 'EW12 / DT14 Bugis', 'NS25 / EW13 City Hall', 'EW16 / NE3 / TE17 Outram Park',
+    'EW21 / CC22 Buona Vista', 'EW23 Clementi', 'NS1 / EW24 / JE5 Jurong East', 'EW27 Boon Lay',
+    'NS4 / BP1 Choa Chu Kang', 'NS7 Kranji', 'NS9 / TE2 Woodlands', 'NS13 Yishun', 'NS16 Ang Mo Kio',
+    'NS17 / CC15 Bishan', 'NS19 Toa Payoh', 'NS21 / DT11 Newton', 'NS22 / TE14 Orchard', 'NS23 Somerset',
+    'NS24 / NE6 / CC1 Dhoby Ghaut', 'NE9 Boon Keng', 'NE12 / CC13 Serangoon', 'NE14 Hougang', 'NE16 / STC Sengkang',
+    'NE17 / PTC Punggol', 'CC4 / DT15 Promenade', 'CC10 / DT26 MacPherson', 'CC19 / DT9 Botanic Gardens',
+    'DT3 Hillview', 'DT16 / CE1 Bayfront', 'TE11 Stevens', 'TE22 Gardens by the Bay',
+)
+_PROJECT_WORDS = (
+    ('The', 'Parc', 'Sky', 'Marina', 'Orchard', 'Riverfront', 'Lakeside', 'Treasure', 'Grand', 'Royal',
+     'Casa', 'Seaside', 'Verde', 'Lentor', 'Tampines', 'Pasir Ris', 'Bukit', 'Kovan', 'Clementi', 'Amber'),
+    ('Residences', 'Suites', 'Park', 'Heights', 'Gardens', 'View', 'Towers', 'Loft', 'Edge', 'Bay',
+     'Point', 'Collection', 'Vista', 'Grove', 'Court', 'Haven', 'Peak', 'Green', 'Crest', 'Place'),
+)
+_STREETS = (
+    'Tampines Street', 'Ang Mo Kio Avenue', 'Bedok North Road', 'Jurong West Street', 'Woodlands Drive',
+    'Punggol Field', 'Sengkang East Way', 'Yishun Ring Road', 'Clementi Avenue', 'Toa Payoh Lorong',
+    'Marine Parade Road', 'Orchard Boulevard', 'River Valley Road', 'Bukit Timah Road', 'East Coast Road',
+)
+_FIRST_NAMES = ('Jane', 'Alan', 'Michelle', 'Kelvin', 'Grace', 'Jason', 'Rachel', 'Daniel', 'Eunice', 'Marcus',
+                'Cheryl', 'Benjamin', 'Priya', 'Ahmad', 'Siti', 'Wei Ling', 'Jun Jie', 'Vivian', 'Raymond', 'Joanne')
+_LAST_NAMES = ('Tan', 'Lim', 'Lee', 'Ng', 'Ong', 'Wong', 'Goh', 'Chua', 'Chan', 'Koh', 'Teo', 'Ang', 'Yeo',
+               'Tay', 'Ho', 'Low', 'Sim', 'Kumar', 'Rahman', 'Pillai')
+_AGENCIES = (
+    ('ERA REALTY NETWORK PTE LTD', 'L3002382K'), ('PROPNEX REALTY PTE LTD', 'L3008022J'),
+    ('HUTTONS ASIA PTE LTD', 'L3008899K'), ('ORANGETEE & TIE PTE LTD', 'L3009250K'),
+    ('SRI PTE LTD', 'L3010738A'), ('OPENNET PTE LTD', 'L3010059K'), ('C & H PROPERTIES PTE LTD', 'L3002496J'),
+)
+_TAGLINES = ('', '', 'Senior Marketing Director', 'Associate Division Director', 'Your trusted HDB specialist',
+             'Condo & landed specialist · 10+ years experience', 'Marketing Associate')
+_RECENCY = ('Listed on {date}', '{n} mins ago', '{n} hours ago', '{n} days ago')
+
+DEFAULT_AGENTS = 20000
+AGENT_INFO_RATIO = 0.7     # 已有 Step 2 代理信息的房源比例
+SPIDER_FAILED_RATIO = 0.03  # 详情页爬取失败（爬虫记录为“失败”）的比例，这些房源同时在 failed_records 中
+_ERRORS = ('获取代理信息失败', 'HTTP 503', 'HTTP 429', '请求超时', 'HTTPSConnectionPool: Read timed out')
+
+
+def _weighted(rng, choices):
+    total = sum(weight for _, weight, *_ in choices)
+    point = rng.uniform(0, total)
+    for item in choices:
+        point -= item[1]
+        if point <= 0:
+            return item
+    return choices[-1]
+
+
+class SyntheticListings:
+    """按序号生成合成记录；now 为“当前时间”，时间列按它往前分布"""
+
+    def __init__(self, seed=0, agents=DEFAULT_AGENTS, now=None):
+        self.seed = seed
+        self.agents = agents
+        self.now = now or datetime.now()
+        self._agents = {}
+
+    def _rng(self, index, salt=0):
+        return random.Random((self.seed << 40) ^ (salt << 36) ^ index)
+
+    def agent(self, number):
+        """代理池中的第 number 个代理：(id, 姓名, 列表页简介, 主页, CEA, 手机, 评分)"""
+        agent = self._agents.get(number)
+        if agent is None:
+            agent = self._agents[number] = self._make_agent(number)
+        return agent
+
+    def _make_agent(self, number):
+        rng = self._rng(number, salt=1)
+        name = f"{rng.choice(_FIRST_NAMES)} {rng.choice(_LAST_NAMES)}"
+        agency, license_no = rng.choice(_AGENCIES)
+        tagline = rng.choice(_TAGLINES)
+        agent_id = 100000 + number
+        cea = f"R{rng.randrange(10 ** 6):06d}{rng.choice('ABCDEFGHIJ')}"
+        return (
+            agent_id,
+            name,
+            f"{tagline} · {agency}" if tagline else agency,
+            f"/agent/{name.lower().replace(' ', '-')}-{agent_id}",
+            f"{name} · CEA: {cea} · {agency} ({license_no})",
+            f"+65 {rng.choice('89')}{rng.randrange(10 ** 6, 10 ** 7)}",
+            round(rng.uniform(4.0, 5.0), 1) if rng.random() < 0.75 else '无评分',
+        )
+
+    def listing_data(self, index):
+        """第 index 条房源的 listingData（与列表页 __NEXT_DATA__ 中的结构相同）"""
+        rng = self._rng(index)
+        buy_rent = _RENT if rng.random() < 0.5 else _SALE
+        property_type, _, (low_beds, high_beds), area_per_bed = _weighted(rng, _PROPERTY_TYPES)
+        bedrooms = rng.randint(low_beds, high_beds)
+        area = int(max(bedrooms, 1) * area_per_bed * rng.uniform(0.8, 1.3))
+        psf = rng.lognormvariate(1.3, 0.35) if buy_rent == _RENT else rng.lognormvariate(7.2, 0.4)
+        price = int(area * psf / (10 if buy_rent == _RENT else 1000)) * (10 if buy_rent == _RENT else 1000)
+        if property_type == 'HDB Flat':
+            title = f"{rng.randint(1, 999)}{rng.choice(('', '', 'A', 'B'))} {rng.choice(_STREETS)} {rng.randint(1, 99)}"
+        else:
+            title = f"{rng.choice(_PROJECT_WORDS[0])} {rng.choice(_PROJECT_WORDS[1])}"
+        listing_id = 20000000 + index
+
+        data = {
+            'id': listing_id,
+            'localizedTitle': title,
+            'fullAddress': f"{rng.randint(1, 999)} {rng.choice(_STREETS)} {rng.randint(1, 99)}, {rng.randrange(10 ** 5, 83 * 10 ** 4):06d}",
+            'url': f"https://www.propertyguru.com.sg/listing/{'for-rent' if buy_rent == _RENT else 'for-sale'}-"
+                   f"{title.lower().replace(' ', '-')}-{listing_id}",
+            'price': {'pretty': f"S$ {price:,}" + (' /mo' if buy_rent == _RENT else '')},
+            'badges': [{'name': 'unit_type', 'text': property_type}],
+            'recency': {'text': rng.choice(_RECENCY).format(
+                n=rng.randint(1, 59), date=(self.now - timedelta(days=rng.randint(1, 120))).strftime('%d %b %Y'))},
+        }
+        if rng.random() > 0.03:
+            data['bedrooms'] = bedrooms
+            data['bathrooms'] = max(1, bedrooms - rng.randint(0, 1))
+        if rng.random() > 0.02:
+            data['floorArea'] = area
+            data['pricePerArea'] = {'localeStringValue': f"{psf:,.2f}"}
+        if rng.random() > 0.1:
+            minutes = rng.randint(1, 20)
+            data['mrt'] = {'nearbyText': f"{minutes} min ({minutes * rng.randint(70, 90)} m) "
+                                         f"from {rng.choice(_STATIONS)} MRT"}
+        tenure = _weighted(rng, _TENURES)[0]
+        if tenure:
+            data['badges'].append({'name': 'tenure', 'text': tenure})
+        if rng.random() < 0.6:
+            data['badges'].append({'name': 'launch', 'text': f"Built: {rng.randint(1975, 2028)}"})
+
+        # 少数代理挂大量房源
+        number = min(int(rng.paretovariate(1.2)) - 1, self.agents - 1) if rng.random() < 0.3 \
+            else rng.randrange(self.agents)
+        agent_id, name, description, profile_url = self.agent(number)[:4]
+        data['agent'] = {'id': agent_id, 'name': name, 'description': description, 'profileUrl': profile_url}
+        return data
+
+    def listing_row(self, index):
+        """第 index 条房源写库的行：(按 Listing.FIELDS 顺序的值, AgentInfo 或 None, created_at, updated_at, last_seen_at)"""
+        data = self.listing_data(index)
+        row = extract_listing(data, _RENT if '/for-rent-' in data['url'] else _SALE)
+        rng = self._rng(index, salt=2)
+        created_at = self.now - timedelta(days=rng.uniform(0, 365))
+        last_seen_at = max(created_at, self.now - timedelta(days=rng.uniform(0, 10)))
+        agent_info = None
+        updated_at = created_at
+        if rng.random() < AGENT_INFO_RATIO:
+            _, _, _, _, cea, mobile, rating = self.agent(data['agent']['id'] - 100000)
+            agent_info = AgentInfo(cea, mobile, rating)
+            # Step 2 之后的刷新时间：约 1/3 超过默认过期时间（90 天）
+            updated_at = max(created_at, self.now - timedelta(days=rng.uniform(0, 135)))
+        return row, agent_info, created_at, updated_at, last_seen_at
+
+    def spider_row(self, index, url_path, agent_info):
+        """propertyguru_spider 的行 (url_path, status, last_error, crawled_at)；没有爬过详情页时为 None"""
+        rng = self._rng(index, salt=3)
+        if agent_info is not None:
+            return url_path, '已爬取', None, self.now - timedelta(days=rng.uniform(0, 135))
+        if rng.random() < SPIDER_FAILED_RATIO / (1 - AGENT_INFO_RATIO):
+            return url_path, '失败', rng.choice(_ERRORS), self.now - timedelta(days=rng.uniform(0, 3))
+        return None
+
+    def failed_row(self, index, spider_row):
+        """与失败的爬虫记录对应的 failed_records 行"""
+        url_path, _, error, crawled_at = spider_row
+        rng = self._rng(index, salt=4)
+        retry_count = rng.randint(1, 3)
+        first_failed_at = crawled_at - timedelta(hours=rng.uniform(0, 24) * retry_count)
+        next_attempt_at = crawled_at + timedelta(minutes=rng.choice((5, 30, 120, 720)) * retry_count)
+        return url_path, error, retry_count, crawled_at, next_attempt_at, first_failed_at
+
+    def url_path(self, index):
+        return self.listing_row(index)[0][_URL_PATH_INDEX]
+
+
+_INSERT_SQL = (
+    f"INSERT OR IGNORE INTO propertyguru ({', '.join(Listing.FIELDS)}, created_at, updated_at, last_seen_at) "
+    f"VALUES ({', '.join('?' * (len(Listing.FIELDS) + 3))})"
+)
+_CEA_INDEX = Listing.FIELDS.index('CEA')
+_URL_PATH_INDEX = Listing.FIELDS.index('url_path')
+
+
+def populate(conn, start, count, generator=None, batch_size=10000):
+    """
+    向已建表的数据库（conn）追加序号 [start, start + count) 的房源，以及对应的爬虫记录和失败记录
+
+    与正常写入一样经过兼容视图（字典编码、全文索引触发器），并增量更新市场统计；每批一个事务。
+    返回写入的房源数
+    """
+    generator = generator or SyntheticListings()
+    cursor = conn.cursor()
+    written = 0
+    for batch_start in range(start, start + count, batch_size):
+        listings, spiders, failures = [], [], []
+        delta = market_stats.MarketStatsDelta()
+        for index in range(batch_start, min(batch_start + batch_size, start + count)):
+            row, agent_info, created_at, updated_at, last_seen_at = generator.listing_row(index)
+            if agent_info is not None:
+                row = row[:_CEA_INDEX] + agent_info.values() + row[_CEA_INDEX + 3:]
+            listings.append(row + (created_at, updated_at, last_seen_at))
+            delta.add(market_stats.row_stats_values(row))
+            spider = generator.spider_row(index, row[_URL_PATH_INDEX], agent_info)
+            if spider is not None:
+                spiders.append(spider)
+                if spider[1] == '失败':
+                    failures.append(generator.failed_row(index, spider))
+        cursor.executemany(_INSERT_SQL, listings)
+        cursor.executemany(
+            "INSERT OR REPLACE INTO propertyguru_spider (url_path, status, last_error, crawled_at) VALUES (?, ?, ?, ?)",
+            spiders
+        )
+        cursor.executemany('''
+            INSERT OR REPLACE INTO failed_records
+            (url_path, error_message, retry_count, last_attempt, next_attempt_at, first_failed_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', failures)
+        delta.apply(cursor, generator.now)
+        conn.commit()
+        written += len(listings)
+    return written
@@ -0,0 +1,374 @@
+"""
+分布式工作队列（基于 SQLite 的租约队列）
+
+多个 PropertyGuruPipeline 进程（同一台机器或共享同一个数据库文件的多台机器）
+通过租约机制领取 Step 1 列表页和 Step 2 详情页任务，避免重复请求：
+
+- enqueue:   生产者写入任务（已存在的任务不会重复写入）
+- claim:     原子领取一批任务，并设置租约过期时间
+- heartbeat: 续租，防止处理时间较长的任务被其他进程回收
+- ack/nack:  标记完成 / 失败（失败任务在达到最大次数前会重新进入待领取状态；
+             只修改本进程仍持有租约的任务，租约过期后被其他进程领取的任务不受影响）
+- take_failed: 取出本进程处理时达到最大次数（状态变为 failed）的任务，由调用方写入失败记录
+
+重试由队列负责：任务失败时不写 failed_records，只有最终失败的任务才交给 Step 3 / 死信表，避免重复请求。
+
+进程崩溃后，其持有的任务在租约过期后会被下一次 claim 自动回收。
+"""
+
+import os
+import socket
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from loguru import logger
+
+
+class WorkQueue:
+    """基于租约的任务队列"""
+
+    TASK_LIST = 'list'
+    TASK_DETAIL = 'detail'
+
+    STATUS_PENDING = 'pending'
+    STATUS_LEASED = 'leased'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+
+    def __init__(self, db_path, lease_seconds=300, max_attempts=3, worker_id=None):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+        self._held = set()  # 当前进程持有租约的任务
+        self._held_lock = threading.Lock()
+        self._failed = []  # 本进程标记为 failed、尚未被 take_failed 取走的任务 [(task_key, last_error), ...]
+        self._heartbeat_stop = None
+        self._heartbeat_thread = None
+
+        self.init_table()
+
+    def _connect(self):
+        # isolation_level=None: 手动控制事务，claim 使用 BEGIN IMMEDIATE 抢占写锁
+        return sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+
+    @staticmethod
+    def _rollback(conn):
+        try:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+        except sqlite3.Error:
+            pass
+
+    def init_table(self):
+        """创建任务队列表"""
+        conn = None
+        try:
+            conn = self._connect()
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS work_queue (
+                    task_key TEXT PRIMARY KEY,
+                    task_type TEXT,
+                    category TEXT,
+                    page INTEGER,
+                    status TEXT DEFAULT 'pending',
+                    priority REAL DEFAULT 0,
+                    attempts INTEGER DEFAULT 0,
+                    lease_owner TEXT,
+                    lease_expires_at TIMESTAMP,
+                    last_error TEXT,
+                    enqueued_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_work_queue_claim ON work_queue (task_type, status, priority)"
+            )
+        except Exception as e:
+            logger.error(f"任务队列表初始化失败: {str(e)}")
+        finally:
+            if conn:
+                conn.close()
+
+    def enqueue(self, tasks, reset_done=False):
+        """
+        写入任务
+
+        参数:
+        - tasks: [(task_key, task_type, category, page, priority), ...]
+        - reset_done: 是否把已完成/已失败的同名任务重新置为待领取（用于新一轮爬取）
+        """
+        if not tasks:
+            return 0
+
+        now = datetime.now()
+        rows = [(key, task_type, category, page, priority, now, now)
+                for key, task_type, category, page, priority in tasks]
+
+        if reset_done:
+            sql = '''
+                INSERT INTO work_queue (task_key, task_type, category, page, priority, enqueued_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(task_key) DO UPDATE SET
+                    status = 'pending', attempts = 0, lease_owner = NULL, lease_expires_at = NULL,
+                    priority = excluded.priority, updated_at = excluded.updated_at
+                WHERE work_queue.status IN ('done', 'failed')
+            '''
+        else:
+            sql = '''
+                INSERT OR IGNORE INTO work_queue (task_key, task_type, category, page, priority, enqueued_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            '''
+
+        conn = None
+        try:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            before = conn.total_changes
+            conn.executemany(sql, rows)
+            conn.execute("COMMIT")
+            added = conn.total_changes - before
+            logger.info(f"任务入队: {added}/{len(rows)} 条（其余已在队列中）")
+            return added
+        except Exception as e:
+            logger.error(f"任务入队失败: {str(e)}")
+            if conn:
+                self._rollback(conn)
+            return 0
+        finally:
+            if conn:
+                conn.close()
+
+    def claim(self, task_type, limit=10):
+        """原子领取一批任务（包括租约已过期的任务），返回 [(task_key, category, page), ...]"""
+        now = datetime.now()
+        expires_at = now + timedelta(seconds=self.lease_seconds)
+
+        conn = None
+        try:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            # 已达到最大尝试次数且租约过期的任务不再回收，直接标记失败
+            expired_error = '租约过期且已达最大尝试次数'
+            expired = conn.execute('''
+                SELECT task_key FROM work_queue
+                WHERE task_type = ? AND status = 'leased' AND lease_expires_at < ? AND attempts >= ?
+            ''', (task_type, now, self.max_attempts)).fetchall()
+            conn.executemany(
+                "UPDATE work_queue SET status = 'failed', last_error = ?, updated_at = ? WHERE task_key = ?",
+                [(expired_error, now, row[0]) for row in expired]
+            )
+            rows = conn.execute('''
+                SELECT task_key, category, page, status
+                FROM work_queue
+                WHERE task_type = ?
+                  AND attempts < ?
+                  AND (status = 'pending' OR (status = 'leased' AND lease_expires_at < ?))
+                ORDER BY priority DESC, enqueued_at
+                LIMIT ?
+            ''', (task_type, self.max_attempts, now, limit)).fetchall()
+
+            reclaimed = sum(1 for row in rows if row[3] == self.STATUS_LEASED)
+            conn.executemany('''
+                UPDATE work_queue
+                SET status = 'leased', lease_owner = ?, lease_expires_at = ?,
+                    attempts = attempts + 1, updated_at = ?
+                WHERE task_key = ?
+            ''', [(self.worker_id, expires_at, now, row[0]) for row in rows])
+            conn.execute("COMMIT")
+
+            if expired:
+                with self._held_lock:
+                    self._failed.extend((row[0], expired_error) for row in expired)
+            if reclaimed:
+                logger.warning(f"回收了 {reclaimed} 个租约过期的任务")
+
+            tasks = [(row[0], row[1], row[2]) for row in rows]
+            with self._held_lock:
+                self._held.update(task[0] for task in tasks)
+            return tasks
+
+        except Exception as e:
+            logger.error(f"领取任务失败: {str(e)}")
+            if conn:
+                self._rollback(conn)
+            return []
+        finally:
+            if conn:
+                conn.close()
+
+    def heartbeat(self, task_keys=None):
+        """为本进程持有的任务续租"""
+        if task_keys is None:
+            with self._held_lock:
+                task_keys = list(self._held)
+        if not task_keys:
+            return 0
+
+        now = datetime.now()
+        expires_at = now + timedelta(seconds=self.lease_seconds)
+
+        conn = None
+        try:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            before = conn.total_changes
+            conn.executemany('''
+                UPDATE work_queue
+                SET lease_expires_at = ?, updated_at = ?
+                WHERE task_key = ? AND lease_owner = ? AND status = 'leased'
+            ''', [(expires_at, now, key, self.worker_id) for key in task_keys])
+            conn.execute("COMMIT")
+            renewed = conn.total_changes - before
+            logger.debug(f"续租 {renewed}/{len(task_keys)} 个任务")
+            return renewed
+        except Exception as e:
+            logger.error(f"任务续租失败: {str(e)}")
+            if conn:
+                self._rollback(conn)
+            return 0
+        finally:
+            if conn:
+                conn.close()
+
+    def ack(self, task_keys):
+        """
+        标记本进程持有的任务完成
+
+        租约已过期并被其他进程重新领取的任务不会被修改（由新的持有者完成），返回实际标记完成的任务数
+        """
+        if not task_keys:
+            return 0
+        now = datetime.now()
+        acked, _ = self._finish('''
+            UPDATE work_queue
+            SET status = 'done', lease_owner = NULL, lease_expires_at = NULL, last_error = NULL, updated_at = ?
+            WHERE task_key = ? AND lease_owner = ? AND status = 'leased'
+        ''', [(now, key, self.worker_id) for key in task_keys], task_keys)
+        if acked < len(task_keys):
+            logger.warning(f"⚠️ {len(task_keys) - acked}/{len(task_keys)} 个任务的租约已失效，未标记完成")
+        return acked
+
+    def nack(self, task_key, error_msg=None):
+        """
+        标记本进程持有的任务失败；未达到最大次数的任务重新进入待领取状态
+
+        返回任务是否已达到最大次数（状态变为 failed，同时加入 take_failed 的结果）；
+        租约已失效时不修改任务状态，返回 False
+        """
+        now = datetime.now()
+        changed, status = self._finish('''
+            UPDATE work_queue
+            SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                lease_owner = NULL, lease_expires_at = NULL, last_error = ?, updated_at = ?
+            WHERE task_key = ? AND lease_owner = ? AND status = 'leased'
+        ''', [(self.max_attempts, error_msg, now, task_key, self.worker_id)], [task_key],
+            status_of=task_key)
+        if not changed:
+            logger.warning(f"⚠️ 任务租约已失效，未标记失败: {task_key}")
+            return False
+        if status != self.STATUS_FAILED:
+            return False
+        with self._held_lock:
+            self._failed.append((task_key, error_msg))
+        return True
+
+    def take_failed(self):
+        """取出（并清空）本进程标记为 failed 的任务 [(task_key, last_error), ...]"""
+        with self._held_lock:
+            failed, self._failed = self._failed, []
+        return failed
+
+    def _finish(self, sql, params, task_keys, status_of=None):
+        """
+        在一个事务中更新任务状态
+
+        返回 (更新的行数, status_of 任务更新后的状态)；status_of 为 None 时状态为 None
+        """
+        conn = None
+        status = None
+        try:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            before = conn.total_changes
+            conn.executemany(sql, params)
+            changed = conn.total_changes - before
+            if status_of is not None:
+                row = conn.execute("SELECT status FROM work_queue WHERE task_key = ?", (status_of,)).fetchone()
+                status = row[0] if row else None
+            conn.execute("COMMIT")
+            return changed, status
+        except Exception as e:
+            logger.error(f"更新任务状态失败: {str(e)}")
+            if conn:
+                self._rollback(conn)
+            return 0, None
+        finally:
+            if conn:
+                conn.close()
+            with self._held_lock:
+                self._held.difference_update(task_keys)
+
+    def has_unfinished(self, task_type):
+        """是否还有待领取或被其他进程持有的任务"""
+        conn = None
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT COUNT(*) FROM work_queue WHERE task_type = ? AND status IN ('pending', 'leased')",
+                (task_type,)
+            ).fetchone()
+            return row[0] > 0
+        except Exception as e:
+            logger.error(f"查询任务队列失败: {str(e)}")
+            return False
+        finally:
+            if conn:
+                conn.close()
+
+    def stats(self):
+        """按任务类型和状态统计任务数"""
+        conn = None
+        try:
+            conn = self._connect()
+            rows = conn.execute(
+                "SELECT task_type, status, COUNT(*) FROM work_queue GROUP BY task_type, status"
+            ).fetchall()
+            stats = {}
+            for task_type, status, count in rows:
+                stats.setdefault(task_type, {})[status] = count
+            return stats
+        except Exception as e:
+            logger.error(f"统计任务队列失败: {str(e)}")
+            return {}
+        finally:
+            if conn:
+                conn.close()
+
+    # ==================== 心跳线程 ====================
+
+    def start_heartbeat(self):
+        """启动后台续租线程（间隔为租约时长的 1/3）"""
+        if self._heartbeat_thread and self._heartbeat_thread.is_alive():
+            return
+
+        self._heartbeat_stop = threading.Event()
+        interval = max(1, self.lease_seconds / 3)
+
+        def _loop():
+            while not self._heartbeat_stop.wait(interval):
+                self.heartbeat()
+
+        self._heartbeat_thread = threading.Thread(target=_loop, name="work-queue-heartbeat", daemon=True)
+        self._heartbeat_thread.start()
+
+    def stop_heartbeat(self):
+        """停止后台续租线程"""
+        if self._heartbeat_stop:
+            self._heartbeat_stop.set()
+        if self._heartbeat_thread:
+            self._heartbeat_thread.join(timeout=5)
+        self._heartbeat_thread = None